@@ -0,0 +1,222 @@
+# backend/adapter_pool.py
+"""
+One resident roberta-base serving several named LoRA adapters.
+
+Adapters are loaded onto a single PeftModel, activated per request group and
+evicted least-recently-used once more than `max_adapters` are resident. Each
+adapter carries its own classifier head (a PEFT `modules_to_save` copy), so
+another fine-tuned variant costs a few MB rather than a second base model.
+While exactly one adapter is resident it is merged into the base weights, so
+the common single-variant case keeps merged-inference latency.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import torch
+from peft import PeftModel
+from transformers import AutoModelForSequenceClassification
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ADAPTERS = 4
+
+
+def adapter_name_for(path: Path, root: Path) -> str:
+    """Stable adapter name for a directory: its path under `root`, as a valid module key."""
+    path = Path(path).resolve()
+    try:
+        rel = path.relative_to(Path(root).resolve()).as_posix()
+    except ValueError:
+        rel = path.as_posix().strip("/")
+    return re.sub(r"[^A-Za-z0-9_-]+", "__", rel)
+
+
+@dataclass
+class AdapterEntry:
+    name: str
+    path: Path
+    # pipeline_config.json of the adapter (max_length, classification_threshold), if saved.
+    config: Dict[str, Any]
+    loaded_at: float
+    # Changes when the adapter files are rewritten on disk (latest mtime).
+    version: str = ""
+    uses: int = 0
+    # Per-adapter models built from the shared one (e.g. int8 copies); dropped on eviction.
+    derived: Dict[str, torch.nn.Module] = field(default_factory=dict)
+
+
+class AdapterPool:
+    """
+    Named LoRA adapters on one shared base model. All access to the shared
+    model goes through `use()`, which holds the pool lock while the adapter
+    is active, so concurrent requests for different adapters cannot switch
+    it mid-forward.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        device: torch.device,
+        root: Path,
+        resolver: Callable[[str], Path],
+        max_adapters: int = DEFAULT_MAX_ADAPTERS,
+        config_name: str = "pipeline_config.json",
+        merge_single: bool = True,
+    ) -> None:
+        self.model_name = model_name
+        self.device = device
+        self.root = Path(root)
+        self.resolver = resolver
+        self.max_adapters = max(1, max_adapters)
+        self.config_name = config_name
+        self.merge_single = merge_single
+        self.model: Optional[PeftModel] = None
+        self._entries: "OrderedDict[str, AdapterEntry]" = OrderedDict()
+        # Every adapter ever registered, so evicted ones reload by name.
+        self._known: Dict[str, Path] = {}
+        self._active: Optional[str] = None
+        self._merged = False
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+        self.switches = 0
+
+    def register(self, path: Path, name: Optional[str] = None) -> str:
+        """Make `path` loadable under `name` (default: derived from its path) without loading it."""
+        path = Path(path).resolve()
+        name = name or adapter_name_for(path, self.root)
+        with self._lock:
+            self._known[name] = path
+        return name
+
+    def resolve_name(self, ref: str) -> str:
+        """Name of a registered adapter, or register `ref` as a checkpoint reference."""
+        with self._lock:
+            if ref in self._known:
+                return ref
+        return self.register(self.resolver(ref))
+
+    def _unmerge(self) -> None:
+        if self._merged and self.model is not None:
+            self.model.unmerge_adapter()
+            self._merged = False
+
+    def _load(self, name: str) -> AdapterEntry:
+        path = self._known[name]
+        self._unmerge()
+        start = time.perf_counter()
+        if self.model is None:
+            base = AutoModelForSequenceClassification.from_pretrained(self.model_name, num_labels=2)
+            self.model = PeftModel.from_pretrained(base, str(path), adapter_name=name).to(self.device)
+        else:
+            self.model.load_adapter(str(path), adapter_name=name)
+            self.model.to(self.device)
+        self.model.eval()
+        config_path = path / self.config_name
+        config = json.loads(config_path.read_text()) if config_path.exists() else {}
+        version = str(max((p.stat().st_mtime_ns for p in path.iterdir() if p.is_file()), default=0))
+        entry = AdapterEntry(name=name, path=path, config=config, loaded_at=time.time(), version=version)
+        self._entries[name] = entry
+        self.loads += 1
+        logger.info("Loaded adapter %s from %s in %.2fs", name, path, time.perf_counter() - start)
+        return entry
+
+    def _evict(self, keep: str) -> None:
+        while len(self._entries) > self.max_adapters:
+            victim = next(name for name in self._entries if name != keep)
+            self._unmerge()
+            self.model.delete_adapter(victim)
+            del self._entries[victim]
+            self.evictions += 1
+            logger.info("Evicted adapter %s (LRU)", victim)
+
+    def _activate(self, name: str) -> AdapterEntry:
+        entry = self._entries.get(name)
+        if entry is None:
+            entry = self._load(name)
+        self._entries.move_to_end(name)
+        if self._active != name:
+            self._unmerge()
+            self.model.set_adapter(name)
+            self._active = name
+            self.switches += 1
+        self._evict(keep=name)
+        if self.merge_single and len(self._entries) == 1 and not self._merged:
+            self.model.merge_adapter()
+            self._merged = True
+        entry.uses += 1
+        return entry
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[AdapterEntry]:
+        """Activate `name` (loading/evicting as needed); the shared model is `pool.model` inside."""
+        with self._lock:
+            yield self._activate(name)
+
+    def _plain_copy(self) -> torch.nn.Module:
+        # Copy the unmerged model so the shared base weights stay untouched.
+        self._unmerge()
+        return copy.deepcopy(self.model).merge_and_unload()
+
+    def merged_copy(self, name: str) -> torch.nn.Module:
+        """A standalone plain model with `name` merged in (for export or quantization)."""
+        with self._lock:
+            self._activate(name)
+            return self._plain_copy()
+
+    def derived(self, name: str, key: str, build: Callable[[torch.nn.Module], torch.nn.Module]) -> torch.nn.Module:
+        """`build(merged_copy(name))`, cached with the adapter until it is evicted."""
+        with self._lock:
+            entry = self._activate(name)
+            if key not in entry.derived:
+                entry.derived[key] = build(self._plain_copy())
+            return entry.derived[key]
+
+    def release(self) -> None:
+        """Drop the base model and every resident adapter; registrations are kept, so names reload."""
+        with self._lock:
+            self.model = None
+            self._entries.clear()
+            self._active = None
+            self._merged = False
+
+    def entry(self, name: str) -> Optional[AdapterEntry]:
+        with self._lock:
+            return self._entries.get(name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            resident: List[Dict[str, Any]] = [
+                {
+                    "name": entry.name,
+                    "path": str(entry.path),
+                    "uses": entry.uses,
+                    "derived": sorted(entry.derived),
+                    **entry.config,
+                }
+                for entry in reversed(self._entries.values())
+            ]
+            return {
+                "base_model": self.model_name,
+                "base_loaded": self.model is not None,
+                "max_adapters": self.max_adapters,
+                "active": self._active,
+                "merged": self._merged,
+                "resident": resident,
+                "known": sorted(self._known),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "switches": self.switches,
+            }
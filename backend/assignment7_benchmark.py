@@ -0,0 +1,245 @@
+# backend/assignment7_benchmark.py
+"""
+CPU benchmarks for the Assignment 7 classifier.
+
+--mode merge: LoRA served through the PEFT wrapper vs. with the adapter merged
+into the base RoBERTa weights. Checks the logits match, then reports per-batch
+latency.
+
+--mode int8: the merged fp32 model vs. its dynamic int8 quantization on the
+cached SetFit/subj test split. Reports accuracy/F1, agreement between the two,
+latency and model size.
+
+Run (from backend/):
+    python assignment7_benchmark.py
+    python assignment7_benchmark.py --checkpoint checkpoint-20 --batch-size 16 --batches 20
+    python assignment7_benchmark.py --mode int8 --max-samples 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import io
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from peft import PeftModel
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+from transformers import AutoModelForSequenceClassification
+
+from assignment7_roberta import DEFAULT_MAX_LENGTH, DEFAULT_MODEL_NAME, SUBJ_TEST_PATH, quantize_dynamic_int8
+from assignment8_evaluation import Assignment8Evaluator
+
+RESULTS_DIR = Path(__file__).resolve().parent / "outputs" / "assignment7_benchmark"
+
+
+def load_texts(limit: int) -> List[str]:
+    texts: List[str] = []
+    with open(SUBJ_TEST_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                texts.append(json.loads(line)["text"])
+            if len(texts) >= limit:
+                break
+    return texts
+
+
+def _time_batches(model: torch.nn.Module, batches: List[Dict[str, torch.Tensor]]) -> List[float]:
+    timings: List[float] = []
+    with torch.inference_mode():
+        for batch in batches:
+            start = time.perf_counter()
+            model(**batch)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _logits(model: torch.nn.Module, batches: List[Dict[str, torch.Tensor]]) -> torch.Tensor:
+    with torch.inference_mode():
+        return torch.cat([model(**batch).logits for batch in batches])
+
+
+def _summary(ms: List[float]) -> Dict[str, float]:
+    arr = np.asarray(ms)
+    return {
+        "p50": float(np.percentile(arr, 50)),
+        "p90": float(np.percentile(arr, 90)),
+        "mean": float(arr.mean()),
+    }
+
+
+def run_benchmark(
+    checkpoint: Optional[str] = None,
+    batch_size: int = 32,
+    num_batches: int = 10,
+    warmup: int = 2,
+    num_threads: Optional[int] = None,
+) -> Dict[str, Any]:
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    # Same checkpoint selection as the Assignment 8 evaluator (best eval_f1).
+    evaluator = Assignment8Evaluator()
+    checkpoint_path = evaluator._resolve_checkpoint(checkpoint)
+    tokenizer = evaluator.tokenizer
+    base = AutoModelForSequenceClassification.from_pretrained(DEFAULT_MODEL_NAME, num_labels=2)
+    model = PeftModel.from_pretrained(base, str(checkpoint_path))
+    model.eval()
+
+    texts = load_texts(batch_size * (num_batches + warmup))
+    batches = [
+        tokenizer(
+            texts[i : i + batch_size],
+            truncation=True,
+            padding=True,
+            max_length=DEFAULT_MAX_LENGTH,
+            return_tensors="pt",
+        )
+        for i in range(0, len(texts), batch_size)
+    ]
+    warm, timed = batches[:warmup], batches[warmup:]
+
+    _time_batches(model, warm)
+    unmerged_ms = _time_batches(model, timed)
+    unmerged_logits = _logits(model, timed)
+
+    model.merge_adapter()
+    _time_batches(model, warm)
+    merged_ms = _time_batches(model, timed)
+    merged_logits = _logits(model, timed)
+
+    # The adapter is still attached: unmerging must restore the original outputs.
+    model.unmerge_adapter()
+    restored_logits = _logits(model, timed)
+
+    unmerged = _summary(unmerged_ms)
+    merged = _summary(merged_ms)
+    return {
+        "checkpoint": str(checkpoint_path),
+        "batch_size": batch_size,
+        "batches": len(timed),
+        "torch_threads": torch.get_num_threads(),
+        "unmerged_ms": unmerged,
+        "merged_ms": merged,
+        "speedup_p50": unmerged["p50"] / merged["p50"] if merged["p50"] else 0.0,
+        "max_abs_logit_diff": float((merged_logits - unmerged_logits).abs().max()),
+        "logits_match": bool(torch.allclose(merged_logits, unmerged_logits, atol=1e-4)),
+        "same_predictions": bool(torch.equal(merged_logits.argmax(-1), unmerged_logits.argmax(-1))),
+        "unmerge_restores": bool(torch.allclose(restored_logits, unmerged_logits, atol=1e-5)),
+    }
+
+
+def _state_dict_mb(model: torch.nn.Module) -> float:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def quantization_benchmark(
+    checkpoint: Optional[str] = None,
+    batch_size: int = 32,
+    max_samples: Optional[int] = None,
+    max_length: int = DEFAULT_MAX_LENGTH,
+    num_threads: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Accuracy/F1 and latency of the merged fp32 model vs. dynamic int8 on the test split."""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    evaluator = Assignment8Evaluator()
+    checkpoint_path = evaluator._resolve_checkpoint(checkpoint)
+    base = AutoModelForSequenceClassification.from_pretrained(DEFAULT_MODEL_NAME, num_labels=2)
+    fp32_model = PeftModel.from_pretrained(base, str(checkpoint_path)).merge_and_unload().eval()
+    int8_model = quantize_dynamic_int8(copy.deepcopy(fp32_model))
+    test_dataset, dataset_meta = evaluator._load_test_dataset(None, seed=42, max_samples=max_samples)
+    cpu = torch.device("cpu")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    predictions: Dict[str, np.ndarray] = {}
+    for name, model in (("fp32", fp32_model), ("int8", int8_model)):
+        start = time.perf_counter()
+        preds, _, labels = evaluator._batch_predict(model, test_dataset, max_length, batch_size=batch_size, device=cpu)
+        elapsed = time.perf_counter() - start
+        _, _, f1_macro, _ = precision_recall_fscore_support(labels, preds, average="macro", zero_division=0)
+        predictions[name] = preds
+        results[name] = {
+            "accuracy": float(accuracy_score(labels, preds)),
+            "f1_macro": float(f1_macro),
+            "seconds": round(elapsed, 2),
+            "ms_per_batch": round(1000 * elapsed / max(1, -(-len(labels) // batch_size)), 1),
+            "model_mb": round(_state_dict_mb(model), 1),
+        }
+
+    return {
+        "checkpoint": str(checkpoint_path),
+        "dataset": dataset_meta,
+        "batch_size": batch_size,
+        "torch_threads": torch.get_num_threads(),
+        "fp32": results["fp32"],
+        "int8": results["int8"],
+        "accuracy_delta": results["int8"]["accuracy"] - results["fp32"]["accuracy"],
+        "f1_macro_delta": results["int8"]["f1_macro"] - results["fp32"]["f1_macro"],
+        "prediction_agreement": float((predictions["int8"] == predictions["fp32"]).mean()),
+        "speedup": results["fp32"]["seconds"] / results["int8"]["seconds"] if results["int8"]["seconds"] else 0.0,
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Assignment 7 classifier CPU benchmarks (merge / int8).")
+    parser.add_argument("--mode", choices=["merge", "int8"], default="merge")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint dir name (default: best by eval_f1).")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--batches", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads.")
+    parser.add_argument("--max-samples", type=int, default=None, help="int8 mode: cap on test rows.")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    if args.mode == "int8":
+        report = quantization_benchmark(
+            checkpoint=args.checkpoint,
+            batch_size=args.batch_size,
+            max_samples=args.max_samples,
+            num_threads=args.threads,
+        )
+    else:
+        report = run_benchmark(
+            checkpoint=args.checkpoint,
+            batch_size=args.batch_size,
+            num_batches=args.batches,
+            num_threads=args.threads,
+        )
+    report["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    output = args.output or str(RESULTS_DIR / f"{args.mode}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if args.mode == "int8":
+        for name in ("fp32", "int8"):
+            r = report[name]
+            print(
+                f"{name}: accuracy {r['accuracy']:.4f}  f1_macro {r['f1_macro']:.4f}  "
+                f"{r['ms_per_batch']:.1f} ms/batch  {r['model_mb']:.0f} MB"
+            )
+        print(
+            f"delta accuracy {report['accuracy_delta']:+.4f}  f1 {report['f1_macro_delta']:+.4f}  "
+            f"agreement {report['prediction_agreement']:.2%}  speedup {report['speedup']:.2f}x"
+        )
+        print(f"Report written to {output}")
+        return
+
+    print(f"checkpoint {report['checkpoint']}  batch {report['batch_size']} x {report['batches']}")
+    print(f"unmerged p50 {report['unmerged_ms']['p50']:.1f} ms  merged p50 {report['merged_ms']['p50']:.1f} ms")
+    print(f"speedup {report['speedup_p50']:.2f}x  max |dlogit| {report['max_abs_logit_diff']:.2e}")
+    print(f"logits match {report['logits_match']}  unmerge restores {report['unmerge_restores']}")
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# backend/assignment7_export.py
+"""
+Export the Assignment 7 classifier as an inference-only artifact.
+
+The LoRA adapter is merged into roberta-base and the plain model is written
+as TorchScript (traced, frozen) or ONNX. The artifact also holds the tokenizer
+and a classifier_config.json with the threshold and max_length.
+`assignment7_serving.ExportedClassifier` serves it without peft or datasets.
+
+Run (from backend/):
+    python assignment7_export.py                                  # best checkpoint -> TorchScript
+    python assignment7_export.py --checkpoint checkpoint-20 --format onnx
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+
+from assignment7_roberta import DEFAULT_CLASSIFICATION_THRESHOLD, DEFAULT_MAX_LENGTH, DEFAULT_MODEL_NAME
+from assignment7_serving import CONFIG_NAME, EXPORT_FORMATS, LABELS, ExportedClassifier, missing_dependencies
+
+EXPORT_DIR = Path(__file__).resolve().parent / "outputs" / "assignment7_export"
+CHECK_TEXTS = [
+    "The unemployment rate fell to 3.5% in the latest report.",
+    "In my opinion, the movie was boring and predictable, and far too long for what it tried to say.",
+    "Critics argue the budget is unfair.",
+]
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Tensor-in, tensor-out wrapper so tracing/ONNX see a plain signature."""
+
+    def __init__(self, model: torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+
+
+def _eager_probs(model: torch.nn.Module, tokenizer: Any, texts: List[str], max_length: int) -> np.ndarray:
+    batch = tokenizer(texts, truncation=True, padding=True, max_length=max_length, return_tensors="pt")
+    with torch.inference_mode():
+        logits = model(**batch).logits
+    return torch.softmax(logits.float(), dim=-1).numpy()
+
+
+def export_classifier(
+    model: torch.nn.Module,
+    tokenizer: Any,
+    output_dir: Path,
+    classification_threshold: float = DEFAULT_CLASSIFICATION_THRESHOLD,
+    max_length: int = DEFAULT_MAX_LENGTH,
+    fmt: str = "torchscript",
+    source: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Write `model` (an already merged, plain sequence-classification model)
+    as an artifact under `output_dir`, then reload it with the serving
+    loader and check its probabilities against eager PyTorch.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt} (expected one of {EXPORT_FORMATS})")
+    missing = missing_dependencies(fmt)
+    if missing:
+        # Checked up front: otherwise the artifact is written and only the self-check fails.
+        raise ValueError(f"{fmt} export needs {', '.join(missing)} (see requirements.txt).")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    model = model.to("cpu").float().eval()
+    wrapper = _LogitsOnly(model).eval()
+
+    example = tokenizer(CHECK_TEXTS[:2], padding=True, return_tensors="pt")
+    inputs = (example["input_ids"], example["attention_mask"])
+    if fmt == "torchscript":
+        model_file = "model.pt"
+        with torch.inference_mode():
+            traced = torch.jit.trace(wrapper, inputs, strict=False, check_trace=False)
+        traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+        torch.jit.save(traced, str(output_dir / model_file))
+    else:
+        model_file = "model.onnx"
+        torch.onnx.export(
+            wrapper,
+            inputs,
+            str(output_dir / model_file),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=17,
+        )
+
+    tokenizer.save_pretrained(str(output_dir))
+    config: Dict[str, Any] = {
+        "format": fmt,
+        "model_file": model_file,
+        "base_model": DEFAULT_MODEL_NAME,
+        "labels": LABELS,
+        "max_length": max_length,
+        "classification_threshold": classification_threshold,
+        "pad_token_id": tokenizer.pad_token_id,
+        "source": source,
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    (output_dir / CONFIG_NAME).write_text(json.dumps(config, indent=2))
+
+    # Different batch shapes than the trace example, to catch shape specialization.
+    exported = ExportedClassifier(output_dir)
+    expected = _eager_probs(model, tokenizer, CHECK_TEXTS, max_length)
+    actual = exported.predict_probs(CHECK_TEXTS)
+    config["export_check"] = {
+        "texts": len(CHECK_TEXTS),
+        "max_abs_prob_diff": float(np.abs(expected - actual).max()),
+    }
+    (output_dir / CONFIG_NAME).write_text(json.dumps(config, indent=2))
+    return {**config, "artifact_dir": str(output_dir)}
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Export an Assignment 7 adapter checkpoint for CPU serving.")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint dir name (default: best by eval_f1).")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="torchscript")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_CLASSIFICATION_THRESHOLD)
+    parser.add_argument("--max-length", type=int, default=DEFAULT_MAX_LENGTH)
+    parser.add_argument("--output", default=None, help="Artifact directory (default: outputs/assignment7_export/).")
+    args = parser.parse_args(argv)
+
+    from peft import PeftModel
+    from transformers import AutoModelForSequenceClassification
+
+    from assignment8_evaluation import Assignment8Evaluator
+
+    evaluator = Assignment8Evaluator()
+    checkpoint_path = evaluator._resolve_checkpoint(args.checkpoint)
+    base = AutoModelForSequenceClassification.from_pretrained(DEFAULT_MODEL_NAME, num_labels=2)
+    merged = PeftModel.from_pretrained(base, str(checkpoint_path)).merge_and_unload()
+
+    output = Path(args.output) if args.output else EXPORT_DIR / f"{args.format}-{time.strftime('%Y%m%d-%H%M%S')}"
+    report = export_classifier(
+        merged,
+        evaluator.tokenizer,
+        output,
+        classification_threshold=args.threshold,
+        max_length=args.max_length,
+        fmt=args.format,
+        source=str(checkpoint_path),
+    )
+    print(f"Exported {report['source']} as {report['format']} to {report['artifact_dir']}")
+    print(f"max |dprob| vs eager: {report['export_check']['max_abs_prob_diff']:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,38 @@
 from __future__ import annotations
 
+import copy
+import hashlib
+import json
 import logging
-from dataclasses import dataclass, asdict
+import math
+import os
+import resource
+import shutil
+import sys
+import threading
+import time
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
-from datasets import ClassLabel, Dataset, DatasetDict, concatenate_datasets, load_dataset
+from datasets import Dataset, DatasetDict, concatenate_datasets, load_dataset, load_from_disk
 from peft import LoraConfig, get_peft_model
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support
 from transformers import (
     AutoModelForSequenceClassification,
     AutoTokenizer,
     DataCollatorWithPadding,
-    Trainer,
+    TrainerCallback,
     TrainingArguments,
 )
 
+from adapter_pool import DEFAULT_MAX_ADAPTERS, AdapterPool
+from checkpointing import DEFAULT_KEEP_BEST_CHECKPOINTS, CheckpointRetentionCallback, CheckpointTrainer
+from dataset_prep import class_distribution, label_array, normalize_columns, stratified_indices
+from prediction_cache import DEFAULT_MAX_ENTRIES, PredictionCache
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
@@ -28,6 +43,34 @@ DEFAULT_DATASET_NAME = "SetFit/subj"
 DEFAULT_CLASSIFICATION_THRESHOLD = 0.5
 SUBJ_TRAIN_PATH = Path(__file__).parent / "data" / "assignment7" / "setfit_subj_train.jsonl"
 SUBJ_TEST_PATH = Path(__file__).parent / "data" / "assignment7" / "setfit_subj_test.jsonl"
+DEFAULT_OUTPUT_DIR = Path("outputs") / "assignment7_roberta"
+BACKEND_DIR = Path(__file__).resolve().parent
+CHECKPOINTS_ROOT = BACKEND_DIR / "outputs" / "assignment7_roberta"
+ADAPTER_WEIGHT_FILES = ("adapter_model.safetensors", "adapter_model.bin")
+# Adapter served by the API: a checkpoint name under CHECKPOINTS_ROOT or a path.
+# Empty means the best checkpoint by eval_f1.
+DEFAULT_ADAPTER = os.environ.get("ASSIGNMENT7_ADAPTER", "")
+# Adapters kept resident on the shared base model before LRU eviction.
+MAX_RESIDENT_ADAPTERS = int(os.environ.get("ASSIGNMENT7_MAX_ADAPTERS", str(DEFAULT_MAX_ADAPTERS)))
+# Cached predictions (class probabilities) per pipeline; 0 disables the cache.
+PREDICTION_CACHE_SIZE = int(os.environ.get("ASSIGNMENT7_PREDICTION_CACHE", str(DEFAULT_MAX_ENTRIES)))
+PIPELINE_CONFIG_NAME = "pipeline_config.json"
+# Hub downloads are opt-in: offline hosts otherwise wait on network timeouts
+# before every run. Local datasets below are always tried first.
+ALLOW_HUB_DATASETS = os.environ.get("ASSIGNMENT7_ALLOW_HUB", "0") == "1"
+LOCAL_DATASETS: Dict[str, Dict[str, Path]] = {
+    DEFAULT_DATASET_NAME: {"train": SUBJ_TRAIN_PATH, "test": SUBJ_TEST_PATH},
+    "news_fact_opinion": {"train": DATA_PATH},
+}
+BUNDLED_DATASET_NAME = "news_fact_opinion"
+# Inference precision: fp32, or int8 dynamic quantization of the merged model's
+# Linear layers (CPU only). Selectable per request; this is the default.
+INFERENCE_PRECISIONS = ("fp32", "int8")
+DEFAULT_INFERENCE_PRECISION = os.environ.get("ASSIGNMENT7_PRECISION", "fp32")
+# Tokenized splits saved as Arrow, keyed by source/split/tokenizer settings.
+TOKENIZED_CACHE_DIR = Path(__file__).resolve().parent / "outputs" / "assignment7_roberta" / "tokenized"
+# Bump when the split or tokenization logic changes to invalidate old entries.
+TOKENIZED_CACHE_VERSION = 2
 
 
 def _get_device() -> torch.device:
@@ -38,130 +81,141 @@ def _get_device() -> torch.device:
     return torch.device("cpu")
 
 
-def _normalize_columns(dataset: Dataset) -> Dataset:
-    """Ensure the dataset has `text` and `label` columns with binary labels."""
-    text_col = None
-    for candidate in ["text", "sentence", "statement", "claim", "content"]:
-        if candidate in dataset.column_names:
-            text_col = candidate
-            break
-    if text_col is None:
-        raise ValueError(f"No text column found in dataset columns: {dataset.column_names}")
-
-    label_col = None
-    for candidate in ["label", "labels", "target", "class"]:
-        if candidate in dataset.column_names:
-            label_col = candidate
-            break
-    if label_col is None:
-        raise ValueError(f"No label column found in dataset columns: {dataset.column_names}")
-
-    ds = dataset.rename_columns({text_col: "text", label_col: "label"})
-
-    def _cast_label(example: Dict[str, Any]) -> Dict[str, Any]:
-        label = example["label"]
-        if isinstance(label, bool):
-            value = int(label)
-        elif isinstance(label, (int, np.integer)):
-            value = int(label)
-        elif isinstance(label, str):
-            lowered = label.lower()
-            if lowered in {"factual", "fact", "objective"}:
-                value = 0
-            elif lowered in {"opinion", "subjective"}:
-                value = 1
-            else:
-                raise ValueError(f"Unrecognized label string: {label}")
+@dataclass
+class DatasetSource:
+    """Where a dataset name resolves to: local json files or a hub dataset."""
+
+    name: str
+    kind: str  # "local" | "hub"
+    files: Dict[str, str] = field(default_factory=dict)
+    notes: List[str] = field(default_factory=list)
+
+
+_resolved_sources: Dict[Tuple[str, bool], DatasetSource] = {}
+_resolved_sources_lock = threading.Lock()
+
+
+def _local_source(name: str, files: Dict[str, Path], notes: List[str]) -> Optional[DatasetSource]:
+    existing = {split: str(path) for split, path in files.items() if path.exists()}
+    if "train" not in existing and "test" not in existing:
+        return None
+    return DatasetSource(name=name, kind="local", files=existing, notes=notes)
+
+
+def _bundled_source(reason: str) -> DatasetSource:
+    return DatasetSource(
+        name=BUNDLED_DATASET_NAME,
+        kind="local",
+        files={"train": str(DATA_PATH)},
+        notes=[f"Using bundled {DATA_PATH.name}: {reason}"],
+    )
+
+
+def resolve_dataset_source(dataset_name: Optional[str], allow_hub: Optional[bool] = None) -> DatasetSource:
+    """
+    Resolve a dataset name without touching the network unless allowed:
+    registered local datasets (LOCAL_DATASETS) and paths to jsonl files first,
+    then the hub if `allow_hub` (default ASSIGNMENT7_ALLOW_HUB), otherwise the
+    bundled sample. Results are cached for the life of the process.
+    """
+    name = dataset_name or DEFAULT_DATASET_NAME
+    allow_hub = ALLOW_HUB_DATASETS if allow_hub is None else allow_hub
+    key = (name, allow_hub)
+    with _resolved_sources_lock:
+        cached = _resolved_sources.get(key)
+    if cached is not None:
+        return cached
+
+    source: Optional[DatasetSource] = None
+    if name in LOCAL_DATASETS:
+        source = _local_source(name, LOCAL_DATASETS[name], [f"Loaded {name} from local files"])
+    elif Path(name).suffix in {".json", ".jsonl"} and Path(name).exists():
+        source = DatasetSource(name=name, kind="local", files={"train": name}, notes=[f"Loaded local file {name}"])
+    if source is None:
+        if allow_hub:
+            source = DatasetSource(name=name, kind="hub", notes=[f"Loaded dataset from hub: {name}"])
         else:
-            raise ValueError(f"Unsupported label type: {type(label)}")
+            source = _bundled_source(f"{name} is not available locally and hub access is disabled")
+
+    with _resolved_sources_lock:
+        _resolved_sources[key] = source
+    return source
+
+
+def _mark_hub_unavailable(source: DatasetSource, exc: Exception) -> DatasetSource:
+    """Re-point every cached resolution of a failed hub dataset at the bundled sample."""
+    fallback = _bundled_source(f"hub load of {source.name} failed ({exc})")
+    with _resolved_sources_lock:
+        for key, cached in list(_resolved_sources.items()):
+            if cached is source:
+                _resolved_sources[key] = fallback
+    return fallback
 
-        label_text = "opinion" if value == 1 else "factual"
-        return {"label": value, "label_text": label_text}
 
-    ds = ds.map(_cast_label)
-    # Stratified splits require a ClassLabel column; cast after normalization.
-    class_label = ClassLabel(names=["factual", "opinion"])
-    ds = ds.cast_column("label", class_label)
-    return ds
+def load_dataset_source(
+    source: DatasetSource, split: Optional[str] = None
+) -> Tuple[Union[Dataset, DatasetDict], DatasetSource]:
+    """
+    Load a resolved source (one split, or all splits as a DatasetDict) and
+    return it with the source actually used: a failing hub load falls back to
+    the bundled sample, and that fallback is remembered.
+    """
+    if source.kind == "hub":
+        try:
+            logger.info("Loading dataset from hub: %s", source.name)
+            return load_dataset(source.name, split=split), source
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to load %s from hub, using bundled sample: %s", source.name, exc)
+            source = _mark_hub_unavailable(source, exc)
+
+    files = source.files
+    if split is not None:
+        # Single-split sources (e.g. the bundled sample) serve every split.
+        path = files.get(split) or files.get("train") or next(iter(files.values()))
+        return load_dataset("json", data_files={split: path})[split], source
+    return load_dataset("json", data_files=dict(files)), source
 
 
 def _load_news_dataset(
     dataset_name: Optional[str],
     seed: int,
     max_samples: int,
-) -> Tuple[DatasetDict, Dict[str, Any]]:
+) -> Tuple[DatasetDict, Dict[str, Any], DatasetSource]:
     """
-    Load a factual vs opinion dataset. Defaults to the HF hub SetFit/subj dataset,
-    falling back to the bundled jsonl sample if download fails.
+    Load a factual vs opinion dataset via `resolve_dataset_source` (local files
+    first; the hub only when enabled), falling back to the bundled jsonl sample.
+    Also returns the source actually loaded (the fallback, if the hub failed).
     """
-    notes: List[str] = []
-    target_dataset = dataset_name or DEFAULT_DATASET_NAME
-
-    def _load_local_subj() -> DatasetDict:
-        files = {}
-        if SUBJ_TRAIN_PATH.exists():
-            files["train"] = str(SUBJ_TRAIN_PATH)
-        if SUBJ_TEST_PATH.exists():
-            files["test"] = str(SUBJ_TEST_PATH)
-        if not files:
-            raise FileNotFoundError("No local SetFit/subj cache found.")
-        return load_dataset("json", data_files=files)
-
-    try:
-        logger.info("Loading dataset from hub: %s", target_dataset)
-        raw = load_dataset(target_dataset)
-        notes.append(f"Loaded dataset from hub: {target_dataset}")
-    except Exception as exc:  # noqa: BLE001
-        if target_dataset == DEFAULT_DATASET_NAME:
-            try:
-                raw = _load_local_subj()
-                notes.append(f"Loaded cached SetFit/subj from local files ({SUBJ_TRAIN_PATH.name})")
-            except Exception as cache_exc:  # noqa: BLE001
-                logger.warning("Failed local SetFit/subj cache: %s", cache_exc)
-                logger.warning("Falling back to bundled sample: %s", exc)
-                raw = load_dataset("json", data_files={"train": str(DATA_PATH)})
-                notes.append(
-                    f"Fell back to bundled dataset because SetFit/subj was unavailable ({exc}) "
-                    f"and local cache missing ({cache_exc})"
-                )
-        else:
-            logger.warning("Failed to load %s, using bundled sample: %s", target_dataset, exc)
-            raw = load_dataset("json", data_files={"train": str(DATA_PATH)})
-            notes.append(
-                f"Fell back to bundled dataset because hub load failed: {target_dataset} ({exc})"
-            )
+    raw, source = load_dataset_source(resolve_dataset_source(dataset_name))
+    notes: List[str] = list(source.notes)
+    target_dataset = source.name
 
     if isinstance(raw, Dataset):
         ds_dict = DatasetDict({"train": raw})
     else:
         ds_dict = DatasetDict({k: v for k, v in raw.items()})
 
-    base = ds_dict["train"]
-    base = _normalize_columns(base)
+    base = ds_dict["train"] if "train" in ds_dict else ds_dict.pop(next(iter(ds_dict)))
+    base = normalize_columns(base)
 
     # If there are other splits, merge for a unified stratified split.
     merged = base
     if "validation" in ds_dict:
-        merged = concatenate_datasets([merged, _normalize_columns(ds_dict["validation"])])
+        merged = concatenate_datasets([merged, normalize_columns(ds_dict["validation"])])
     if "test" in ds_dict:
-        merged = concatenate_datasets([merged, _normalize_columns(ds_dict["test"])])
+        merged = concatenate_datasets([merged, normalize_columns(ds_dict["test"])])
 
-    # Limit dataset size while keeping classes balanced.
-    merged = merged.shuffle(seed=seed)
-    labels = list(set(merged["label"]))
-    if labels != [0, 1] and sorted(labels) != [0, 1]:
-        unique = sorted(labels)
+    labels = label_array(merged)
+    unique = np.unique(labels).tolist()
+    if unique != [0, 1]:
         raise ValueError(f"Dataset must be binary labeled (0/1). Found labels: {unique}")
 
+    # Limit dataset size while keeping classes balanced (index sampling, no filter passes).
     if max_samples and len(merged) > max_samples:
-        per_class_target = max_samples // 2
-        factual = merged.filter(lambda ex: ex["label"] == 0)
-        opinion = merged.filter(lambda ex: ex["label"] == 1)
-        factual = factual.select(range(min(len(factual), per_class_target)))
-        opinion = opinion.select(range(min(len(opinion), per_class_target)))
-        merged = concatenate_datasets([factual, opinion])
-        merged = merged.shuffle(seed=seed)
+        merged = merged.select(stratified_indices(labels, max_samples // 2, seed))
         notes.append(f"Downsampled dataset to ~{len(merged)} rows for quick training.")
+    else:
+        merged = merged.shuffle(seed=seed)
 
     splits = merged.train_test_split(test_size=0.2, seed=seed, stratify_by_column="label")
     train_val = splits["train"].train_test_split(test_size=0.25, seed=seed, stratify_by_column="label")
@@ -174,22 +228,170 @@ def _load_news_dataset(
         }
     )
 
-    class_distribution = {
-        split: {
-            "factual": int(sum(1 for label in split_ds["label"] if label == 0)),
-            "opinion": int(sum(1 for label in split_ds["label"] if label == 1)),
-            "total": len(split_ds),
-        }
-        for split, split_ds in final_ds.items()
-    }
+    distribution = {split: class_distribution(label_array(split_ds)) for split, split_ds in final_ds.items()}
 
     meta = {
         "source": target_dataset if target_dataset else DATA_PATH.name,
         "num_rows": len(merged),
-        "class_distribution": class_distribution,
+        "class_distribution": distribution,
         "notes": notes,
     }
-    return final_ds, meta
+    return final_ds, meta, source
+
+
+def _available_memory_mb(device: torch.device) -> float:
+    if device.type == "cuda":
+        free, _ = torch.cuda.mem_get_info(device)
+        return free / 2**20
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _peak_memory_mb(device: torch.device) -> float:
+    """CUDA max allocated since the last reset; elsewhere the process-lifetime peak RSS (never resets)."""
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def estimate_activation_mb_per_sample(
+    config: Any, seq_len: int, bf16: bool = False, gradient_checkpointing: bool = False
+) -> float:
+    """
+    Rough activation memory one training sample needs in the encoder, after
+    Korthikanti et al. (2022): per layer about s*h*34 + 5*a*s^2 bytes at
+    16-bit. fp32 doubles that. With gradient checkpointing only each layer's
+    input is stored (2*s*h), plus one layer's activations during recompute.
+    """
+    hidden, heads, layers = config.hidden_size, config.num_attention_heads, config.num_hidden_layers
+    scale = 1.0 if bf16 else 2.0
+    per_layer = (seq_len * hidden * 34 + 5 * heads * seq_len**2) * scale
+    if gradient_checkpointing:
+        total = layers * 2 * seq_len * hidden * scale + per_layer
+    else:
+        total = layers * per_layer
+    return total / 2**20
+
+
+def quantize_dynamic_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Dynamic int8 quantization of every nn.Linear: weights are stored as int8
+    and activations are quantized per batch at runtime. Expects a plain
+    (LoRA-merged) model. Runs on CPU.
+    """
+    model = model.to("cpu").float().eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _has_adapter_weights(path: Path) -> bool:
+    return any((path / name).exists() for name in ADAPTER_WEIGHT_FILES)
+
+
+def resolve_checkpoint(checkpoint: Optional[str] = None, checkpoints_root: Path = CHECKPOINTS_ROOT) -> Path:
+    """
+    Pick the best available adapter checkpoint based on eval_f1 recorded in
+    trainer_state.json (searched recursively, so training-job runs count).
+    An explicit `checkpoint` (name under the root, or a path) is used as is and
+    never falls back: FileNotFoundError if it holds no adapter weights.
+    Only directories that actually hold adapter weights are returned.
+    """
+    if checkpoint:
+        preferred = (checkpoints_root / checkpoint).resolve()
+        if not _has_adapter_weights(preferred):
+            raise FileNotFoundError(f"Checkpoint {checkpoint} has no adapter weights at {preferred}.")
+        return preferred
+
+    best: Tuple[float, Path] | None = None
+    for state_path in checkpoints_root.glob("**/checkpoint-*/trainer_state.json"):
+        try:
+            state = json.loads(state_path.read_text())
+        except json.JSONDecodeError:
+            continue
+
+        log_history = state.get("log_history", [])
+        f1_scores = [entry["eval_f1"] for entry in log_history if "eval_f1" in entry]
+        if not f1_scores:
+            continue
+        candidate_f1 = max(f1_scores)
+        checkpoint_ref = Path(state.get("best_model_checkpoint") or str(state_path.parent))
+        if checkpoint_ref.is_absolute():
+            options = [checkpoint_ref]
+        else:
+            # Relative to whichever cwd the run used; the sibling dir is the robust guess.
+            options = [BACKEND_DIR / checkpoint_ref, BACKEND_DIR.parent / checkpoint_ref, state_path.parent.parent / checkpoint_ref.name]
+        candidate_path = next((path.resolve() for path in options if _has_adapter_weights(path)), None)
+        if candidate_path is None:
+            continue
+
+        if best is None or candidate_f1 > best[0]:
+            best = (candidate_f1, candidate_path)
+
+    if best:
+        return best[1]
+
+    fallback = checkpoints_root / "checkpoint-1125"
+    if _has_adapter_weights(fallback):
+        return fallback
+
+    raise FileNotFoundError(f"No adapter checkpoint found in {checkpoints_root}.")
+
+
+def named_adapter_path(ref: str, checkpoints_root: Path = CHECKPOINTS_ROOT) -> Path:
+    """
+    A client-requested adapter, which must resolve to a directory under
+    `checkpoints_root` (ValueError otherwise); unlike resolve_checkpoint, no fallback.
+    """
+    path = (checkpoints_root / ref).resolve()
+    if not path.is_relative_to(checkpoints_root.resolve()):
+        raise ValueError(f"Adapter {ref} is outside {checkpoints_root}.")
+    if not _has_adapter_weights(path):
+        raise FileNotFoundError(f"Unknown adapter: {ref}")
+    return path
+
+
+_shared_pool: Optional[AdapterPool] = None
+_shared_pool_lock = threading.Lock()
+
+
+def shared_adapter_pool() -> AdapterPool:
+    """The process-wide base model + adapter pool used by serving."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = AdapterPool(
+                DEFAULT_MODEL_NAME,
+                _get_device(),
+                root=CHECKPOINTS_ROOT,
+                resolver=named_adapter_path,
+                max_adapters=MAX_RESIDENT_ADAPTERS,
+                config_name=PIPELINE_CONFIG_NAME,
+            )
+        return _shared_pool
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _dataset_source_hash(source: DatasetSource) -> str:
+    """Fingerprint of a dataset source: hub name or local file contents."""
+    digest = hashlib.sha256(f"{source.kind}:{source.name}".encode())
+    for split, path in sorted(source.files.items()):
+        digest.update(split.encode())
+        digest.update(_file_digest(Path(path)).encode())
+    return digest.hexdigest()
 
 
 @dataclass
@@ -207,16 +409,32 @@ class RobertaLoraPipeline:
         self,
         max_length: int = DEFAULT_MAX_LENGTH,
         classification_threshold: float = DEFAULT_CLASSIFICATION_THRESHOLD,
+        merge_for_inference: bool = True,
+        adapter_pool: Optional[AdapterPool] = None,
     ) -> None:
         self.max_length = max_length
         self.classification_threshold = classification_threshold
+        # Fold the LoRA update into the base weights after training so inference
+        # skips the low-rank matmuls; the adapter is kept for further training.
+        # (Adapters loaded from disk are served by the pool, which merges on its own.)
+        self.merge_for_inference = merge_for_inference
+        self.merged = False
         self.device = _get_device()
         self.tokenizer = AutoTokenizer.from_pretrained(DEFAULT_MODEL_NAME)
-        self.base_model = AutoModelForSequenceClassification.from_pretrained(
-            DEFAULT_MODEL_NAME,
-            num_labels=2,
-        ).to(self.device)
+        # Loaded on first training use; saved adapters run on the pool's shared base.
+        self.base_model: Optional[torch.nn.Module] = None
         self.peft_model = None
+        self.adapter_pool = adapter_pool
+        # Default adapter served from the pool; None serves the in-process model.
+        self.adapter_name: Optional[str] = None
+        self.prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE)
+        # Bumped per in-process training run; part of the cache's model id.
+        self.model_generation = 0
+        self.default_precision = DEFAULT_INFERENCE_PRECISION
+        self.int8_model: Optional[torch.nn.Module] = None
+        self._int8_lock = threading.Lock()
+        self.adapter_source: Optional[str] = None
+        self._load_lock = threading.Lock()
         self.data_collator = DataCollatorWithPadding(tokenizer=self.tokenizer)
         self.tokenized: Optional[DatasetDict] = None
         self.dataset_meta: Dict[str, Any] = {}
@@ -228,6 +446,11 @@ class RobertaLoraPipeline:
         alpha: int = 16,
         dropout: float = 0.05,
     ):
+        if self.base_model is None:
+            self.base_model = AutoModelForSequenceClassification.from_pretrained(
+                DEFAULT_MODEL_NAME,
+                num_labels=2,
+            ).to(self.device)
         lora_config = LoraConfig(
             r=r,
             lora_alpha=alpha,
@@ -241,13 +464,63 @@ class RobertaLoraPipeline:
         logger.info("Prepared LoRA model with r=%s alpha=%s dropout=%s", r, alpha, dropout)
         return lora_config
 
+    def enable_merged_inference(self) -> None:
+        """
+        Merge the LoRA deltas (B @ A * scale) into the `query`/`value` weights
+        in place. Forward passes then run the plain base layers; the LoRA
+        A/B matrices stay attached so the merge can be undone for training.
+        """
+        if self.peft_model is None:
+            raise RuntimeError("No LoRA model to merge; train or load an adapter first.")
+        if not self.merged:
+            self.peft_model.merge_adapter()
+            self.merged = True
+            logger.info("Merged LoRA adapter into base weights for inference.")
+
+    def _get_int8_model(self) -> torch.nn.Module:
+        """Merged copy of the current adapter, dynamically quantized; built on first use."""
+        with self._int8_lock:
+            if self.int8_model is None:
+                merged = copy.deepcopy(self.peft_model).merge_and_unload()
+                self.int8_model = quantize_dynamic_int8(merged)
+                logger.info("Built int8 dynamic-quantized classifier.")
+            return self.int8_model
+
+    def disable_merged_inference(self) -> None:
+        """Restore the original base weights (required before further training)."""
+        if self.peft_model is not None and self.merged:
+            self.peft_model.unmerge_adapter()
+            self.merged = False
+
     def load_and_tokenize(
         self,
         dataset_name: Optional[str],
         seed: int,
         max_samples: int,
+        use_cache: bool = True,
     ):
-        dataset, meta = _load_news_dataset(dataset_name, seed, max_samples)
+        """
+        Load, split and tokenize the dataset. The tokenized DatasetDict is saved
+        as Arrow under TOKENIZED_CACHE_DIR, so repeated runs with the same data,
+        seed, sample cap, max_length and tokenizer memory-map it instead of
+        re-running the per-example maps and tokenization. Both paths return the
+        same tokenized DatasetDict (text, label and tokenizer columns).
+        """
+        source = resolve_dataset_source(dataset_name)
+        cache_dir = TOKENIZED_CACHE_DIR / self._tokenized_cache_key(source, seed, max_samples)
+        if use_cache and (cache_dir / "meta.json").exists():
+            start = time.perf_counter()
+            try:
+                tokenized = load_from_disk(str(cache_dir / "data"))
+                self.dataset_meta = json.loads((cache_dir / "meta.json").read_text())
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Ignoring unreadable tokenized cache %s: %s", cache_dir, exc)
+            else:
+                self.tokenized = tokenized
+                logger.info("Loaded tokenized dataset from %s in %.2fs", cache_dir, time.perf_counter() - start)
+                return tokenized
+
+        dataset, meta, loaded_source = _load_news_dataset(dataset_name, seed, max_samples)
         self.dataset_meta = meta
 
         def tokenize(batch: Dict[str, Any]) -> Dict[str, Any]:
@@ -260,7 +533,40 @@ class RobertaLoraPipeline:
 
         tokenized = dataset.map(tokenize, batched=True)
         self.tokenized = tokenized
-        return dataset
+        if use_cache:
+            # Key by the source actually loaded: when a hub load falls back to the
+            # bundled sample, that data must not be cached under the hub's key.
+            cache_dir = TOKENIZED_CACHE_DIR / self._tokenized_cache_key(loaded_source, seed, max_samples)
+            self._save_tokenized(tokenized, meta, cache_dir)
+        return tokenized
+
+    def _tokenized_cache_key(self, source: DatasetSource, seed: int, max_samples: int) -> str:
+        key = {
+            "version": TOKENIZED_CACHE_VERSION,
+            "source": _dataset_source_hash(source),
+            "seed": seed,
+            "max_samples": max_samples,
+            "max_length": self.max_length,
+            "tokenizer": [self.tokenizer.name_or_path, type(self.tokenizer).__name__, len(self.tokenizer)],
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _save_tokenized(tokenized: DatasetDict, meta: Dict[str, Any], cache_dir: Path) -> None:
+        # Write to a temp dir and rename so concurrent jobs never read a partial entry.
+        tmp_dir = cache_dir.with_name(f"{cache_dir.name}.tmp-{time.time_ns()}")
+        try:
+            tokenized.save_to_disk(str(tmp_dir / "data"))
+            (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2))
+            if cache_dir.exists():
+                # Replace an unreadable or stale entry instead of failing the rename forever.
+                stale_dir = cache_dir.with_name(f"{cache_dir.name}.stale-{time.time_ns()}")
+                cache_dir.rename(stale_dir)
+                shutil.rmtree(stale_dir, ignore_errors=True)
+            tmp_dir.rename(cache_dir)
+        except OSError as exc:
+            logger.warning("Could not write tokenized cache %s: %s", cache_dir, exc)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
     @staticmethod
     def _compute_metrics(eval_pred) -> Dict[str, float]:
@@ -281,9 +587,9 @@ class RobertaLoraPipeline:
         }
 
     def _baseline_majority(self, dataset: Dataset) -> Dict[str, Any]:
-        labels = list(dataset["label"])
-        majority = 1 if labels.count(1) >= labels.count(0) else 0
-        accuracy = labels.count(majority) / len(labels)
+        counts = np.bincount(label_array(dataset), minlength=2)
+        majority = 1 if counts[1] >= counts[0] else 0
+        accuracy = counts[majority] / counts.sum()
         return {
             "strategy": "majority-class",
             "majority_label": majority,
@@ -318,16 +624,37 @@ class RobertaLoraPipeline:
         lora_alpha: int = 64,
         lora_dropout: float = 0.1,
         classification_threshold: float = 0.5,
+        keep_best_checkpoints: int = DEFAULT_KEEP_BEST_CHECKPOINTS,
+        async_checkpoint_writes: bool = True,
+        bf16: bool = False,
+        gradient_checkpointing: bool = False,
+        auto_batch_size: bool = False,
+        memory_budget_mb: Optional[float] = None,
+        output_dir: Optional[Path] = None,
+        callbacks: Optional[List[TrainerCallback]] = None,
     ) -> Dict[str, Any]:
         self.max_length = max_length
         self.classification_threshold = classification_threshold
+        # Never wrap or train on top of merged weights.
+        self.disable_merged_inference()
+        self.int8_model = None
         lora_config = self.prepare_lora_model(r=lora_r, alpha=lora_alpha, dropout=lora_dropout)
         dataset = self.load_and_tokenize(dataset_name, seed, max_samples)
         if self.tokenized is None:
             raise RuntimeError("Tokenized dataset missing after preprocessing.")
 
+        batch_sizing = None
+        if auto_batch_size:
+            per_device_train_batch_size, gradient_accumulation_steps, batch_sizing = self._fit_batch_size(
+                per_device_train_batch_size * gradient_accumulation_steps,
+                bf16=bf16,
+                gradient_checkpointing=gradient_checkpointing,
+                memory_budget_mb=memory_budget_mb,
+            )
+
+        run_dir = Path(output_dir or DEFAULT_OUTPUT_DIR)
         args = TrainingArguments(
-            output_dir=str(Path("outputs") / "assignment7_roberta"),
+            output_dir=str(run_dir),
             evaluation_strategy="epoch",
             save_strategy="epoch",
             learning_rate=learning_rate,
@@ -343,25 +670,64 @@ class RobertaLoraPipeline:
             logging_steps=10,
             seed=seed,
             report_to=[],
+            # On CPU, bf16=True runs forward/backward under torch.autocast(bfloat16).
+            bf16=bf16,
+            gradient_checkpointing=gradient_checkpointing,
+            # Non-reentrant checkpointing still yields grads when the embeddings are frozen (LoRA).
+            gradient_checkpointing_kwargs={"use_reentrant": False} if gradient_checkpointing else None,
         )
 
-        trainer = Trainer(
+        # No tokenizer on the Trainer: checkpoints stay adapter-only and the
+        # (unchanged) tokenizer is written once per run directory instead.
+        trainer = CheckpointTrainer(
             model=self.peft_model,
             args=args,
             train_dataset=self.tokenized["train"],
             eval_dataset=self.tokenized["validation"],
-            tokenizer=self.tokenizer,
             data_collator=self.data_collator,
             compute_metrics=self._compute_metrics,
+            callbacks=callbacks,
+            async_checkpoint_writes=async_checkpoint_writes,
         )
-
-        train_output = trainer.train()
+        retention = CheckpointRetentionCallback(keep_best=keep_best_checkpoints, run_io=trainer.submit_io)
+        trainer.add_callback(retention)
+        run_dir.mkdir(parents=True, exist_ok=True)
+        self.tokenizer.save_pretrained(str(run_dir))
+
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        peak_before_mb = _peak_memory_mb(self.device)
+        try:
+            train_output = trainer.train()
+        finally:
+            trainer.flush_checkpoints(shutdown=True)
+        peak_mb = _peak_memory_mb(self.device)
+        performance = {
+            "bf16": bf16,
+            "gradient_checkpointing": gradient_checkpointing,
+            "per_device_train_batch_size": per_device_train_batch_size,
+            "gradient_accumulation_steps": gradient_accumulation_steps,
+            "batch_sizing": batch_sizing,
+            "samples_per_second": train_output.metrics.get("train_samples_per_second"),
+            "train_runtime_s": train_output.metrics.get("train_runtime"),
+            "peak_memory_mb": round(peak_mb, 1),
+            "peak_memory_kind": "cuda_max_allocated_run" if self.device.type == "cuda" else "process_lifetime_peak_rss",
+            # ru_maxrss can predate this run (earlier jobs, dataset loads); the
+            # delta is how far training raised the peak, 0 if it stayed below it.
+            "peak_memory_delta_mb": round(peak_mb - peak_before_mb, 1),
+        }
         eval_metrics = self._clean_metrics(trainer.evaluate(self.tokenized["validation"]))
         test_metrics = self._clean_metrics(trainer.evaluate(self.tokenized["test"]))
         baseline = self._baseline_majority(dataset["test"])
 
         self.trained = True
+        self.adapter_name = None
+        self.adapter_source = str(run_dir)
+        self.model_generation += 1
+        self.prediction_cache.clear()
         self.peft_model.eval()
+        if self.merge_for_inference:
+            self.enable_merged_inference()
 
         sample_predictions = [
             self.predict(example["text"]) for example in dataset["test"].select(range(min(3, len(dataset["test"]))))
@@ -384,31 +750,141 @@ class RobertaLoraPipeline:
             },
             "label_smoothing": label_smoothing,
             "classification_threshold": classification_threshold,
+            "checkpoints": {**trainer.checkpoint_stats(), **retention.summary()},
+            "performance": performance,
             "dataset": self.dataset_meta,
             "sample_predictions": [asdict(pred) for pred in sample_predictions],
         }
 
-    def predict(self, text: str) -> PredictionResult:
-        if self.peft_model is None:
-            self.prepare_lora_model()
-        self.peft_model.eval()
-        inputs = self.tokenizer(
-            text,
-            truncation=True,
-            padding=True,
+    def _fit_batch_size(
+        self,
+        effective_batch_size: int,
+        bf16: bool,
+        gradient_checkpointing: bool,
+        memory_budget_mb: Optional[float],
+    ) -> Tuple[int, int, Dict[str, Any]]:
+        """
+        Largest per-device batch whose estimated activations (at max_length,
+        the dynamic-padding worst case) fit the budget, with gradient
+        accumulation making up the requested effective batch size.
+        """
+        per_sample_mb = estimate_activation_mb_per_sample(
+            self.base_model.config, self.max_length, bf16=bf16, gradient_checkpointing=gradient_checkpointing
+        )
+        # Default budget: half of what is free now (weights, optimizer and allocator slack take the rest).
+        budget_mb = memory_budget_mb or _available_memory_mb(self.device) * 0.5
+        fits = max(1, int(budget_mb // per_sample_mb))
+        batch_size = min(fits, effective_batch_size)
+        accumulation = math.ceil(effective_batch_size / batch_size)
+        info = {
+            "activation_mb_per_sample": round(per_sample_mb, 1),
+            "memory_budget_mb": round(budget_mb, 1),
+            "effective_batch_size": batch_size * accumulation,
+        }
+        logger.info("Auto batch sizing: batch=%s accumulation=%s (%s)", batch_size, accumulation, info)
+        return batch_size, accumulation, info
+
+    def export_artifact(self, output_dir: Path, fmt: str = "torchscript") -> Dict[str, Any]:
+        """
+        Merge the adapter into a copy of the base model and export it for
+        serving without peft (see assignment7_export / assignment7_serving).
+        """
+        if not self.trained:
+            raise RuntimeError("Model not trained yet; nothing to export.")
+        from assignment7_export import export_classifier
+
+        if self.adapter_name is not None:
+            merged = self._pool().merged_copy(self.adapter_name)
+        else:
+            merged = copy.deepcopy(self.peft_model).merge_and_unload()
+        return export_classifier(
+            merged,
+            self.tokenizer,
+            Path(output_dir),
+            classification_threshold=self.classification_threshold,
             max_length=self.max_length,
-            return_tensors="pt",
-        ).to(self.device)
-
-        with torch.no_grad():
-            outputs = self.peft_model(**inputs)
-            logits = outputs.logits.detach().cpu().numpy()[0]
-            probs = torch.softmax(torch.tensor(logits), dim=-1).numpy()
-            opinion_prob = float(probs[1])
-            factual_prob = float(probs[0])
-            label_id = 1 if opinion_prob >= self.classification_threshold else 0
-            score = opinion_prob if label_id == 1 else factual_prob
+            fmt=fmt,
+            source=self.adapter_source or "in-process pipeline",
+        )
 
+    def save_adapter(self, adapter_dir: Path) -> None:
+        """Save the (unmerged) LoRA adapter plus the inference settings it was trained with."""
+        if self.peft_model is None:
+            raise RuntimeError("No LoRA model to save.")
+        was_merged = self.merged
+        self.disable_merged_inference()
+        adapter_dir = Path(adapter_dir)
+        self.peft_model.save_pretrained(str(adapter_dir))
+        (adapter_dir / PIPELINE_CONFIG_NAME).write_text(
+            json.dumps(
+                {"max_length": self.max_length, "classification_threshold": self.classification_threshold},
+                indent=2,
+            )
+        )
+        if was_merged:
+            self.enable_merged_inference()
+
+    def _pool(self) -> AdapterPool:
+        if self.adapter_pool is None:
+            self.adapter_pool = shared_adapter_pool()
+        return self.adapter_pool
+
+    def load_adapter(self, adapter_dir: Path, name: Optional[str] = None) -> str:
+        """
+        Serve a LoRA adapter saved by `save_adapter` (or a Trainer checkpoint)
+        as the default adapter, on the pool's shared base model. Returns its name.
+        """
+        pool = self._pool()
+        name = pool.register(Path(adapter_dir), name)
+        with pool.use(name) as entry:
+            config = dict(entry.config)
+            adapter_path = entry.path
+        self.max_length = config.get("max_length", self.max_length)
+        self.classification_threshold = config.get("classification_threshold", self.classification_threshold)
+        # Drop any in-process training model; serving now shares the pool's base.
+        self.base_model = None
+        self.peft_model = None
+        self.int8_model = None
+        self.merged = False
+        self.adapter_name = name
+        self.trained = True
+        self.adapter_source = str(adapter_path)
+        self.prediction_cache.clear()
+        logger.info("Serving LoRA adapter %s from %s", name, adapter_path)
+        return name
+
+    def load_saved_adapter(self, checkpoint: Optional[str] = None) -> Path:
+        """
+        Load a requested checkpoint (confined to CHECKPOINTS_ROOT), else the
+        configured ASSIGNMENT7_ADAPTER or the best saved one, and mark the pipeline ready.
+        """
+        path = named_adapter_path(checkpoint) if checkpoint else resolve_checkpoint(DEFAULT_ADAPTER or None)
+        self.load_adapter(path)
+        return path
+
+    def ensure_ready(self) -> bool:
+        """
+        Make sure there is a model to serve, loading the saved adapter on
+        first use if nothing was trained in this process. Returns readiness.
+        """
+        if self.trained:
+            return True
+        with self._load_lock:
+            if not self.trained:
+                try:
+                    self.load_saved_adapter()
+                except FileNotFoundError as exc:
+                    logger.warning("No saved adapter to serve: %s", exc)
+        return self.trained
+
+    def _to_prediction(
+        self, text: str, probs: Union[torch.Tensor, np.ndarray], threshold: Optional[float] = None
+    ) -> PredictionResult:
+        factual_prob = float(probs[0])
+        opinion_prob = float(probs[1])
+        threshold = self.classification_threshold if threshold is None else threshold
+        label_id = 1 if opinion_prob >= threshold else 0
+        score = opinion_prob if label_id == 1 else factual_prob
         predicted_label = "opinion" if label_id == 1 else "factual"
         return PredictionResult(
             text=text,
@@ -416,3 +892,124 @@ class RobertaLoraPipeline:
             score=score,
             label_id=label_id,
         )
+
+    def predict_batch(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        precision: Optional[str] = None,
+        adapter: Union[None, str, List[Optional[str]]] = None,
+        use_cache: bool = True,
+    ) -> List[PredictionResult]:
+        """
+        Classify many statements at batch throughput.
+
+        Inputs are tokenized once without padding, sorted by length so each
+        batch holds similar-length texts, padded per batch (dynamic padding),
+        and softmaxed on-tensor. Results come back in the original order.
+        `precision="int8"` serves from the dynamically quantized model (CPU).
+        `adapter` names a pool adapter for all texts or one per text (None =
+        default); texts are grouped so each adapter is activated once.
+        Repeated texts are served from the prediction cache when `use_cache`.
+        """
+        precision = precision or self.default_precision
+        if precision not in INFERENCE_PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision} (expected one of {INFERENCE_PRECISIONS})")
+        if not texts:
+            return []
+        refs = adapter if isinstance(adapter, list) else [adapter] * len(texts)
+        if len(refs) != len(texts):
+            raise ValueError(f"Got {len(refs)} adapters for {len(texts)} texts.")
+
+        groups: Dict[Optional[str], List[int]] = {}
+        for idx, ref in enumerate(refs):
+            name = self._pool().resolve_name(ref) if ref else self.adapter_name
+            groups.setdefault(name, []).append(idx)
+
+        results: List[Optional[PredictionResult]] = [None] * len(texts)
+        for name, indices in groups.items():
+            group_texts = [texts[i] for i in indices]
+            preds = self._predict_group(group_texts, batch_size, precision, name, use_cache)
+            for idx, pred in zip(indices, preds):
+                results[idx] = pred
+        return results
+
+    def _predict_group(
+        self, texts: List[str], batch_size: int, precision: str, adapter_name: Optional[str], use_cache: bool
+    ) -> List[PredictionResult]:
+        if adapter_name is None:
+            model_id = f"in-process-{self.model_generation}"
+            max_length, threshold = self.max_length, self.classification_threshold
+        else:
+            with self._pool().use(adapter_name) as entry:
+                model_id = f"{entry.name}@{entry.version}"
+                config = dict(entry.config)
+            max_length = config.get("max_length", self.max_length)
+            threshold = config.get("classification_threshold", self.classification_threshold)
+
+        cache = self.prediction_cache if use_cache and self.prediction_cache.enabled else None
+        if cache is None:
+            probs = self._run_group(texts, batch_size, precision, adapter_name, max_length).numpy()
+            return [self._to_prediction(text, probs[i], threshold) for i, text in enumerate(texts)]
+
+        keys = [cache.key(text, model_id, max_length, precision) for text in texts]
+        found = cache.get_many(keys)
+        # One forward pass per distinct missing text, even if it repeats within the request.
+        missing: Dict[Any, int] = {}
+        for idx, (key, probs) in enumerate(zip(keys, found)):
+            if probs is None:
+                missing.setdefault(key, idx)
+        if missing:
+            computed = self._run_group(
+                [texts[idx] for idx in missing.values()], batch_size, precision, adapter_name, max_length
+            ).numpy()
+            cache.put_many(list(missing), computed)
+            fresh = dict(zip(missing, computed))
+            found = [probs if probs is not None else fresh[key] for key, probs in zip(keys, found)]
+        return [self._to_prediction(text, found[i], threshold) for i, text in enumerate(texts)]
+
+    def _run_group(
+        self, texts: List[str], batch_size: int, precision: str, adapter_name: Optional[str], max_length: int
+    ) -> torch.Tensor:
+        if adapter_name is None:
+            if self.peft_model is None:
+                self.prepare_lora_model()
+            self.peft_model.eval()
+            if precision == "int8":
+                return self._predict_probs(self._get_int8_model(), torch.device("cpu"), texts, batch_size, max_length)
+            return self._predict_probs(self.peft_model, self.device, texts, batch_size, max_length)
+
+        pool = self._pool()
+        if precision == "int8":
+            # The quantized copy is private to this adapter, so it runs outside the pool lock.
+            model = pool.derived(adapter_name, "int8", quantize_dynamic_int8)
+            return self._predict_probs(model, torch.device("cpu"), texts, batch_size, max_length)
+        with pool.use(adapter_name):
+            return self._predict_probs(pool.model, pool.device, texts, batch_size, max_length)
+
+    def _predict_probs(
+        self, model: torch.nn.Module, device: torch.device, texts: List[str], batch_size: int, max_length: int
+    ) -> torch.Tensor:
+        encodings = self.tokenizer(
+            list(texts),
+            truncation=True,
+            padding=False,
+            max_length=max_length,
+        )
+        lengths = np.array([len(ids) for ids in encodings["input_ids"]])
+        order = np.argsort(lengths, kind="stable")
+        probs = torch.empty((len(texts), 2), dtype=torch.float32)
+
+        with torch.no_grad():
+            for start in range(0, len(texts), batch_size):
+                bucket = order[start : start + batch_size]
+                features = [{key: encodings[key][i] for key in encodings.keys()} for i in bucket]
+                batch = self.tokenizer.pad(features, return_tensors="pt").to(device)
+                logits = model(**batch).logits
+                probs[torch.from_numpy(bucket)] = torch.softmax(logits.float(), dim=-1).cpu()
+        return probs
+
+    def predict(
+        self, text: str, precision: Optional[str] = None, adapter: Optional[str] = None, use_cache: bool = True
+    ) -> PredictionResult:
+        return self.predict_batch([text], precision=precision, adapter=adapter, use_cache=use_cache)[0]
@@ -0,0 +1,138 @@
+# backend/assignment7_serving.py
+"""
+Lightweight loader for an exported Assignment 7 classifier (see
+assignment7_export.py). Imports only `tokenizers`, numpy and the runtime for
+the artifact (torch for TorchScript, onnxruntime for ONNX). It does not
+import peft, datasets or transformers, so serving workers start fast and
+do not hold a PEFT-wrapped eager model.
+
+Run (from backend/):
+    python assignment7_serving.py outputs/assignment7_export/<artifact> "Some statement" "Another one"
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from tokenizers import Tokenizer
+
+CONFIG_NAME = "classifier_config.json"
+EXPORT_FORMATS = ("torchscript", "onnx")
+# Modules each format needs beyond torch to export (onnx, onnxscript) and serve (onnxruntime).
+FORMAT_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "torchscript": (),
+    "onnx": ("onnx", "onnxscript", "onnxruntime"),
+}
+LABELS = ["factual", "opinion"]
+
+
+def missing_dependencies(fmt: str) -> List[str]:
+    """Modules `fmt` needs that are not importable in this environment."""
+    return [name for name in FORMAT_DEPENDENCIES.get(fmt, ()) if importlib.util.find_spec(name) is None]
+
+
+class ExportedClassifier:
+    """Serves fact/opinion predictions from an exported artifact directory."""
+
+    def __init__(self, artifact_dir: Path, num_threads: Optional[int] = None) -> None:
+        self.artifact_dir = Path(artifact_dir)
+        self.config: Dict[str, Any] = json.loads((self.artifact_dir / CONFIG_NAME).read_text())
+        self.max_length = int(self.config["max_length"])
+        self.classification_threshold = float(self.config["classification_threshold"])
+        self.pad_token_id = int(self.config.get("pad_token_id", 1))
+        self.format = self.config["format"]
+
+        self.tokenizer = Tokenizer.from_file(str(self.artifact_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.no_padding()
+
+        model_path = str(self.artifact_dir / self.config["model_file"])
+        if self.format == "torchscript":
+            import torch
+
+            if num_threads:
+                torch.set_num_threads(num_threads)
+            self._torch = torch
+            self._module = torch.jit.load(model_path, map_location="cpu").eval()
+        elif self.format == "onnx":
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self._session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        else:
+            raise ValueError(f"Unknown artifact format: {self.format}")
+
+    def _logits(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.format == "torchscript":
+            torch = self._torch
+            with torch.inference_mode():
+                out = self._module(torch.from_numpy(input_ids), torch.from_numpy(attention_mask))
+            return out.float().numpy()
+        return self._session.run(["logits"], {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+
+    def predict_probs(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        """Softmax probabilities [factual, opinion] per text, in input order."""
+        if not texts:
+            return np.zeros((0, len(LABELS)), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(list(texts))
+        lengths = np.array([len(enc.ids) for enc in encodings])
+        # Length-sorted buckets keep per-batch padding small.
+        order = np.argsort(lengths, kind="stable")
+        probs = np.empty((len(texts), len(LABELS)), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            bucket = order[start : start + batch_size]
+            width = int(lengths[bucket].max())
+            input_ids = np.full((len(bucket), width), self.pad_token_id, dtype=np.int64)
+            attention_mask = np.zeros((len(bucket), width), dtype=np.int64)
+            for row, idx in enumerate(bucket):
+                ids = encodings[idx].ids
+                input_ids[row, : len(ids)] = ids
+                attention_mask[row, : len(ids)] = 1
+            logits = self._logits(input_ids, attention_mask)
+            logits = logits - logits.max(axis=-1, keepdims=True)
+            exp = np.exp(logits)
+            probs[bucket] = exp / exp.sum(axis=-1, keepdims=True)
+        return probs
+
+    def _to_prediction(self, text: str, probs: np.ndarray) -> Dict[str, Any]:
+        label_id = 1 if float(probs[1]) >= self.classification_threshold else 0
+        return {
+            "text": text,
+            "predicted_label": LABELS[label_id],
+            "score": float(probs[label_id]),
+            "label_id": label_id,
+        }
+
+    def predict_batch(self, texts: List[str], batch_size: int = 32) -> List[Dict[str, Any]]:
+        probs = self.predict_probs(texts, batch_size=batch_size)
+        return [self._to_prediction(text, probs[i]) for i, text in enumerate(texts)]
+
+    def predict(self, text: str) -> Dict[str, Any]:
+        return self.predict_batch([text])[0]
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    args = list(sys.argv[1:] if argv is None else argv)
+    if len(args) < 2:
+        raise SystemExit("usage: python assignment7_serving.py <artifact_dir> <text> [<text> ...]")
+    start = time.perf_counter()
+    classifier = ExportedClassifier(Path(args[0]))
+    loaded = time.perf_counter()
+    predictions = classifier.predict_batch(args[1:])
+    done = time.perf_counter()
+    for pred in predictions:
+        print(f"{pred['predicted_label']:<8} {pred['score']:.3f}  {pred['text']}")
+    print(f"load {1000 * (loaded - start):.0f} ms, predict {1000 * (done - loaded):.1f} ms ({classifier.format})")
+
+
+if __name__ == "__main__":
+    main()
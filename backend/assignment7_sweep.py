@@ -0,0 +1,307 @@
+# backend/assignment7_sweep.py
+"""
+Parallel hyperparameter sweep for the Assignment 7 LoRA classifier.
+
+Trials run in worker processes with a fixed torch thread budget each, share
+the on-disk tokenized dataset cache, and are stopped early by a median
+stopping rule on per-epoch eval F1. Results are written as a leaderboard.
+
+Run (from backend/):
+    python assignment7_sweep.py --mode grid --parallel 4
+    python assignment7_sweep.py --mode random --trials 12 --parallel 3 --base '{"num_train_epochs": 5}'
+    python assignment7_sweep.py --space my_space.json
+
+A search space maps a `train()` argument to a list of values (grid or random
+choice) or to {"low": .., "high": .., "log": true} (random mode only).
+"""
+
+from __future__ import annotations
+
+import argparse
+import inspect
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from transformers import TrainerCallback
+
+RESULTS_DIR = Path(__file__).resolve().parent / "outputs" / "assignment7_sweep"
+
+DEFAULT_SEARCH_SPACE: Dict[str, Any] = {
+    "lora_r": [8, 16, 32],
+    "lora_alpha": [16, 32, 64],
+    "learning_rate": [1e-4, 5e-4, 1e-3],
+    "label_smoothing": [0.0, 0.05],
+}
+# Fixed arguments for every trial unless overridden by --base.
+DEFAULT_BASE_PARAMS: Dict[str, Any] = {"num_train_epochs": 5.0, "max_samples": 1000}
+# Median stopping: after `grace_epochs`, stop a trial whose best eval F1 so far
+# is below the median of other trials at the same epoch (needs `min_peers`).
+DEFAULT_GRACE_EPOCHS = 2
+DEFAULT_MIN_PEERS = 2
+
+
+def expand_grid(space: Dict[str, Any]) -> List[Dict[str, Any]]:
+    for name, values in space.items():
+        if not isinstance(values, list):
+            raise ValueError(f"Grid search needs a list of values for {name}.")
+    names = list(space)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(space[name] for name in names))]
+
+
+def sample_random(space: Dict[str, Any], num_trials: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    trials: List[Dict[str, Any]] = []
+    for _ in range(num_trials):
+        params: Dict[str, Any] = {}
+        for name, spec in space.items():
+            if isinstance(spec, list):
+                params[name] = rng.choice(spec)
+            elif spec.get("log"):
+                params[name] = math.exp(rng.uniform(math.log(spec["low"]), math.log(spec["high"])))
+            else:
+                params[name] = rng.uniform(spec["low"], spec["high"])
+            if isinstance(spec, dict) and spec.get("int"):
+                params[name] = int(round(params[name]))
+        trials.append(params)
+    return trials
+
+
+class MedianStoppingCallback(TrainerCallback):
+    """Stops a trial whose best eval F1 trails the median of its peers at the same epoch."""
+
+    def __init__(
+        self,
+        scores: Any,
+        lock: Any,
+        grace_epochs: int = DEFAULT_GRACE_EPOCHS,
+        min_peers: int = DEFAULT_MIN_PEERS,
+        metric: str = "eval_f1",
+    ) -> None:
+        self.scores = scores  # Manager dict: epoch -> [best-so-far of each trial]
+        self.lock = lock
+        self.grace_epochs = grace_epochs
+        self.min_peers = min_peers
+        self.metric = metric
+        self.best = -math.inf
+        self.training = False
+        self.stopped_at: Optional[int] = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.training = True
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.training = False
+
+    def on_evaluate(self, args, state, control, metrics=None, **kwargs):
+        # Ignore the post-training validation/test evaluations.
+        if not self.training or not metrics or self.metric not in metrics:
+            return
+        epoch = int(round(state.epoch or 0))
+        self.best = max(self.best, float(metrics[self.metric]))
+        with self.lock:
+            history = list(self.scores.get(epoch, []))
+            peers = list(history)
+            history.append(self.best)
+            self.scores[epoch] = history
+        if epoch >= self.grace_epochs and len(peers) >= self.min_peers and self.best < float(np.median(peers)):
+            self.stopped_at = epoch
+            control.should_training_stop = True
+
+
+def _init_worker(num_threads: int) -> None:
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+def _data_key(params: Dict[str, Any]) -> Tuple[Optional[str], int, int, int]:
+    """The train() arguments that select the tokenized cache entry a trial reads."""
+    return (
+        params.get("dataset_name"),
+        params.get("seed", 42),
+        params.get("max_samples", 1000),
+        params.get("max_length", 256),
+    )
+
+
+def _warm_cache(data_keys: List[Tuple[Optional[str], int, int, int]]) -> None:
+    """Tokenize each distinct (dataset, seed, max_samples, max_length) once so trials load it from the Arrow cache."""
+    from assignment7_roberta import RobertaLoraPipeline
+
+    pipeline = RobertaLoraPipeline(merge_for_inference=False)
+    for dataset_name, seed, max_samples, max_length in data_keys:
+        pipeline.max_length = max_length
+        pipeline.load_and_tokenize(dataset_name, seed, max_samples)
+
+
+def _run_trial(
+    trial_id: int,
+    params: Dict[str, Any],
+    output_dir: str,
+    scores: Any,
+    lock: Any,
+    grace_epochs: int,
+    min_peers: int,
+) -> Dict[str, Any]:
+    from assignment7_roberta import RobertaLoraPipeline
+
+    started = time.perf_counter()
+    stopper = MedianStoppingCallback(scores, lock, grace_epochs=grace_epochs, min_peers=min_peers)
+    record: Dict[str, Any] = {"trial": trial_id, "params": params, "output_dir": output_dir}
+    try:
+        pipeline = RobertaLoraPipeline(merge_for_inference=False)
+        # Trials keep only their best checkpoint unless the sweep overrides it.
+        result = pipeline.train(
+            **{"keep_best_checkpoints": 1, **params},
+            output_dir=Path(output_dir),
+            callbacks=[stopper],
+        )
+    except Exception as exc:  # noqa: BLE001
+        record.update(status="failed", error=repr(exc))
+    else:
+        record.update(
+            status="pruned" if stopper.stopped_at is not None else "completed",
+            stopped_at_epoch=stopper.stopped_at,
+            eval_f1=result["eval_metrics"].get("f1"),
+            eval_metrics=result["eval_metrics"],
+            test_metrics=result["test_metrics"],
+            training_loss=result["train_metrics"]["training_loss"],
+        )
+    record["seconds"] = round(time.perf_counter() - started, 1)
+    return record
+
+
+def run_sweep(
+    trials: List[Dict[str, Any]],
+    base_params: Dict[str, Any],
+    parallel: int = 2,
+    threads_per_trial: Optional[int] = None,
+    grace_epochs: int = DEFAULT_GRACE_EPOCHS,
+    min_peers: int = DEFAULT_MIN_PEERS,
+    output_dir: Optional[Path] = None,
+) -> Dict[str, Any]:
+    from assignment7_roberta import RobertaLoraPipeline
+
+    valid = set(inspect.signature(RobertaLoraPipeline.train).parameters) - {"self", "output_dir", "callbacks"}
+    for params in [base_params, *trials]:
+        unknown = set(params) - valid
+        if unknown:
+            raise ValueError(f"Unknown train() arguments in sweep: {sorted(unknown)}")
+
+    threads_per_trial = threads_per_trial or max(1, (os.cpu_count() or 1) // parallel)
+    sweep_dir = output_dir or RESULTS_DIR / f"sweep-{time.strftime('%Y%m%d-%H%M%S')}"
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    ctx = mp.get_context("spawn")
+    manager = ctx.Manager()
+    scores, lock = manager.dict(), manager.Lock()
+
+    full_trials = [{**base_params, **params} for params in trials]
+    data_keys = list(dict.fromkeys(_data_key(params) for params in full_trials))
+    started = time.perf_counter()
+    records: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(
+        max_workers=parallel,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(threads_per_trial,),
+    ) as pool:
+        pool.submit(_warm_cache, data_keys).result()
+        futures = [
+            pool.submit(
+                _run_trial,
+                idx,
+                params,
+                str(sweep_dir / f"trial-{idx:03d}"),
+                scores,
+                lock,
+                grace_epochs,
+                min_peers,
+            )
+            for idx, params in enumerate(full_trials)
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            print(
+                f"trial {record['trial']:>3} {record['status']:<9} "
+                f"eval_f1={record.get('eval_f1')} ({record['seconds']}s) {trials[record['trial']]}"
+            )
+    manager.shutdown()
+
+    leaderboard = sorted(
+        records,
+        key=lambda r: (r.get("eval_f1") is not None, r.get("eval_f1") or 0.0),
+        reverse=True,
+    )
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sweep_dir": str(sweep_dir),
+        "trials": len(full_trials),
+        "parallel": parallel,
+        "threads_per_trial": threads_per_trial,
+        "base_params": base_params,
+        "median_stopping": {"grace_epochs": grace_epochs, "min_peers": min_peers},
+        "wall_seconds": round(time.perf_counter() - started, 1),
+        "status_counts": {
+            status: sum(1 for r in records if r["status"] == status) for status in ("completed", "pruned", "failed")
+        },
+        "leaderboard": leaderboard,
+    }
+    with open(sweep_dir / "leaderboard.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Parallel LoRA hyperparameter sweep for Assignment 7.")
+    parser.add_argument("--space", default=None, help="JSON file with the search space (default: built-in).")
+    parser.add_argument("--mode", choices=["grid", "random"], default="grid")
+    parser.add_argument("--trials", type=int, default=8, help="Number of random-search trials.")
+    parser.add_argument("--seed", type=int, default=0, help="Random-search sampling seed.")
+    parser.add_argument("--base", default=None, help="JSON object of fixed train() arguments.")
+    parser.add_argument("--parallel", type=int, default=2, help="Trials running at once.")
+    parser.add_argument("--threads-per-trial", type=int, default=None, help="Default: cores // parallel.")
+    parser.add_argument("--grace-epochs", type=int, default=DEFAULT_GRACE_EPOCHS)
+    parser.add_argument("--min-peers", type=int, default=DEFAULT_MIN_PEERS)
+    parser.add_argument("--output", default=None, help="Sweep directory (default: outputs/assignment7_sweep/).")
+    args = parser.parse_args(argv)
+
+    space = DEFAULT_SEARCH_SPACE
+    if args.space:
+        with open(args.space, "r", encoding="utf-8") as f:
+            space = json.load(f)
+    base_params = {**DEFAULT_BASE_PARAMS, **(json.loads(args.base) if args.base else {})}
+    trials = expand_grid(space) if args.mode == "grid" else sample_random(space, args.trials, args.seed)
+
+    report = run_sweep(
+        trials,
+        base_params,
+        parallel=args.parallel,
+        threads_per_trial=args.threads_per_trial,
+        grace_epochs=args.grace_epochs,
+        min_peers=args.min_peers,
+        output_dir=Path(args.output) if args.output else None,
+    )
+
+    print(f"\n{report['trials']} trials in {report['wall_seconds']}s  {report['status_counts']}")
+    for rank, record in enumerate(report["leaderboard"][:10], start=1):
+        f1 = record.get("eval_f1")
+        f1_text = f"{f1:.4f}" if f1 is not None else "  -   "
+        print(f"{rank:>2}. eval_f1 {f1_text}  {record['status']:<9} {trials[record['trial']]}")
+    print(f"Leaderboard written to {report['sweep_dir']}/leaderboard.json")
+
+
+if __name__ == "__main__":
+    main()
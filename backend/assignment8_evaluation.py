@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import json
 import time
 from dataclasses import asdict, dataclass
 from pathlib import Path
@@ -10,18 +9,27 @@ import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import torch
-from datasets import Dataset, load_dataset
-from peft import PeftModel
+from datasets import Dataset
 from sklearn.metrics import accuracy_score, confusion_matrix, precision_recall_fscore_support
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from transformers import AutoTokenizer
 
+from adapter_pool import AdapterPool
 from assignment7_roberta import (
+    CHECKPOINTS_ROOT,
+    DEFAULT_DATASET_NAME,
     DEFAULT_MAX_LENGTH,
     DEFAULT_MODEL_NAME,
+    INFERENCE_PRECISIONS,
+    PIPELINE_CONFIG_NAME,
     SUBJ_TEST_PATH,
     _get_device,
-    _normalize_columns,
+    load_dataset_source,
+    named_adapter_path,
+    quantize_dynamic_int8,
+    resolve_checkpoint,
+    resolve_dataset_source,
 )
+from dataset_prep import class_counts, label_array, normalize_columns
 
 # Use a non-interactive backend for environments without a display server.
 matplotlib.use("Agg")
@@ -43,98 +51,63 @@ class Assignment8Evaluator:
     Computes macro metrics, a normalized confusion matrix, and light error analysis.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, adapter_pool: Optional[AdapterPool] = None) -> None:
         self.repo_root = Path(__file__).resolve().parent.parent
         self.public_dir = self.repo_root / "public"
-        self.checkpoints_root = Path(__file__).resolve().parent / "outputs" / "assignment7_roberta"
+        self.checkpoints_root = CHECKPOINTS_ROOT
         self.default_confusion_path = self.public_dir / "visualizations" / "static" / "assignment8_confusion_matrix.png"
         self.tokenizer = AutoTokenizer.from_pretrained(DEFAULT_MODEL_NAME)
         self.device = _get_device()
+        # A private pool, released after each evaluation: sharing the serving pool
+        # would hold its lock for the whole test set and evict served adapters.
+        self._owns_pool = adapter_pool is None
+        self.adapter_pool = adapter_pool or AdapterPool(
+            DEFAULT_MODEL_NAME,
+            self.device,
+            root=CHECKPOINTS_ROOT,
+            resolver=named_adapter_path,
+            max_adapters=1,
+            config_name=PIPELINE_CONFIG_NAME,
+        )
         self._cached_result: Optional[Dict[str, Any]] = None
         self._cache_key: Optional[Tuple[Any, ...]] = None
 
     def _resolve_checkpoint(self, checkpoint: Optional[str]) -> Path:
         """
-        Pick the best available adapter checkpoint based on eval_f1 recorded in trainer_state.json.
+        A requested checkpoint, confined to the checkpoints root; otherwise the best
+        available adapter checkpoint based on eval_f1 recorded in trainer_state.json.
         """
         if checkpoint:
-            preferred = (self.checkpoints_root / checkpoint).resolve()
-            if preferred.exists():
-                return preferred
-
-        best: Tuple[float, Path] | None = None
-        for state_path in self.checkpoints_root.glob("checkpoint-*/trainer_state.json"):
-            try:
-                state = json.loads(state_path.read_text())
-            except json.JSONDecodeError:
-                continue
-
-            log_history = state.get("log_history", [])
-            f1_scores = [entry["eval_f1"] for entry in log_history if "eval_f1" in entry]
-            if not f1_scores:
-                continue
-            candidate_f1 = max(f1_scores)
-            checkpoint_ref = state.get("best_model_checkpoint") or str(state_path.parent)
-            candidate_path = Path(checkpoint_ref)
-            if not candidate_path.is_absolute():
-                candidate_path = (self.repo_root / checkpoint_ref).resolve()
-
-            if not candidate_path.exists():
-                continue
-
-            if best is None or candidate_f1 > best[0]:
-                best = (candidate_f1, candidate_path)
-
-        if best:
-            return best[1]
-
-        fallback = self.checkpoints_root / "checkpoint-1125"
-        if fallback.exists():
-            return fallback
-
-        raise FileNotFoundError("No adapter checkpoint found in outputs/assignment7_roberta.")
-
-    @staticmethod
-    def _load_local_test_split() -> Dataset:
-        if SUBJ_TEST_PATH.exists():
-            ds = load_dataset("json", data_files={"test": str(SUBJ_TEST_PATH)})["test"]
-            return _normalize_columns(ds)
-        # Fall back to the small bundled sample if the cached test split is missing.
-        bundled = Path(__file__).resolve().parent / "data" / "assignment7" / "news_fact_opinion.jsonl"
-        ds = load_dataset("json", data_files={"test": str(bundled)})["test"]
-        return _normalize_columns(ds)
+            return named_adapter_path(checkpoint, self.checkpoints_root)
+        return resolve_checkpoint(None, self.checkpoints_root)
 
     def _load_test_dataset(
         self, dataset_name: Optional[str], seed: int, max_samples: Optional[int]
     ) -> Tuple[Dataset, Dict[str, Any]]:
-        notes: List[str] = []
-        dataset: Optional[Dataset] = None
-        source: str = "local"
-
-        if dataset_name:
-            try:
-                dataset = load_dataset(dataset_name, split="test")
-                notes.append(f"Loaded test split from hub dataset: {dataset_name}")
-                source = dataset_name
-            except Exception as exc:  # noqa: BLE001
-                notes.append(f"Fell back to cached local test split: {exc}")
-
-        if dataset is None:
-            dataset = self._load_local_test_split()
-            source = SUBJ_TEST_PATH.name if SUBJ_TEST_PATH.exists() else "news_fact_opinion.jsonl"
-
-        dataset = _normalize_columns(dataset)
+        # Same offline-first resolution as training: local files, hub only if enabled.
+        dataset, source = load_dataset_source(resolve_dataset_source(dataset_name), split="test")
+        notes: List[str] = list(source.notes)
+        if source.kind == "local" and "test" not in source.files:
+            # Single-split sources serve their training file for every split; never score on it.
+            held_out = resolve_dataset_source(DEFAULT_DATASET_NAME, allow_hub=False)
+            if "test" not in held_out.files:
+                raise FileNotFoundError(
+                    f"{source.name} has no held-out test split and {SUBJ_TEST_PATH.name} is missing."
+                )
+            notes.append(f"{source.name} has no held-out test split; evaluated on {SUBJ_TEST_PATH.name} instead.")
+            dataset, source = load_dataset_source(held_out, split="test")
+        local_file = source.files.get("test")
+        source_name = Path(local_file).name if local_file else source.name
+
+        dataset = normalize_columns(dataset)
         if max_samples and len(dataset) > max_samples:
             dataset = dataset.shuffle(seed=seed).select(range(max_samples))
             notes.append(f"Truncated test set to {len(dataset)} rows for quick evaluation.")
 
-        label_counts = {
-            "factual": int(sum(1 for label in dataset["label"] if label == 0)),
-            "opinion": int(sum(1 for label in dataset["label"] if label == 1)),
-        }
+        label_counts = class_counts(label_array(dataset))
 
         meta = {
-            "source": source,
+            "source": source_name,
             "num_rows": len(dataset),
             "class_distribution": label_counts,
             "notes": notes,
@@ -143,13 +116,15 @@ class Assignment8Evaluator:
 
     def _batch_predict(
         self,
-        model: PeftModel,
+        model: torch.nn.Module,
         dataset: Dataset,
         max_length: int,
         batch_size: int = 32,
+        device: Optional[torch.device] = None,
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        device = device or self.device
         texts = dataset["text"]
-        labels = np.array(dataset["label"], dtype=np.int64)
+        labels = label_array(dataset)
         all_probs: List[np.ndarray] = []
         model.eval()
 
@@ -162,7 +137,7 @@ class Assignment8Evaluator:
                 padding=True,
                 max_length=max_length,
                 return_tensors="pt",
-            ).to(self.device)
+            ).to(device)
 
             with torch.no_grad():
                 outputs = model(**encoded)
@@ -229,21 +204,34 @@ class Assignment8Evaluator:
         checkpoint: Optional[str] = None,
         seed: int = 42,
         max_samples: Optional[int] = None,
+        precision: str = "fp32",
     ) -> Dict[str, Any]:
-        cache_key = (dataset_name or "local", max_length, checkpoint or "auto", seed, max_samples or -1)
+        if precision not in INFERENCE_PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision} (expected one of {INFERENCE_PRECISIONS})")
+        cache_key = (dataset_name or "local", max_length, checkpoint or "auto", seed, max_samples or -1, precision)
         if self._cached_result and self._cache_key == cache_key:
             return self._cached_result
 
         start = time.time()
         checkpoint_path = self._resolve_checkpoint(checkpoint)
-        base_model = AutoModelForSequenceClassification.from_pretrained(
-            DEFAULT_MODEL_NAME,
-            num_labels=2,
-        )
-        peft_model = PeftModel.from_pretrained(base_model, checkpoint_path).to(self.device)
+        adapter_name = self.adapter_pool.register(checkpoint_path)
 
         test_dataset, dataset_meta = self._load_test_dataset(dataset_name, seed, max_samples)
-        preds, prob_array, labels = self._batch_predict(peft_model, test_dataset, max_length)
+        try:
+            if precision == "int8":
+                int8_model = self.adapter_pool.derived(adapter_name, "int8", quantize_dynamic_int8)
+                preds, prob_array, labels = self._batch_predict(
+                    int8_model, test_dataset, max_length, device=torch.device("cpu")
+                )
+            else:
+                with self.adapter_pool.use(adapter_name):
+                    preds, prob_array, labels = self._batch_predict(
+                        self.adapter_pool.model, test_dataset, max_length, device=self.adapter_pool.device
+                    )
+        finally:
+            if self._owns_pool:
+                # Only the serving pool's base model stays resident between evaluations.
+                self.adapter_pool.release()
 
         acc = accuracy_score(labels, preds)
         precision_macro, recall_macro, f1_macro, _ = precision_recall_fscore_support(
@@ -293,6 +281,7 @@ class Assignment8Evaluator:
         result = {
             "checkpoint": str(checkpoint_path.relative_to(self.repo_root)),
             "dataset": dataset_meta,
+            "precision": precision,
             "metrics": {
                 "accuracy": float(acc),
                 "precision_macro": float(precision_macro),
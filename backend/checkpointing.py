@@ -0,0 +1,165 @@
+# backend/checkpointing.py
+"""
+Cheaper checkpointing for the Assignment 7 LoRA runs.
+
+- CheckpointTrainer writes adapter-only checkpoints, with the safetensors
+  write handed to a background thread so the training loop does not wait on
+  disk.
+- CheckpointRetentionCallback keeps the best N checkpoints by eval F1 plus
+  the latest one. Only the latest keeps the optimizer, scheduler and RNG
+  state needed to resume.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+from peft import PeftModel
+from peft.utils import get_peft_model_state_dict
+from safetensors.torch import save_file
+from transformers import Trainer, TrainerCallback
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEEP_BEST_CHECKPOINTS = 2
+ADAPTER_WEIGHTS_NAME = "adapter_model.safetensors"
+TRAINING_ARGS_NAME = "training_args.bin"
+# Files only needed to resume training; dropped from all but the latest checkpoint.
+RESUME_STATE_PATTERNS = ("optimizer.pt", "scheduler.pt", "scaler.pt", "rng_state*.pth")
+
+
+class CheckpointTrainer(Trainer):
+    """
+    Trainer whose checkpoints hold only the LoRA adapter (no tokenizer copy).
+    The adapter tensors are snapshotted to CPU synchronously, then written by
+    a single background thread; `flush_checkpoints` waits for pending writes.
+    """
+
+    def __init__(self, *args: Any, async_checkpoint_writes: bool = True, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.async_checkpoint_writes = async_checkpoint_writes
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ckpt-writer")
+        self._pending: List[Future] = []
+        self.checkpoint_saves = 0
+        self.checkpoint_stall_s = 0.0
+
+    def submit_io(self, fn: Callable[..., Any], *args: Any) -> None:
+        """Run `fn` on the writer thread, after every write queued before it."""
+        if self.async_checkpoint_writes:
+            self._pending.append(self._io.submit(fn, *args))
+        else:
+            fn(*args)
+
+    def flush_checkpoints(self, shutdown: bool = False) -> None:
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+        if shutdown:
+            self._io.shutdown(wait=True)
+
+    def _save(self, output_dir: Optional[str] = None, state_dict: Any = None) -> None:
+        if not isinstance(self.model, PeftModel):
+            super()._save(output_dir, state_dict)
+            return
+        start = time.perf_counter()
+        output_dir = output_dir if output_dir is not None else self.args.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+        tensors = {
+            key: value.detach().to("cpu", copy=True).contiguous()
+            for key, value in get_peft_model_state_dict(self.model).items()
+        }
+        # Same config file PeftModel.save_pretrained writes (always in inference mode).
+        config = copy.deepcopy(self.model.peft_config[self.model.active_adapter])
+        config.inference_mode = True
+        config.save_pretrained(output_dir)
+        torch.save(self.args, os.path.join(output_dir, TRAINING_ARGS_NAME))
+        self.submit_io(save_file, tensors, os.path.join(output_dir, ADAPTER_WEIGHTS_NAME), {"format": "pt"})
+
+        self.checkpoint_saves += 1
+        self.checkpoint_stall_s += time.perf_counter() - start
+
+    def _load_best_model(self) -> None:
+        # The best checkpoint's weights may still be in the writer queue.
+        self.flush_checkpoints()
+        super()._load_best_model()
+
+    def checkpoint_stats(self) -> Dict[str, Any]:
+        return {
+            "saves": self.checkpoint_saves,
+            "async_writes": self.async_checkpoint_writes,
+            "stall_ms_total": round(self.checkpoint_stall_s * 1000, 1),
+            "stall_ms_per_save": round(self.checkpoint_stall_s * 1000 / self.checkpoint_saves, 1)
+            if self.checkpoint_saves
+            else 0.0,
+        }
+
+
+class CheckpointRetentionCallback(TrainerCallback):
+    """
+    After each save, keep the `keep_best` checkpoints with the highest eval
+    metric plus the latest one (for resume). Other checkpoints written by this
+    run are deleted, and the retained non-latest ones lose their resume state.
+    Checkpoints from earlier runs in the same directory are left alone.
+    """
+
+    def __init__(
+        self,
+        keep_best: int = DEFAULT_KEEP_BEST_CHECKPOINTS,
+        metric: str = "eval_f1",
+        run_io: Optional[Callable[..., None]] = None,
+    ) -> None:
+        self.keep_best = keep_best
+        self.metric = metric
+        self.run_io = run_io or (lambda fn, *args: fn(*args))
+        self.saved: List[int] = []
+        self.kept: List[str] = []
+
+    def _metric_by_step(self, log_history: List[Dict[str, Any]]) -> Dict[int, float]:
+        return {entry["step"]: entry[self.metric] for entry in log_history if self.metric in entry}
+
+    def on_save(self, args, state, control, **kwargs):
+        step = state.global_step
+        if step not in self.saved:
+            self.saved.append(step)
+        scores = self._metric_by_step(state.log_history)
+        ranked = sorted(
+            (s for s in self.saved if s in scores),
+            key=lambda s: (scores[s], s),
+            reverse=True,
+        )
+        keep = set(ranked[: self.keep_best])
+        keep.add(step)
+        if state.best_model_checkpoint:
+            best_name = Path(state.best_model_checkpoint).name
+            keep.update(s for s in self.saved if f"checkpoint-{s}" == best_name)
+
+        run_dir = Path(args.output_dir)
+        drop = [s for s in self.saved if s not in keep]
+        strip = [s for s in keep if s != step]
+        self.saved = [s for s in self.saved if s in keep]
+        self.kept = [str(run_dir / f"checkpoint-{s}") for s in sorted(keep)]
+        self.run_io(_apply_retention, run_dir, drop, strip)
+
+    def summary(self) -> Dict[str, Any]:
+        return {"keep_best": self.keep_best, "metric": self.metric, "kept": list(self.kept)}
+
+
+def _apply_retention(run_dir: Path, drop: List[int], strip: List[int]) -> None:
+    for step in drop:
+        shutil.rmtree(run_dir / f"checkpoint-{step}", ignore_errors=True)
+    for step in strip:
+        checkpoint = run_dir / f"checkpoint-{step}"
+        for pattern in RESUME_STATE_PATTERNS:
+            for path in checkpoint.glob(pattern):
+                path.unlink(missing_ok=True)
+    if drop:
+        logger.info("Checkpoint retention removed %s", [f"checkpoint-{s}" for s in drop])
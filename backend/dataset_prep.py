@@ -0,0 +1,102 @@
+# backend/dataset_prep.py
+"""
+Vectorized dataset preparation shared by Assignment 7 training and the
+Assignment 8 evaluator: label normalization on Arrow columns, index-based
+stratified sampling and bincount class distributions. Nothing here loops over
+rows in Python, so multi-million-row corpora prepare in seconds.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from datasets import ClassLabel, Dataset
+
+LABEL_NAMES = ["factual", "opinion"]
+TEXT_COLUMN_CANDIDATES = ["text", "sentence", "statement", "claim", "content"]
+LABEL_COLUMN_CANDIDATES = ["label", "labels", "target", "class"]
+FACTUAL_LABEL_STRINGS = ["factual", "fact", "objective"]
+OPINION_LABEL_STRINGS = ["opinion", "subjective"]
+
+
+def arrow_column(dataset: Dataset, name: str) -> pa.ChunkedArray:
+    """One column as Arrow, honouring any shuffle/select indices mapping."""
+    table = dataset.with_format("arrow", columns=[name])[:]
+    return table.column(name)
+
+
+def label_array(dataset: Dataset) -> np.ndarray:
+    """The `label` column as an int64 numpy array."""
+    return np.asarray(arrow_column(dataset, "label").to_numpy(), dtype=np.int64)
+
+
+def encode_labels(column: pa.ChunkedArray) -> np.ndarray:
+    """
+    Map a raw label column to 0 (factual) / 1 (opinion): bools and ints are
+    cast, strings are matched case-insensitively against the known names.
+    """
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    if column.null_count:
+        raise ValueError(f"Label column has {column.null_count} missing values.")
+
+    col_type = column.type
+    if pa.types.is_boolean(col_type) or pa.types.is_integer(col_type):
+        return np.asarray(column.cast(pa.int64()).to_numpy(), dtype=np.int64)
+    if pa.types.is_string(col_type) or pa.types.is_large_string(col_type):
+        lowered = pc.utf8_lower(column)
+        factual = np.asarray(pc.is_in(lowered, value_set=pa.array(FACTUAL_LABEL_STRINGS)).to_numpy(), dtype=bool)
+        opinion = np.asarray(pc.is_in(lowered, value_set=pa.array(OPINION_LABEL_STRINGS)).to_numpy(), dtype=bool)
+        unknown = ~(factual | opinion)
+        if unknown.any():
+            raise ValueError(f"Unrecognized label string: {column[int(np.argmax(unknown))].as_py()}")
+        return opinion.astype(np.int64)
+    raise ValueError(f"Unsupported label type: {col_type}")
+
+
+def normalize_columns(dataset: Dataset) -> Dataset:
+    """Ensure the dataset has `text` and `label` columns with binary labels."""
+    text_col = next((c for c in TEXT_COLUMN_CANDIDATES if c in dataset.column_names), None)
+    if text_col is None:
+        raise ValueError(f"No text column found in dataset columns: {dataset.column_names}")
+    label_col = next((c for c in LABEL_COLUMN_CANDIDATES if c in dataset.column_names), None)
+    if label_col is None:
+        raise ValueError(f"No label column found in dataset columns: {dataset.column_names}")
+
+    ds = dataset.rename_columns({text_col: "text", label_col: "label"})
+    labels = encode_labels(arrow_column(ds, "label"))
+
+    ds = ds.remove_columns([c for c in ("label", "label_text") if c in ds.column_names])
+    ds = ds.add_column("label", labels)
+    ds = ds.add_column("label_text", np.where(labels == 1, LABEL_NAMES[1], LABEL_NAMES[0]).tolist())
+    # Stratified splits require a ClassLabel column; cast after normalization.
+    return ds.cast_column("label", ClassLabel(names=LABEL_NAMES))
+
+
+def stratified_indices(labels: np.ndarray, per_class: int, seed: int) -> np.ndarray:
+    """
+    Row indices with at most `per_class` rows of each class, drawn uniformly
+    without replacement and returned in shuffled order.
+    """
+    rng = np.random.default_rng(seed)
+    picked: List[np.ndarray] = []
+    for value in np.unique(labels):
+        members = np.flatnonzero(labels == value)
+        take = min(len(members), per_class)
+        picked.append(rng.choice(members, size=take, replace=False))
+    indices = np.concatenate(picked) if picked else np.empty(0, dtype=np.int64)
+    return rng.permutation(indices)
+
+
+def class_counts(labels: np.ndarray, names: Optional[List[str]] = None) -> Dict[str, int]:
+    names = names or LABEL_NAMES
+    counts = np.bincount(labels, minlength=len(names))
+    return {name: int(counts[idx]) for idx, name in enumerate(names)}
+
+
+def class_distribution(labels: np.ndarray, names: Optional[List[str]] = None) -> Dict[str, int]:
+    """Per-class counts plus `total`, as reported in dataset metadata."""
+    return {**class_counts(labels, names), "total": int(len(labels))}
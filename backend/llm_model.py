@@ -1,17 +1,21 @@
 # backend/llm_model.py
 
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
 import os
+import queue
 import sys
+import threading
+import time
+from typing import Iterator, List, Optional
 
-print("[llm_model] sys.executable:", sys.executable)
-print("[llm_model] CUDA_VISIBLE_DEVICES:",
-      os.environ.get("CUDA_VISIBLE_DEVICES"))
-print("[llm_model] torch version:", torch.__version__)
-print("[llm_model] torch.version.cuda:", torch.version.cuda)
-print("[llm_model] torch.cuda.is_available():", torch.cuda.is_available())
-
+from tracing import current_trace, stage
 
 # Small but modern chat model
 MODEL_NAME = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
@@ -26,31 +30,48 @@ else:
     DEVICE = "cpu"
     MODEL_KWARGS = {}
 
-print(f"[llm_model] Using device: {DEVICE}")
+# Loaded on first use (or by the API's startup hook), not at import: spawned
+# workers and CLIs that import this module transitively must not pay for a
+# full TinyLlama.
+tokenizer = None
+model = None
+_load_lock = threading.Lock()
 
-# Use fast tokenizer (no sentencepiece python package needed)
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
 
-# Ensure we have a pad token
-if tokenizer.pad_token is None:
-    tokenizer.pad_token = tokenizer.eos_token
+def load_model():
+    """Load the tokenizer and model once; returns (tokenizer, model)."""
+    global tokenizer, model
+    with _load_lock:
+        if model is None:
+            print("[llm_model] sys.executable:", sys.executable)
+            print("[llm_model] CUDA_VISIBLE_DEVICES:",
+                  os.environ.get("CUDA_VISIBLE_DEVICES"))
+            print("[llm_model] torch version:", torch.__version__)
+            print("[llm_model] torch.version.cuda:", torch.version.cuda)
+            print("[llm_model] torch.cuda.is_available():", torch.cuda.is_available())
+            print(f"[llm_model] Using device: {DEVICE}")
 
-# Load the model in standard precision
-# If you have GPU, you can use float16; otherwise default dtype is fine.
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME, **MODEL_KWARGS).to(DEVICE)
+            # Use fast tokenizer (no sentencepiece python package needed)
+            tok = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
 
-model.eval()
+            # Ensure we have a pad token
+            if tok.pad_token is None:
+                tok.pad_token = tok.eos_token
 
+            # Load the model in standard precision
+            # If you have GPU, you can use float16; otherwise default dtype is fine.
+            llm = AutoModelForCausalLM.from_pretrained(
+                MODEL_NAME, **MODEL_KWARGS).to(DEVICE)
+            llm.eval()
+            tokenizer, model = tok, llm
+    return tokenizer, model
 
-def generate_text(
-    prompt: str,
-    max_new_tokens: int = 60,   # lower default
-    temperature: float = 0.4,   # safer default
-    top_p: float = 0.9,
-    do_sample: bool = True,
-    repetition_penalty: float = 1.05,
-) -> str:
+
+# Longest wait for the next streamed piece before the stream is abandoned.
+STREAM_TOKEN_TIMEOUT_S = float(os.environ.get("LLM_STREAM_TOKEN_TIMEOUT_S", "60"))
+
+
+def _build_full_prompt(prompt: str) -> str:
     if not prompt:
         raise ValueError("Prompt must not be empty.")
 
@@ -59,15 +80,59 @@ def generate_text(
         "Answer the following question clearly and concisely."
     )
 
-    full_prompt = (
+    return (
         system_instruction
         + "\n\nQuestion:\n"
         + prompt.strip()
         + "\n\nAnswer:"
     )
 
-    inputs = tokenizer(full_prompt, return_tensors="pt").to(DEVICE)
 
+class _FirstTokenTimer(StoppingCriteria):
+    """
+    Never stops generation; records when the first new token is ready, which
+    splits generate() into prefill (prompt forward pass) and decode.
+    """
+
+    def __init__(self) -> None:
+        self.first_token_at: float | None = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+class _StopOnEvent(StoppingCriteria):
+    """Stops generation once `event` is set (client gone, timeout, consumer closed)."""
+
+    def __init__(self, event: threading.Event) -> None:
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+def generate_text(
+    prompt: str,
+    max_new_tokens: int = 60,   # lower default
+    temperature: float = 0.4,   # safer default
+    top_p: float = 0.9,
+    do_sample: bool = True,
+    repetition_penalty: float = 1.05,
+) -> str:
+    full_prompt = _build_full_prompt(prompt)
+    tokenizer, model = load_model()
+
+    with stage("tokenize"):
+        inputs = tokenizer(full_prompt, return_tensors="pt").to(DEVICE)
+
+    # Only hook generation when a trace is active, so untraced calls are unchanged.
+    trace = current_trace()
+    timer = _FirstTokenTimer() if trace is not None else None
+    extra_kwargs = {"stopping_criteria": StoppingCriteriaList([timer])} if timer is not None else {}
+
+    started = time.perf_counter()
     with torch.no_grad():
         output_ids = model.generate(
             **inputs,
@@ -77,11 +142,91 @@ def generate_text(
             do_sample=do_sample,
             repetition_penalty=repetition_penalty,
             pad_token_id=tokenizer.pad_token_id,
+            **extra_kwargs,
         )
 
-    full_text = tokenizer.decode(output_ids[0], skip_special_tokens=True)
+    if trace is not None and timer is not None:
+        finished = time.perf_counter()
+        first = timer.first_token_at or finished
+        prompt_tokens = int(inputs["input_ids"].shape[1])
+        trace.add_time("prefill", first - started)
+        trace.add_time("decode", finished - first)
+        trace.add_count("prompt_tokens", prompt_tokens)
+        trace.add_count("completion_tokens", int(output_ids.shape[1]) - prompt_tokens)
+
+    with stage("detokenize"):
+        full_text = tokenizer.decode(output_ids[0], skip_special_tokens=True)
 
     if "Answer:" in full_text:
         full_text = full_text.split("Answer:", 1)[1]
 
     return full_text.strip()
+
+
+def generate_text_stream(
+    prompt: str,
+    max_new_tokens: int = 60,
+    temperature: float = 0.4,
+    top_p: float = 0.9,
+    do_sample: bool = True,
+    repetition_penalty: float = 1.05,
+    stop_event: Optional[threading.Event] = None,
+) -> Iterator[str]:
+    """
+    Same as generate_text(), but yields decoded text pieces as tokens are produced.
+    Generation runs on a background thread; only the new (answer) tokens are yielded.
+    Setting `stop_event` (e.g. on client disconnect) ends generation early; an
+    exception in the generation thread is re-raised here.
+    """
+    full_prompt = _build_full_prompt(prompt)
+    tokenizer, model = load_model()
+
+    with stage("tokenize"):
+        inputs = tokenizer(full_prompt, return_tensors="pt").to(DEVICE)
+    streamer = TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TOKEN_TIMEOUT_S
+    )
+    stop_event = stop_event or threading.Event()
+    errors: List[BaseException] = []
+
+    def _run() -> None:
+        try:
+            with torch.no_grad():
+                model.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    do_sample=do_sample,
+                    repetition_penalty=repetition_penalty,
+                    pad_token_id=tokenizer.pad_token_id,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_StopOnEvent(stop_event)]),
+                )
+        except BaseException as exc:  # noqa: BLE001
+            errors.append(exc)
+            # Unblock the consumer; the error is raised on its side.
+            streamer.end()
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+
+    leading = True
+    try:
+        for piece in streamer:
+            if leading:
+                # Match generate_text(), which strips leading whitespace from the answer.
+                piece = piece.lstrip()
+                if not piece:
+                    continue
+                leading = False
+            yield piece
+    except queue.Empty as exc:
+        raise TimeoutError(f"No token generated within {STREAM_TOKEN_TIMEOUT_S:.0f}s.") from exc
+    finally:
+        # Consumer done, closed early or timed out: stop decoding either way.
+        stop_event.set()
+
+    thread.join()
+    if errors:
+        raise RuntimeError(f"Generation failed: {errors[0]}") from errors[0]
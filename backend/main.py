@@ -1,17 +1,49 @@
 from __future__ import annotations
+import os
+import sys
+
+if __name__ == "__main__":
+    # `python main.py`: serve through uvicorn's module entry point so this file
+    # is only ever imported as "main". Spawned children (embedding worker,
+    # training jobs) re-run a __main__ *script* as __mp_main__, which would load
+    # TinyLlama, the pipelines and the job manager again in every child.
+    os.execv(
+        sys.executable,
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+         "--host", "0.0.0.0", "--port", "8000"],
+    )
+
+import json
+import threading
+import time
 from dataclasses import asdict
-from fastapi import FastAPI, HTTPException
+from pathlib import Path
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 import numpy as np
 #from mnist_fnn import train_and_evaluate_api, predict_digit
-from typing import List, Optional
-import os
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
 
-from llm_model import generate_text
-from assignment7_roberta import RobertaLoraPipeline
+from llm_model import generate_text, load_model
+from assignment7_roberta import RobertaLoraPipeline, shared_adapter_pool
+from assignment7_serving import missing_dependencies
 from assignment8_evaluation import Assignment8Evaluator
-from rag_dnd import rag_dnd_answer
+from training_jobs import TrainingJob, TrainingJobLimitError, TrainingJobManager
+from tracing import end_trace, latency_histograms, should_trace, start_trace
+from rag_dnd import (
+    DEFAULT_COLLECTION,
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    DEFAULT_EXTRACTIVE_SCORE,
+    DEFAULT_MIN_SCORE,
+    EMBED_WORKER_BACKEND,
+    get_embed_worker,
+    kb_collections,
+    rag_dnd_answer,
+    rag_dnd_answer_stream,
+)
 
 
 app = FastAPI(title="AD331 AI Course Backend", version="1.0.0")
@@ -25,6 +57,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+UNMATCHED_ROUTE_LABEL = "<unmatched>"
+
+
+@app.middleware("http")
+async def record_endpoint_latency(request: Request, call_next):
+    """Feed whole-request latency into the per-endpoint histograms."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        # call_next returns once headers are sent; SSE endpoints record their
+        # own total when the stream finishes.
+        return response
+    # Key by route template (/api/assignment7/train/{job_id}), not the raw path,
+    # so ids and 404 probes cannot grow the histogram set without bound.
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", None) or UNMATCHED_ROUTE_LABEL
+    latency_histograms.observe(endpoint, "total", (time.perf_counter() - start) * 1000)
+    return response
+
+
 # Pydantic models
 class Assignment(BaseModel):
     assignment_number: int
@@ -47,6 +100,31 @@ class LLMGenerateRequest(BaseModel):
 
 class RAGRulesRequest(BaseModel):
     question: str
+    collection: str = Field(
+        DEFAULT_COLLECTION,
+        description="Name of the indexed corpus to answer from (see /api/assignment5/rag-dnd/collections).",
+    )
+    min_score: float = Field(
+        DEFAULT_MIN_SCORE,
+        ge=-1.0,
+        le=1.0,
+        description="Minimum retrieval similarity; below it the canonical refusal is returned without generation.",
+    )
+    extractive: bool = Field(
+        False,
+        description="Return the best-matching rule sentence directly when retrieval confidence is very high.",
+    )
+    extractive_score: float = Field(
+        DEFAULT_EXTRACTIVE_SCORE,
+        ge=-1.0,
+        le=1.0,
+        description="Top retrieval similarity at which the extractive path is taken.",
+    )
+    context_token_budget: Optional[int] = Field(
+        None,
+        ge=16,
+        description=f"Opt-in token budget for packed reference text (MMR + dedup + sentence trimming), e.g. {DEFAULT_CONTEXT_TOKEN_BUDGET}; null (default) sends chunks as retrieved.",
+    )
 
 
 class RAGChunk(BaseModel):
@@ -59,6 +137,15 @@ class RAGRulesResponse(BaseModel):
     question: str
     answer: str
     retrieved_chunks: List[RAGChunk]
+    cached: bool = False
+    path: str = Field(
+        "generated",
+        description="How the answer was produced: refused, extractive, cached, or generated.",
+    )
+    debug: Optional[dict] = Field(
+        None,
+        description="Per-stage timings and token counts; only set when the X-RAG-Debug header is sent.",
+    )
 
 class LLMGenerateResponse(BaseModel):
     prompt: str
@@ -91,7 +178,7 @@ class PredictResponse(BaseModel):
 class Assignment7TrainRequest(BaseModel):
     dataset_name: Optional[str] = Field(
         "SetFit/subj",
-        description="Hugging Face dataset name. Defaults to SetFit/subj; leave blank to use the bundled fallback.",
+        description="Dataset name. SetFit/subj resolves to the local copy; other names need ASSIGNMENT7_ALLOW_HUB=1, otherwise the bundled sample is used.",
     )
     max_samples: int = Field(
         1000,
@@ -115,10 +202,65 @@ class Assignment7TrainRequest(BaseModel):
         0.5, ge=0.0, le=1.0, description="Probability threshold for predicting opinion."
     )
     seed: int = Field(42, description="Seed for shuffling/splitting.")
+    keep_best_checkpoints: int = Field(
+        2, ge=1, le=20, description="Checkpoints kept by eval F1 (the latest is always kept for resume)."
+    )
+    bf16: bool = Field(False, description="bf16 autocast mixed precision (CPU or GPU).")
+    gradient_checkpointing: bool = Field(
+        False, description="Recompute activations in backward to cut activation memory (slower per step)."
+    )
+    auto_batch_size: bool = Field(
+        False,
+        description="Pick the largest per-device batch whose estimated activations fit in memory; gradient accumulation keeps the effective batch size.",
+    )
+    memory_budget_mb: Optional[float] = Field(
+        None, gt=0, description="Activation memory budget for auto_batch_size (default: half of free memory)."
+    )
 
 
 class Assignment7PredictRequest(BaseModel):
     text: str = Field(..., description="News statement to classify as factual vs opinion.")
+    precision: Optional[Literal["fp32", "int8"]] = Field(
+        None, description="fp32, or int8 dynamic quantization (CPU). Defaults to ASSIGNMENT7_PRECISION."
+    )
+    adapter: Optional[str] = Field(
+        None,
+        description="Adapter to serve this request: a checkpoint under outputs/assignment7_roberta (e.g., checkpoint-20) or a loaded adapter name. Blank uses the default adapter.",
+    )
+    use_cache: bool = Field(True, description="Serve repeated texts from the prediction cache.")
+
+
+class Assignment7PredictBatchRequest(BaseModel):
+    texts: List[str] = Field(
+        ...,
+        min_length=1,
+        max_length=2048,
+        description="News statements to classify; results are returned in the same order.",
+    )
+    batch_size: int = Field(32, ge=1, le=256, description="Texts per forward pass.")
+    precision: Optional[Literal["fp32", "int8"]] = Field(
+        None, description="fp32, or int8 dynamic quantization (CPU). Defaults to ASSIGNMENT7_PRECISION."
+    )
+    adapter: Optional[str] = Field(
+        None,
+        description="Adapter to serve this request: a checkpoint under outputs/assignment7_roberta (e.g., checkpoint-20) or a loaded adapter name. Blank uses the default adapter.",
+    )
+    adapters: Optional[List[Optional[str]]] = Field(
+        None,
+        description="Per-text adapters (same length as texts); overrides `adapter`. Texts are grouped by adapter.",
+    )
+    use_cache: bool = Field(True, description="Serve repeated texts from the prediction cache.")
+
+class Assignment7LoadRequest(BaseModel):
+    checkpoint: Optional[str] = Field(
+        None,
+        description="Checkpoint directory under outputs/assignment7_roberta (e.g., checkpoint-20). Leave blank to auto-select best eval_f1.",
+    )
+
+class Assignment7ExportRequest(BaseModel):
+    format: Literal["torchscript", "onnx"] = Field(
+        "torchscript", description="Artifact format: traced TorchScript or ONNX."
+    )
 
 class Assignment8EvalRequest(BaseModel):
     checkpoint: Optional[str] = Field(
@@ -127,7 +269,7 @@ class Assignment8EvalRequest(BaseModel):
     )
     dataset_name: Optional[str] = Field(
         None,
-        description="Optional HF dataset name to pull the test split from. Defaults to the cached Assignment 7 test split.",
+        description="Optional dataset name to pull the test split from (resolved like training: local first, hub only if enabled). Defaults to the cached Assignment 7 test split.",
     )
     max_length: int = Field(256, ge=64, le=512, description="Max token length for evaluation.")
     seed: int = Field(42, description="Shuffle seed for any sampling.")
@@ -136,12 +278,55 @@ class Assignment8EvalRequest(BaseModel):
         ge=10,
         description="Optional cap on the number of test rows to evaluate (useful for quick smoke tests).",
     )
+    precision: Literal["fp32", "int8"] = Field(
+        "fp32", description="Evaluate the fp32 model or its int8 dynamic-quantized (merged) variant."
+    )
 
 # --- Data ---
 assignment_modules: dict = {}  # Placeholder for assignment module data
 assignment7_runner = RobertaLoraPipeline()
 assignment8_evaluator = Assignment8Evaluator()
 
+
+# startup: load the saved adapter when the app starts; lazy: on the first
+# predict/export request; off: only after /train or /load.
+ASSIGNMENT7_AUTOLOAD = os.environ.get("ASSIGNMENT7_AUTOLOAD", "lazy").lower()
+
+
+def _serve_trained_adapter(job: TrainingJob, result: dict) -> None:
+    # Swap the freshly trained adapter into the predict endpoints.
+    assignment7_runner.load_adapter(Path(result["adapter_dir"]))
+
+
+training_jobs = TrainingJobManager(on_success=_serve_trained_adapter)
+
+
+def _require_assignment7_model() -> None:
+    ready = assignment7_runner.trained
+    if not ready and ASSIGNMENT7_AUTOLOAD != "off":
+        try:
+            ready = assignment7_runner.ensure_ready()
+        except Exception as exc:  # noqa: BLE001
+            raise HTTPException(status_code=500, detail=f"Loading saved adapter failed: {exc}") from exc
+    if not ready:
+        raise HTTPException(
+            status_code=400,
+            detail="No model available. Run /api/assignment7/train or /api/assignment7/load first.",
+        )
+
+
+@app.on_event("startup")
+def _load_llm() -> None:
+    # TinyLlama loads with the server, as before, but not on import, so
+    # processes that import this module indirectly do not load it.
+    load_model()
+
+
+@app.on_event("startup")
+def _load_assignment7_adapter() -> None:
+    if ASSIGNMENT7_AUTOLOAD == "startup":
+        assignment7_runner.ensure_ready()
+
 # --- Endpoints ---
 
 @app.get("/")
@@ -347,15 +532,36 @@ def run_test_cases():
     return experiments
 
 @app.post("/api/assignment5/rag-dnd", response_model=RAGRulesResponse)
-def rag_dnd_endpoint(req: RAGRulesRequest):
+def rag_dnd_endpoint(
+    req: RAGRulesRequest,
+    x_rag_debug: Optional[str] = Header(None, alias="X-RAG-Debug"),
+):
     """
     Assignment 5 / RAG demo:
     Answer D&D 2024 rules questions using a small RAG pipeline.
+    Send `X-RAG-Debug: 1` to get per-stage timings and token counts back.
     """
     if not req.question.strip():
         raise HTTPException(status_code=400, detail="Question must not be empty.")
 
-    result = rag_dnd_answer(req.question, k=3)
+    debug_requested = bool(x_rag_debug) and x_rag_debug.lower() not in {"0", "false", "no"}
+    trace = start_trace() if should_trace(debug_requested) else None
+    try:
+        result = rag_dnd_answer(
+            req.question,
+            k=3,
+            collection=req.collection,
+            min_score=req.min_score,
+            extractive=req.extractive,
+            extractive_score=req.extractive_score,
+            context_token_budget=req.context_token_budget,
+        )
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    finally:
+        if trace is not None:
+            end_trace()
+            latency_histograms.observe_trace("/api/assignment5/rag-dnd", trace)
 
     # Shape result into the Pydantic response
     chunks = [
@@ -367,35 +573,248 @@ def rag_dnd_endpoint(req: RAGRulesRequest):
         question=result["question"],
         answer=result["answer"],
         retrieved_chunks=chunks,
+        cached=result["cached"],
+        path=result["path"],
+        debug=trace.to_dict() if trace is not None and debug_requested else None,
+    )
+
+
+@app.post("/api/assignment5/rag-dnd/stream")
+async def rag_dnd_stream_endpoint(req: RAGRulesRequest, request: Request):
+    """
+    Streaming variant of /api/assignment5/rag-dnd (Server-Sent Events):
+    a `retrieval` event with the chunks as soon as retrieval finishes, `token`
+    events as the answer is decoded, then a `done` event with timings, or an
+    `error` event if generation fails part-way.
+    Generation stops as soon as the client disconnects.
+    """
+    if not req.question.strip():
+        raise HTTPException(status_code=400, detail="Question must not be empty.")
+    if req.collection not in kb_collections.names():
+        raise HTTPException(status_code=404, detail=f"Unknown RAG collection: {req.collection}")
+
+    stop_event = threading.Event()
+    events = rag_dnd_answer_stream(
+        req.question,
+        k=3,
+        collection=req.collection,
+        min_score=req.min_score,
+        extractive=req.extractive,
+        extractive_score=req.extractive_score,
+        context_token_budget=req.context_token_budget,
+        stop_event=stop_event,
+    )
+
+    async def _events():
+        endpoint = "/api/assignment5/rag-dnd/stream"
+        start = time.perf_counter()
+        trace = start_trace() if should_trace(False) else None
+        # Retrieval and decoding block, so the sync generator runs in the threadpool.
+        try:
+            async for event in iterate_in_threadpool(events):
+                if await request.is_disconnected():
+                    break
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except Exception as exc:  # noqa: BLE001
+            # Headers are already sent, so the failure has to travel in-band.
+            yield f"event: error\ndata: {json.dumps({'detail': f'RAG generation failed: {exc}'})}\n\n"
+        finally:
+            stop_event.set()
+            if trace is not None:
+                end_trace()
+                latency_histograms.observe_trace(endpoint, trace)
+            latency_histograms.observe(endpoint, "total", (time.perf_counter() - start) * 1000)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@app.post("/api/assignment7/train")
+@app.get("/api/metrics/latency")
+def latency_metrics():
+    """
+    Endpoint-level latency histograms (whole request plus traced RAG stages).
+    """
+    return latency_histograms.snapshot()
+
+
+@app.get("/api/assignment5/rag-dnd/collections")
+def rag_dnd_collections():
+    """
+    List registered RAG collections with their load state and resident memory.
+    """
+    return kb_collections.stats()
+
+
+@app.get("/api/assignment5/rag-dnd/embedder")
+def rag_dnd_embedder():
+    """
+    Query-embedding worker stats (backend, batches, mean batch size).
+    """
+    if EMBED_WORKER_BACKEND == "off":
+        return {"backend": "off"}
+    return get_embed_worker().stats()
+
+
+@app.post("/api/assignment7/train", status_code=202)
 def assignment7_train(req: Assignment7TrainRequest):
     """
     Assignment 7: Fine-tune RoBERTa with LoRA to separate factual vs opinion statements.
+    Starts a background training job and returns its id immediately; follow it via
+    /api/assignment7/train/{job_id} or the /events SSE stream. On success the new
+    adapter is served by the predict endpoints.
     """
     try:
-        result = assignment7_runner.train(
-            dataset_name=req.dataset_name,
-            seed=req.seed,
-            max_samples=req.max_samples,
-            num_train_epochs=req.num_train_epochs,
-            learning_rate=req.learning_rate,
-            weight_decay=req.weight_decay,
-            warmup_ratio=req.warmup_ratio,
-            label_smoothing=req.label_smoothing,
-            per_device_train_batch_size=req.per_device_train_batch_size,
-            gradient_accumulation_steps=req.gradient_accumulation_steps,
-            max_length=req.max_length,
-            lora_r=req.lora_r,
-            lora_alpha=req.lora_alpha,
-            lora_dropout=req.lora_dropout,
-            classification_threshold=req.classification_threshold,
+        job = training_jobs.submit(req.model_dump())
+    except TrainingJobLimitError as exc:
+        raise HTTPException(status_code=429, detail=str(exc)) from exc
+    except Exception as exc:  # noqa: BLE001
+        raise HTTPException(status_code=500, detail=f"Assignment 7 training failed to start: {exc}") from exc
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/assignment7/train/{job.id}",
+        "events_url": f"/api/assignment7/train/{job.id}/events",
+    }
+
+
+@app.get("/api/assignment7/train")
+def assignment7_train_jobs():
+    """
+    Recent training jobs (newest first), without their full results.
+    """
+    return {"jobs": training_jobs.list_jobs(), "max_concurrent": training_jobs.max_concurrent}
+
+
+@app.get("/api/assignment7/train/{job_id}")
+def assignment7_train_status(job_id: str):
+    """
+    Status, latest step/loss, eval history and (once finished) the training result.
+    """
+    try:
+        return training_jobs.get(job_id).summary()
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=f"Unknown training job: {job_id}") from exc
+
+
+@app.get("/api/assignment7/train/{job_id}/events")
+def assignment7_train_events(job_id: str):
+    """
+    Server-Sent Events for a training job: `status`, `progress` (step, loss),
+    `eval` (per-epoch metrics) and a final `done` event with the result or error.
+    Replays from the start, so late subscribers see the full history.
+    """
+    try:
+        training_jobs.get(job_id)
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=f"Unknown training job: {job_id}") from exc
+
+    def _events():
+        since = 0
+        while True:
+            try:
+                events, done = training_jobs.wait_events(job_id, since)
+            except KeyError:
+                return
+            for event in events:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+            since += len(events)
+            if done and not events:
+                return
+            if not events:
+                # Keep proxies from closing an idle stream between log steps.
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/assignment7/train/{job_id}/cancel")
+def assignment7_train_cancel(job_id: str):
+    """
+    Stop a running training job: the worker stops at its next step, and is
+    terminated if it is still running after ASSIGNMENT7_CANCEL_GRACE_S.
+    """
+    try:
+        job = training_jobs.cancel(job_id)
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=f"Unknown training job: {job_id}") from exc
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.post("/api/assignment7/load")
+def assignment7_load(req: Assignment7LoadRequest):
+    """
+    Serve a saved adapter without training: the named checkpoint, or the best by eval_f1.
+    """
+    try:
+        path = assignment7_runner.load_saved_adapter(req.checkpoint)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except Exception as exc:  # noqa: BLE001
+        raise HTTPException(status_code=500, detail=f"Loading adapter failed: {exc}") from exc
+    return {
+        "adapter": assignment7_runner.adapter_name,
+        "adapter_source": str(path),
+        "trained": assignment7_runner.trained,
+    }
+
+
+@app.get("/api/assignment7/status")
+def assignment7_status():
+    """
+    Whether the classifier can serve predictions, and which adapter it serves.
+    """
+    return {
+        "ready": assignment7_runner.trained,
+        "adapter": assignment7_runner.adapter_name,
+        "adapter_source": assignment7_runner.adapter_source,
+        "autoload": ASSIGNMENT7_AUTOLOAD,
+        "prediction_cache": assignment7_runner.prediction_cache.stats(),
+    }
+
+
+@app.get("/api/assignment7/cache")
+def assignment7_cache():
+    """
+    Prediction cache hit/miss stats. Cleared automatically on retrain or adapter swap.
+    """
+    return assignment7_runner.prediction_cache.stats()
+
+
+@app.get("/api/assignment7/adapters")
+def assignment7_adapters():
+    """
+    Adapters resident on the shared base model (most recently used first) and LRU stats.
+    """
+    return shared_adapter_pool().stats()
+
+
+@app.post("/api/assignment7/export")
+def assignment7_export(req: Assignment7ExportRequest):
+    """
+    Export the trained classifier (LoRA merged into the base) as an inference-only
+    artifact under outputs/assignment7_export, servable via assignment7_serving.
+    """
+    missing = missing_dependencies(req.format)
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{req.format} export is unavailable: {', '.join(missing)} not installed.",
         )
-        return result
+    _require_assignment7_model()
+    output_dir = Path("outputs") / "assignment7_export" / f"{req.format}-{time.strftime('%Y%m%d-%H%M%S')}"
+    try:
+        return assignment7_runner.export_artifact(output_dir, fmt=req.format)
     except Exception as exc:  # noqa: BLE001
-        raise HTTPException(status_code=500, detail=f"Assignment 7 training failed: {exc}") from exc
+        raise HTTPException(status_code=500, detail=f"Assignment 7 export failed: {exc}") from exc
 
 
 @app.post("/api/assignment7/predict")
@@ -406,15 +825,49 @@ def assignment7_predict(req: Assignment7PredictRequest):
     if not req.text.strip():
         raise HTTPException(status_code=400, detail="Text must not be empty.")
 
-    if not assignment7_runner.trained:
-        raise HTTPException(
-            status_code=400,
-            detail="Model not trained yet. Please run the /api/assignment7/train endpoint first.",
-        )
+    if not req.adapter:
+        _require_assignment7_model()
 
     try:
-        pred = assignment7_runner.predict(req.text)
+        pred = assignment7_runner.predict(
+            req.text, precision=req.precision, adapter=req.adapter, use_cache=req.use_cache
+        )
         return asdict(pred)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except Exception as exc:  # noqa: BLE001
+        raise HTTPException(status_code=500, detail=f"Inference failed: {exc}") from exc
+
+
+@app.post("/api/assignment7/predict-batch")
+def assignment7_predict_batch(req: Assignment7PredictBatchRequest):
+    """
+    Assignment 7 bulk inference: classify many statements in length-bucketed batches.
+    """
+    if any(not text.strip() for text in req.texts):
+        raise HTTPException(status_code=400, detail="Texts must not be empty.")
+
+    adapters = req.adapters if req.adapters is not None else [req.adapter] * len(req.texts)
+    if len(adapters) != len(req.texts):
+        raise HTTPException(status_code=400, detail="adapters must have one entry per text.")
+    if not all(adapters):
+        _require_assignment7_model()
+
+    try:
+        preds = assignment7_runner.predict_batch(
+            req.texts,
+            batch_size=req.batch_size,
+            precision=req.precision,
+            adapter=adapters,
+            use_cache=req.use_cache,
+        )
+        return {"predictions": [asdict(pred) for pred in preds]}
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=f"Inference failed: {exc}") from exc
 
@@ -432,11 +885,11 @@ def assignment8_evaluate(req: Assignment8EvalRequest):
             checkpoint=req.checkpoint,
             seed=req.seed,
             max_samples=req.max_samples,
+            precision=req.precision,
         )
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=f"Assignment 8 evaluation failed: {exc}") from exc
-
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,102 @@
+# backend/prediction_cache.py
+"""
+LRU cache of Assignment 7 class probabilities.
+
+News feeds repeat headlines and boilerplate sentences, and each repeat would
+otherwise cost a full RoBERTa forward pass. Entries are keyed by a hash of the
+NFC-normalized text plus the model id (adapter and version), max_length and
+precision. Probabilities are stored rather than labels, so changing the
+classification threshold does not invalidate anything.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 4096
+
+CacheKey = Tuple[str, int, str, bytes]
+
+
+def normalize_text(text: str) -> str:
+    """
+    NFC only. Whitespace and case are kept: roberta's BPE folds leading spaces
+    and newlines into its tokens, so texts differing in either can score differently.
+    """
+    return unicodedata.normalize("NFC", text)
+
+
+class PredictionCache:
+    """Thread-safe LRU map from (model id, max_length, precision, NFC text hash) to probabilities."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max(0, max_entries)
+        self._entries: "OrderedDict[CacheKey, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.clears = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(text: str, model_id: str, max_length: int, precision: str) -> CacheKey:
+        """Cache key for `text`: hashed after NFC only, so whitespace differences are distinct keys."""
+        digest = hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).digest()
+        return (model_id, max_length, precision, digest)
+
+    def get_many(self, keys: List[CacheKey]) -> List[Optional[np.ndarray]]:
+        found: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key in keys:
+                probs = self._entries.get(key)
+                if probs is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                found.append(probs)
+        return found
+
+    def put_many(self, keys: List[CacheKey], probs: np.ndarray) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            for key, row in zip(keys, probs):
+                self._entries[key] = np.array(row, dtype=np.float32)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, model_id: Optional[str] = None) -> None:
+        """Drop every entry, or only those produced by `model_id`."""
+        with self._lock:
+            if model_id is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == model_id]:
+                    del self._entries[key]
+            self.clears += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "clears": self.clears,
+            }
@@ -0,0 +1,427 @@
+# backend/rag_benchmark.py
+"""
+Offline retrieval quality + latency benchmarks for the D&D rules RAG pipeline.
+
+Run (from backend/):
+    python rag_benchmark.py                      # stub LLM, fast + deterministic
+    python rag_benchmark.py --llm tinyllama      # real generation latency
+    python rag_benchmark.py --compare outputs/rag_benchmark/run-A.json
+    python rag_benchmark.py --llm tinyllama --packing-k 5   # prompt/latency gain of context packing
+
+Each run is written as JSON under outputs/rag_benchmark/ so runs can be diffed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from rag_dnd import (
+    BACKEND_DIR,
+    DEFAULT_COLLECTION,
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    KBIndex,
+    REFUSAL_TEXT,
+    embed_query,
+    ensure_kb_index,
+    kb_collections,
+    rag_dnd_answer,
+)
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "outputs", "rag_benchmark")
+
+# Labeled questions for the bundled rules file. Labels are the rule/note IDs in
+# dnd_2024_rule_changes.txt; they're resolved to chunk ids at run time so the
+# set stays valid when the chunker changes. Empty `relevant` = out of scope.
+LABELED_QUESTIONS: List[Dict[str, Any]] = [
+    {"question": "How does exhaustion work in the 2024 rules?", "relevant": ["GLOBAL_005"]},
+    {"question": "What happens to surprised creatures at the start of combat?", "relevant": ["GLOBAL_006"]},
+    {"question": "Is it still called race or something else now?", "relevant": ["GLOBAL_002", "CHAR_003"]},
+    {"question": "How does Heroic Inspiration work?", "relevant": ["GLOBAL_004"]},
+    {"question": "What is the Magic action?", "relevant": ["GLOBAL_003"]},
+    {"question": "What changed about short and long rests?", "relevant": ["GLOBAL_007"]},
+    {"question": "Do all spellcasters prepare spells now?", "relevant": ["GLOBAL_008"]},
+    {"question": "What is an Emanation area of effect?", "relevant": ["GLOBAL_009"]},
+    {"question": "Where do ability score increases come from?", "relevant": ["CHAR_001"]},
+    {"question": "What do backgrounds give a character?", "relevant": ["CHAR_002", "CHAR_001"]},
+    {"question": "Are half-elves and half-orcs still playable species?", "relevant": ["CHAR_003", "META_003"]},
+    {"question": "Are feats optional in the new Player's Handbook?", "relevant": ["CHAR_005"]},
+    {"question": "How do weapon mastery properties like Cleave and Topple work?", "relevant": ["CHAR_006"]},
+    {"question": "How does two-weapon fighting work with light weapons?", "relevant": ["CHAR_007"]},
+    {"question": "When do characters choose a subclass?", "relevant": ["CHAR_008"]},
+    {"question": "How do grapple and shove work now?", "relevant": ["MECH_001"]},
+    {"question": "Can I draw a weapon as part of an attack?", "relevant": ["MECH_002"]},
+    {"question": "How does hiding and the Invisible condition work?", "relevant": ["MECH_003"]},
+    {"question": "What are Bastions?", "relevant": ["DM_002"]},
+    {"question": "How does magic item crafting work in the 2024 DMG?", "relevant": ["DM_003", "CHAR_012"]},
+    {"question": "Can I run older 5e adventures with the 2024 rules?", "relevant": ["META_002", "GLOBAL_001"]},
+    {"question": "How does spaceship combat work?", "relevant": []},
+    {"question": "What is the best pizza topping?", "relevant": []},
+    {"question": "How do I configure a Kubernetes ingress?", "relevant": []},
+]
+
+_RECORD_ID_RE = re.compile(r"^\s*ID:\s*(\S+)", re.MULTILINE)
+
+# Questions used to compare retrieval between storage modes.
+STORAGE_QUERIES: List[str] = [
+    "How does exhaustion work in the 2024 rules?",
+    "What happens to surprised creatures?",
+    "What replaced the term race?",
+    "How does Heroic Inspiration work?",
+    "What is the Magic action?",
+    "How do weapon mastery properties work?",
+    "How do backgrounds grant ability score increases?",
+    "When do characters get a feat at level 1?",
+    "How does grappling work now?",
+    "What changed about two-weapon fighting?",
+]
+
+
+def _vector_bytes(index: KBIndex) -> int:
+    """Resident bytes of the searchable vectors only (excludes chunk text)."""
+    if index.codes is not None:
+        return int(index.codes.nbytes)
+    assert index.embeddings is not None
+    return int(index.embeddings.nbytes)
+
+
+def storage_benchmark(
+    queries: Sequence[str] = STORAGE_QUERIES,
+    k: int = 3,
+    modes: Sequence[str] = ("int8", "binary"),
+    collection: str = DEFAULT_COLLECTION,
+) -> Dict[str, Any]:
+    """
+    Compare quantized storage modes against the exact float32 index:
+    resident vector memory, recall@k of the exact top-k, and search latency.
+    """
+    path = kb_collections.get(collection).path
+    q_embs = [embed_query(q) for q in queries]
+
+    def _run(index: KBIndex) -> Dict[str, Any]:
+        index.ensure_loaded()
+        ids: List[List[int]] = []
+        latencies: List[float] = []
+        for q_emb in q_embs:
+            start = time.perf_counter()
+            hits = index.search(q_emb, k=k)
+            latencies.append(time.perf_counter() - start)
+            ids.append([h["id"] for h in hits])
+        return {
+            "ids": ids,
+            "vector_bytes": _vector_bytes(index),
+            "search_ms_p50": float(np.percentile(latencies, 50) * 1000),
+        }
+
+    exact = _run(KBIndex(f"{collection}-bench-float32", path, storage="float32"))
+    report: Dict[str, Any] = {
+        "collection": collection,
+        "k": k,
+        "num_queries": len(queries),
+        "float32": {
+            "vector_bytes": exact["vector_bytes"],
+            "search_ms_p50": exact["search_ms_p50"],
+        },
+    }
+
+    for mode in modes:
+        run = _run(KBIndex(f"{collection}-bench-{mode}", path, storage=mode))
+        recalls = [
+            len(set(got) & set(want)) / max(1, len(want))
+            for got, want in zip(run["ids"], exact["ids"])
+        ]
+        recall = float(np.mean(recalls)) if recalls else 0.0
+        report[mode] = {
+            "vector_bytes": run["vector_bytes"],
+            "memory_reduction": exact["vector_bytes"] / max(1, run["vector_bytes"]),
+            "recall_at_k_vs_float32": recall,
+            "recall_at_k_loss": 1.0 - recall,
+            "search_ms_p50": run["search_ms_p50"],
+        }
+    return report
+
+
+def stub_generate(prompt: str, **_: Any) -> str:
+    """
+    Deterministic stand-in for TinyLlama: echoes the first reference line, or
+    refuses when the prompt says no context was found.
+    """
+    if "NO relevant context found" in prompt:
+        return REFUSAL_TEXT
+    reference = prompt.split("REFERENCE TEXT:", 1)[-1].strip()
+    return reference.splitlines()[0] if reference else ""
+
+
+def _latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    if not seconds:
+        return {"count": 0, "p50_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "count": int(len(ms)),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def resolve_labels(index: KBIndex) -> Dict[str, Set[int]]:
+    """
+    Map each rule/note ID in the corpus to the chunk ids containing it.
+    """
+    assert index.chunks is not None
+    mapping: Dict[str, Set[int]] = {}
+    for chunk in index.chunks:
+        for record_id in _RECORD_ID_RE.findall(chunk["text"]):
+            mapping.setdefault(record_id, set()).add(int(chunk["id"]))
+    return mapping
+
+
+def retrieval_benchmark(
+    questions: Sequence[Dict[str, Any]] = LABELED_QUESTIONS,
+    k: int = 3,
+    collection: str = DEFAULT_COLLECTION,
+    generate_fn: Optional[Callable[..., str]] = stub_generate,
+    repeats: int = 1,
+) -> Dict[str, Any]:
+    """
+    Recall@k and MRR over the labeled set, plus p50/p99 latency for the
+    embedding, search, and full-answer stages.
+    """
+    index = ensure_kb_index(collection)
+    labels = resolve_labels(index)
+
+    # Warm up the embedder and index so first-call costs don't skew latency.
+    index.search(embed_query("warm up"), k=k)
+
+    timings: Dict[str, List[float]] = {"embed": [], "search": [], "answer": []}
+    per_question: List[Dict[str, Any]] = []
+    recalls: List[float] = []
+    reciprocal_ranks: List[float] = []
+
+    for item in questions:
+        relevant: Set[int] = set()
+        for record_id in item["relevant"]:
+            relevant |= labels.get(record_id, set())
+
+        for _ in range(max(1, repeats)):
+            start = time.perf_counter()
+            q_emb = embed_query(item["question"])
+            timings["embed"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            hits = index.search(q_emb, k=k)
+            timings["search"].append(time.perf_counter() - start)
+
+        retrieved = [h["id"] for h in hits]
+        row: Dict[str, Any] = {
+            "question": item["question"],
+            "relevant_ids": sorted(relevant),
+            "retrieved_ids": retrieved,
+            "top_score": hits[0]["score"] if hits else None,
+        }
+
+        if relevant:
+            recall = len(relevant & set(retrieved)) / len(relevant)
+            rank = next((i + 1 for i, cid in enumerate(retrieved) if cid in relevant), None)
+            rr = 1.0 / rank if rank else 0.0
+            recalls.append(recall)
+            reciprocal_ranks.append(rr)
+            row.update({"recall_at_k": recall, "reciprocal_rank": rr})
+
+        start = time.perf_counter()
+        rag_dnd_answer(
+            item["question"],
+            k=k,
+            use_cache=False,
+            collection=collection,
+            generate_fn=generate_fn,
+        )
+        timings["answer"].append(time.perf_counter() - start)
+
+        per_question.append(row)
+
+    return {
+        "collection": collection,
+        "k": k,
+        "llm": "stub" if generate_fn is stub_generate else "tinyllama",
+        "num_questions": len(questions),
+        "num_labeled": len(recalls),
+        "recall_at_k": float(np.mean(recalls)) if recalls else 0.0,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+        "latency": {stage: _latency_summary(values) for stage, values in timings.items()},
+        "questions": per_question,
+    }
+
+
+def _prompt_token_counter(real_llm: bool) -> Callable[[str], int]:
+    """TinyLlama's tokenizer when the real model is in use, whitespace tokens otherwise."""
+    if real_llm:
+        from llm_model import _build_full_prompt, load_model
+
+        tokenizer, _ = load_model()
+        return lambda prompt: len(tokenizer(_build_full_prompt(prompt))["input_ids"])
+    return lambda prompt: len(prompt.split())
+
+
+def packing_benchmark(
+    questions: Sequence[Dict[str, Any]] = LABELED_QUESTIONS,
+    k: int = 5,
+    collection: str = DEFAULT_COLLECTION,
+    generate_fn: Optional[Callable[..., str]] = stub_generate,
+    token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+) -> Dict[str, Any]:
+    """
+    Prompt size and answer latency with context packing off (chunks as
+    retrieved) vs. on (MMR + dedup + sentence trimming within `token_budget`).
+    """
+    real_llm = generate_fn is None
+    count_tokens = _prompt_token_counter(real_llm)
+    ensure_kb_index(collection)
+
+    def _run(budget: Optional[int]) -> Dict[str, Any]:
+        prompt_tokens: List[int] = []
+        latencies: List[float] = []
+        for item in questions:
+            captured: List[str] = []
+
+            def _recording_generate(prompt: str, **kwargs: Any) -> str:
+                captured.append(prompt)
+                return (generate_fn or _tinyllama_generate)(prompt=prompt, **kwargs)
+
+            start = time.perf_counter()
+            rag_dnd_answer(
+                item["question"],
+                k=k,
+                use_cache=False,
+                collection=collection,
+                generate_fn=_recording_generate,
+                context_token_budget=budget,
+            )
+            if captured:  # refused questions never build a prompt
+                latencies.append(time.perf_counter() - start)
+                prompt_tokens.append(count_tokens(captured[0]))
+        return {
+            "mean_prompt_tokens": float(np.mean(prompt_tokens)) if prompt_tokens else 0.0,
+            "answer_latency": _latency_summary(latencies),
+        }
+
+    unpacked = _run(None)
+    packed = _run(token_budget)
+    before, after = unpacked["mean_prompt_tokens"], packed["mean_prompt_tokens"]
+    return {
+        "k": k,
+        "token_budget": token_budget,
+        "prompt_tokens": "tinyllama" if real_llm else "whitespace",
+        "unpacked": unpacked,
+        "packed": packed,
+        "prompt_token_reduction": (before - after) / before if before else 0.0,
+        "answer_p50_ms_improvement": unpacked["answer_latency"]["p50_ms"] - packed["answer_latency"]["p50_ms"],
+    }
+
+
+def _tinyllama_generate(**kwargs: Any) -> str:
+    from llm_model import generate_text
+
+    return generate_text(**kwargs)
+
+
+def compare_reports(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Headline metric deltas (current - previous) between two saved runs.
+    """
+    prev, cur = previous.get("retrieval", {}), current.get("retrieval", {})
+    deltas: Dict[str, Any] = {
+        "recall_at_k": cur.get("recall_at_k", 0.0) - prev.get("recall_at_k", 0.0),
+        "mrr": cur.get("mrr", 0.0) - prev.get("mrr", 0.0),
+    }
+    for stage, stats in cur.get("latency", {}).items():
+        before = prev.get("latency", {}).get(stage)
+        if before:
+            deltas[f"{stage}_p50_ms"] = stats["p50_ms"] - before["p50_ms"]
+            deltas[f"{stage}_p99_ms"] = stats["p99_ms"] - before["p99_ms"]
+    return deltas
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the D&D rules RAG pipeline.")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument(
+        "--llm",
+        choices=["stub", "tinyllama"],
+        default="stub",
+        help="Use a deterministic stub (fast, offline) or the real TinyLlama for the answer stage.",
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Embedding/search repetitions per question.")
+    parser.add_argument(
+        "--storage-modes",
+        default="int8,binary",
+        help="Comma-separated quantized storage modes to compare against float32 ('' to skip).",
+    )
+    parser.add_argument(
+        "--packing-k",
+        type=int,
+        default=5,
+        help="Top-k for the context packing comparison (0 to skip).",
+    )
+    parser.add_argument("--context-token-budget", type=int, default=DEFAULT_CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--output", default=None, help="Path for the JSON report (default: outputs/rag_benchmark/).")
+    parser.add_argument("--compare", default=None, help="Previous JSON report to diff against.")
+    args = parser.parse_args(argv)
+
+    report: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "retrieval": retrieval_benchmark(
+            k=args.k,
+            collection=args.collection,
+            generate_fn=stub_generate if args.llm == "stub" else None,
+            repeats=args.repeats,
+        ),
+    }
+
+    modes = [m.strip() for m in args.storage_modes.split(",") if m.strip()]
+    if modes:
+        report["storage"] = storage_benchmark(k=args.k, modes=modes, collection=args.collection)
+
+    if args.packing_k > 0:
+        report["packing"] = packing_benchmark(
+            k=args.packing_k,
+            collection=args.collection,
+            generate_fn=stub_generate if args.llm == "stub" else None,
+            token_budget=args.context_token_budget,
+        )
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["delta_vs_previous"] = compare_reports(json.load(f), report)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"run-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    summary = report["retrieval"]
+    print(f"recall@{args.k}: {summary['recall_at_k']:.3f}  MRR: {summary['mrr']:.3f}")
+    for stage, stats in summary["latency"].items():
+        print(f"{stage:>7}: p50 {stats['p50_ms']:.1f} ms  p99 {stats['p99_ms']:.1f} ms")
+    if "packing" in report:
+        packing = report["packing"]
+        print(
+            f"packing: prompt tokens {packing['unpacked']['mean_prompt_tokens']:.0f} -> "
+            f"{packing['packed']['mean_prompt_tokens']:.0f} "
+            f"({packing['prompt_token_reduction']:.1%} fewer), "
+            f"answer p50 {packing['answer_p50_ms_improvement']:+.1f} ms faster"
+        )
+    if "delta_vs_previous" in report:
+        print("delta vs previous:", json.dumps(report["delta_vs_previous"], indent=2))
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,13 @@
 
 from __future__ import annotations
 
+import io
 import os
-from typing import List, Dict, Any
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Dict, Any, Iterable, Iterator, Optional, Tuple
 
 import numpy as np
 import os as _os
@@ -14,7 +19,11 @@ _os.environ.setdefault("TRANSFORMERS_NO_TF", "1")
 
 from sentence_transformers import SentenceTransformer
 
-from llm_model import generate_text  # re-use your TinyLlama wrapper
+from rag_embedder import EmbeddingWorker
+from tracing import count, stage
+
+# TinyLlama is imported lazily (see _generate_text) so retrieval-only callers
+# such as the benchmarks don't pay for loading the LLM.
 
 # ---------- 1. PATHS & GLOBALS ----------
 
@@ -22,96 +31,715 @@ from llm_model import generate_text  # re-use your TinyLlama wrapper
 BACKEND_DIR = os.path.dirname(__file__)
 PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
 KB_PATH = os.path.join(PROJECT_ROOT, "public", "dnd_2024_rule_changes.txt")
+DEFAULT_COLLECTION = "rule_changes"
+
+# Upper bound on resident index memory (embeddings + chunk text) per worker.
+# Least recently used collections are unloaded once this is exceeded.
+DEFAULT_MEMORY_BUDGET_MB = float(os.environ.get("RAG_MEMORY_BUDGET_MB", "512"))
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Where query and sentence (trimming / extractive) embeddings run: "process"
+# (default; micro-batching worker process with its own torch thread budget,
+# RAG_EMBED_THREADS), "thread" (micro-batching worker thread, no CPU isolation),
+# or "off" (encode inline on the request thread).
+EMBED_WORKER_BACKEND = os.environ.get("RAG_EMBED_WORKER", "process")
 
 # We'll lazily initialize these on first use
 _embed_model: SentenceTransformer | None = None
-_kb_chunks: List[Dict[str, Any]] | None = None
-_kb_embeddings: np.ndarray | None = None
+_embed_worker: EmbeddingWorker | None = None
+_embed_worker_lock = threading.Lock()
 
 
 # ---------- 2. KB LOADING & CHUNKING ----------
 
-def load_kb_text() -> str:
-    with open(KB_PATH, "r", encoding="utf-8") as f:
+# Chunk budget in whitespace tokens. all-MiniLM-L6-v2 truncates at 256 word
+# pieces, so ~200 words keeps chunks inside the embedder window.
+DEFAULT_CHUNK_TOKENS = 200
+DEFAULT_CHUNK_OVERLAP_TOKENS = 30
+DEFAULT_EMBED_BATCH_SIZE = 64
+
+# Lines starting with these begin a new record; records never share a chunk.
+RECORD_HEADERS = ("RULE:", "NOTE:")
+SECTION_HEADER = "SECTION:"
+
+
+def load_kb_text(path: str = KB_PATH) -> str:
+    with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
 
-def chunk_kb(text: str) -> List[Dict[str, Any]]:
+def _count_tokens(text: str) -> int:
+    return len(text.split())
+
+
+def _split_long_line(line: str, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    words = line.split()
+    if len(words) <= max_tokens:
+        yield line, len(words)
+        return
+    for start in range(0, len(words), max_tokens):
+        piece = words[start:start + max_tokens]
+        yield " ".join(piece), len(piece)
+
+
+def iter_chunks_from_lines(
+    lines: Iterable[str],
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Dict[str, Any]]:
     """
-    Very simple chunker: split on blank lines, drop tiny chunks.
-    You can later improve this (e.g., split on 'RULE:' headers).
+    Streaming, structure-aware chunker.
+
+    - `RULE:` / `NOTE:` headers start a new record; records are never merged.
+    - `SECTION:` lines close the current chunk and are recorded as metadata.
+    - Separator lines (`=====`) are skipped; nothing else is dropped.
+    - Unstructured text is packed paragraph by paragraph up to `max_tokens`;
+      a record or paragraph run longer than that is split into windows that
+      repeat the last `overlap_tokens` of the previous window.
+
+    Only the current chunk is buffered, so memory stays constant in file size.
     """
-    raw_chunks = [c.strip() for c in text.split("\n\n") if c.strip()]
-    chunks = [c for c in raw_chunks if len(c) > 80]  # filter out very short bits
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    piece_tokens = max(1, max_tokens - overlap_tokens)
+
+    next_id = 0
+    section: Optional[str] = None
+    buf: List[Tuple[str, int]] = []
+    buf_tokens = 0
+    has_new = False  # buffer holds more than the carried-over overlap
+
+    def flush(carry: bool) -> Iterator[Dict[str, Any]]:
+        nonlocal next_id, buf, buf_tokens, has_new
+        if has_new:
+            text = "\n".join(line for line, _ in buf).strip()
+            if text:
+                yield {"id": next_id, "text": text, "section": section}
+                next_id += 1
+
+        tail: List[Tuple[str, int]] = []
+        tail_tokens = 0
+        if carry:
+            for line, n in reversed(buf):
+                if n == 0:
+                    continue
+                room = overlap_tokens - tail_tokens
+                if room <= 0:
+                    break
+                if n > room:
+                    # Carry only the trailing words of a long line.
+                    tail.insert(0, (" ".join(line.split()[-room:]), room))
+                    tail_tokens += room
+                    break
+                tail.insert(0, (line, n))
+                tail_tokens += n
+        buf, buf_tokens, has_new = tail, tail_tokens, False
+
+    for raw in lines:
+        line = raw.rstrip()
+        stripped = line.strip()
 
-    return [
-        {"id": i, "text": chunk}
-        for i, chunk in enumerate(chunks)
-    ]
+        if stripped and set(stripped) <= set("=-"):
+            continue
+        if line.startswith(SECTION_HEADER):
+            yield from flush(carry=False)
+            section = line[len(SECTION_HEADER):].strip() or None
+            continue
+        if line.startswith(RECORD_HEADERS):
+            yield from flush(carry=False)
+        if not stripped:
+            # Paragraph boundary: keep a blank line so packed paragraphs stay readable.
+            if buf and buf[-1][1] != 0:
+                buf.append(("", 0))
+            continue
 
+        for piece, n in _split_long_line(line, piece_tokens):
+            if has_new and buf_tokens + n > max_tokens:
+                yield from flush(carry=True)
+            buf.append((piece, n))
+            buf_tokens += n
+            has_new = True
+
+    yield from flush(carry=False)
+
+
+def iter_kb_chunks(
+    path: str = KB_PATH,
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream chunks from a corpus file, reading it line by line.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        yield from iter_chunks_from_lines(f, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
 
-# ---------- 3. EMBEDDING INITIALIZATION ----------
+
+def iter_chunk_batches(
+    chunks: Iterable[Dict[str, Any]],
+    batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Group a chunk stream into fixed-size batches for the embedder.
+    """
+    batch: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def chunk_kb(text: str) -> List[Dict[str, Any]]:
+    """
+    Chunk an in-memory KB string (see iter_chunks_from_lines).
+    """
+    return list(iter_chunks_from_lines(io.StringIO(text)))
+
+
+# ---------- 3. EMBEDDING & INDEXES ----------
 
 def get_embed_model() -> SentenceTransformer:
     global _embed_model
     if _embed_model is None:
         # Tiny but good enough sentence embedding model
-        model_name = "sentence-transformers/all-MiniLM-L6-v2"
-        _embed_model = SentenceTransformer(model_name)
+        _embed_model = SentenceTransformer(EMBED_MODEL_NAME)
     return _embed_model
 
 
-def ensure_kb_index():
+def get_embed_worker() -> EmbeddingWorker:
     """
-    Lazily load + embed the KB on first RAG request.
+    Shared micro-batching worker for query embeddings (see rag_embedder).
     """
-    global _kb_chunks, _kb_embeddings
+    global _embed_worker
+    if _embed_worker is None:
+        with _embed_worker_lock:
+            if _embed_worker is None:
+                model = get_embed_model() if EMBED_WORKER_BACKEND == "thread" else None
+                worker = EmbeddingWorker(EMBED_MODEL_NAME, backend=EMBED_WORKER_BACKEND, model=model)
+                worker.start()
+                _embed_worker = worker
+    return _embed_worker
 
-    if _kb_chunks is not None and _kb_embeddings is not None:
-        return
 
-    kb_text = load_kb_text()
-    _kb_chunks = chunk_kb(kb_text)
+# Embedding storage modes for KBIndex:
+# - "float32": full matrix in memory, exact dot-product scan (original behavior)
+# - "int8":    symmetric scalar-quantized codes in memory (4x smaller)
+# - "binary":  1 sign bit per dimension, Hamming distance scan (32x smaller)
+# Quantized modes keep the float32 matrix memory-mapped from disk and only read
+# the rows of the top candidates back in for exact rescoring.
+EMBEDDING_STORAGE_MODES = ("float32", "int8", "binary")
+DEFAULT_EMBEDDING_STORAGE = os.environ.get("RAG_EMBEDDING_STORAGE", "float32")
+DEFAULT_RESCORE_FACTOR = 4
+INDEX_CACHE_DIR = os.path.join(BACKEND_DIR, "outputs", "rag_index")
 
-    texts = [c["text"] for c in _kb_chunks]
-    model = get_embed_model()
-    # Normalize embeddings => cosine similarity = dot product
-    _kb_embeddings = model.encode(
-        texts,
-        convert_to_numpy=True,
-        normalize_embeddings=True
-    )
+# Rows scanned per block in the quantized coarse search, so the upcast
+# working set stays cache-sized instead of materializing a full float matrix.
+_SCAN_BLOCK_ROWS = 8192
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT_TABLE[bits].sum(axis=1, dtype=np.int32)
+
+
+class KBIndex:
+    """
+    Chunked + embedded view of one corpus file.
+
+    Loading is lazy; the index rebuilds itself if the file changed on disk
+    since it was embedded. `version` is the (mtime, size) fingerprint of the
+    file the current index was built from, so anything derived from the index
+    (e.g. cached answers) can be keyed on it.
+
+    With `storage="int8"` or `"binary"` only the quantized codes stay resident;
+    the coarse scan picks `k * rescore_factor` candidates, which are rescored
+    exactly against the memory-mapped float32 vectors.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        storage: str = DEFAULT_EMBEDDING_STORAGE,
+        rescore_factor: int = DEFAULT_RESCORE_FACTOR,
+        reload: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        if storage not in EMBEDDING_STORAGE_MODES:
+            raise ValueError(f"Unknown embedding storage {storage!r}; expected one of {EMBEDDING_STORAGE_MODES}")
+        self.name = name
+        self.path = path
+        self.storage = storage
+        self.rescore_factor = max(1, rescore_factor)
+        self.chunks: List[Dict[str, Any]] | None = None
+        # float32 vectors; an np.memmap when a quantized storage mode is used.
+        self.embeddings: np.ndarray | None = None
+        self.codes: np.ndarray | None = None  # int8 codes or packed sign bits
+        self.scale: float = 1.0               # int8 dequantization scale
+        self.version: Tuple[int, int] | None = None
+        # Reloads an evicted index through its owner (the registry), so the
+        # memory is budgeted and LRU-tracked; standalone indexes load themselves.
+        self._reload = reload
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.chunks is not None and self.embeddings is not None
+
+    def fingerprint(self) -> Tuple[int, int]:
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _float_cache_path(self, version: Tuple[int, int]) -> str:
+        return os.path.join(INDEX_CACHE_DIR, f"{self.name}-{version[0]}-{version[1]}.f32.npy")
+
+    def _spill_to_disk(self, embeddings: np.ndarray, version: Tuple[int, int]) -> np.memmap:
+        """
+        Write the float32 matrix next to the other index artifacts and reopen it
+        memory-mapped, so only rescored rows are paged in.
+        """
+        os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+        path = self._float_cache_path(version)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(embeddings, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+        # Drop spill files from earlier versions of this corpus only: the exact
+        # "<name>-<mtime>-<size>.f32.npy" pattern, so "dnd" never matches "dnd-2-...".
+        own_spill = re.compile(rf"{re.escape(self.name)}-\d+-\d+\.f32\.npy")
+        for fname in os.listdir(INDEX_CACHE_DIR):
+            stale = os.path.join(INDEX_CACHE_DIR, fname)
+            if own_spill.fullmatch(fname) and stale != path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+        return np.load(path, mmap_mode="r")
+
+    def _quantize(self, embeddings: np.ndarray) -> None:
+        if self.storage == "int8":
+            max_abs = float(np.abs(embeddings).max()) if embeddings.size else 1.0
+            self.scale = max_abs / 127.0 if max_abs > 0 else 1.0
+            self.codes = np.clip(np.round(embeddings / self.scale), -127, 127).astype(np.int8)
+        elif self.storage == "binary":
+            self.codes = np.packbits(embeddings > 0, axis=1)
+        else:
+            self.codes = None
+
+    def ensure_loaded(self) -> bool:
+        """
+        Build the index if missing or stale. Returns True if a (re)build happened.
+        """
+        version = self.fingerprint()
+        if self.loaded and self.version == version:
+            return False
+
+        with self._lock:
+            if self.loaded and self.version == version:
+                return False
+
+            model = get_embed_model()
+            chunks: List[Dict[str, Any]] = []
+            parts: List[np.ndarray] = []
+            for batch in iter_chunk_batches(iter_kb_chunks(self.path)):
+                # Normalize embeddings => cosine similarity = dot product
+                parts.append(model.encode(
+                    [c["text"] for c in batch],
+                    batch_size=len(batch),
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
+                ).astype(np.float32, copy=False))
+                chunks.extend(batch)
+
+            if parts:
+                embeddings = np.concatenate(parts)
+            else:
+                embeddings = np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+            self._quantize(embeddings)
+            if self.storage != "float32":
+                embeddings = self._spill_to_disk(embeddings, version)
+            self.chunks, self.embeddings, self.version = chunks, embeddings, version
+            return True
+
+    def _reload_evicted(self) -> None:
+        if self._reload is not None:
+            self._reload()
+        if not self.loaded:
+            # Standalone, or replaced in the registry since this request looked it up.
+            self.ensure_loaded()
+
+    def unload(self) -> None:
+        with self._lock:
+            self.chunks = None
+            self.embeddings = None
+            self.codes = None
+            self.version = None
+
+    def nbytes(self) -> int:
+        """
+        Resident bytes: vectors held in memory plus chunk text.
+        Memory-mapped float vectors are page cache, not counted.
+        """
+        if not self.loaded:
+            return 0
+        assert self.chunks is not None and self.embeddings is not None
+        resident = 0 if isinstance(self.embeddings, np.memmap) else int(self.embeddings.nbytes)
+        if self.codes is not None:
+            resident += int(self.codes.nbytes)
+        return resident + sum(len(c["text"]) for c in self.chunks)
+
+    def get_embeddings(self, chunk_ids: List[int]) -> np.ndarray:
+        """
+        Float32 vectors for the given chunk ids (ids are row positions).
+        Only those rows are read when the matrix is memory-mapped.
+        """
+        if not self.loaded:
+            self._reload_evicted()
+        assert self.embeddings is not None
+        return np.asarray(self.embeddings[np.asarray(chunk_ids, dtype=np.int64)], dtype=np.float32)
+
+    def _coarse_scores(self, codes: np.ndarray, q_emb: np.ndarray) -> np.ndarray:
+        """
+        Approximate similarity over the quantized codes (higher = closer).
+        int8 keeps the query in float (asymmetric scoring); binary uses
+        negative Hamming distance between sign bits.
+        """
+        n = codes.shape[0]
+        scores = np.empty(n, dtype=np.float32)
+        if self.storage == "int8":
+            q = q_emb.astype(np.float32, copy=False)
+            for start in range(0, n, _SCAN_BLOCK_ROWS):
+                block = codes[start:start + _SCAN_BLOCK_ROWS]
+                scores[start:start + len(block)] = block.astype(np.float32) @ q
+        else:
+            q_bits = np.packbits(q_emb > 0)
+            for start in range(0, n, _SCAN_BLOCK_ROWS):
+                block = codes[start:start + _SCAN_BLOCK_ROWS]
+                scores[start:start + len(block)] = -_popcount_rows(np.bitwise_xor(block, q_bits))
+        return scores
+
+    def search(self, q_emb: np.ndarray, k: int = 2) -> List[Dict[str, Any]]:
+        chunks, embeddings, codes = self.chunks, self.embeddings, self.codes
+        if chunks is None or embeddings is None:
+            # Evicted by a concurrent request between lookup and search.
+            self._reload_evicted()
+            chunks, embeddings, codes = self.chunks, self.embeddings, self.codes
+        assert chunks is not None
+        assert embeddings is not None
+
+        if codes is None:
+            # Cosine similarity for normalized vectors = dot product
+            sims = embeddings @ q_emb  # shape: (num_chunks,)
+            top_idx = np.argsort(-sims)[:k]
+            top_scores = sims[top_idx]
+        else:
+            n_candidates = min(len(chunks), max(k, k * self.rescore_factor))
+            coarse = self._coarse_scores(codes, q_emb)
+            if n_candidates < len(coarse):
+                candidates = np.argpartition(-coarse, n_candidates - 1)[:n_candidates]
+            else:
+                candidates = np.arange(len(coarse))
+            candidates.sort()  # sequential reads from the memmap
+            exact = np.asarray(embeddings[candidates]) @ q_emb
+            order = np.argsort(-exact)[:k]
+            top_idx = candidates[order]
+            top_scores = exact[order]
+
+        results: List[Dict[str, Any]] = []
+        for idx, score in zip(top_idx, top_scores):
+            chunk = chunks[idx]
+            results.append({
+                "id": int(chunk["id"]),
+                "text": chunk["text"],
+                "score": float(score),
+            })
+        return results
+
+
+class CollectionRegistry:
+    """
+    Named corpora (rule changes, PHB, DMG, homebrew...) served from one worker.
+
+    Collections are only registered up front; their indexes are built on first
+    query and kept in LRU order. When the resident size exceeds the memory
+    budget, the least recently used indexes are unloaded (they rebuild lazily
+    the next time they're queried).
+    """
+
+    def __init__(self, memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB) -> None:
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._indexes: Dict[str, KBIndex] = {}
+        self._lru: "OrderedDict[str, None]" = OrderedDict()  # loaded names, oldest first
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def register(self, name: str, path: str, storage: str = DEFAULT_EMBEDDING_STORAGE) -> None:
+        with self._lock:
+            existing = self._indexes.get(name)
+            if existing is not None and existing.path == path and existing.storage == storage:
+                return
+            if existing is not None:
+                self._lru.pop(name, None)
+            self._indexes[name] = KBIndex(name, path, storage=storage, reload=lambda: self.get(name))
+        if existing is not None:
+            existing.unload()
+
+    def register_directory(self, directory: str, suffix: str = ".txt") -> List[str]:
+        """
+        Register every `*.txt` corpus in a directory, named after its file stem.
+        """
+        names = []
+        for fname in sorted(os.listdir(directory)):
+            if fname.endswith(suffix):
+                name = fname[: -len(suffix)]
+                self.register(name, os.path.join(directory, fname))
+                names.append(name)
+        return names
+
+    def names(self) -> List[str]:
+        return sorted(self._indexes)
+
+    def get(self, name: str = DEFAULT_COLLECTION) -> KBIndex:
+        """
+        Return a loaded index for `name`, building it on first use.
+        Raises KeyError for unknown collections.
+        """
+        index = self._indexes.get(name)
+        if index is None:
+            raise KeyError(f"Unknown RAG collection: {name}")
+
+        if index.ensure_loaded():
+            self.loads += 1
+
+        with self._lock:
+            self._lru[name] = None
+            self._lru.move_to_end(name)
+            victims = self._evict(keep=name)
+        # Unloading waits on each victim's own lock (e.g. a rebuild in progress),
+        # so it happens after the registry lock is released.
+        for victim in victims:
+            victim.unload()
+        return index
+
+    def _evict(self, keep: str) -> List[KBIndex]:
+        # Caller holds the lock; the caller unloads the returned indexes.
+        total = sum(self._indexes[n].nbytes() for n in self._lru)
+        victims: List[KBIndex] = []
+        for victim in list(self._lru):
+            if total <= self.memory_budget_bytes:
+                break
+            if victim == keep:
+                continue
+            index = self._indexes[victim]
+            total -= index.nbytes()
+            victims.append(index)
+            del self._lru[victim]
+            self.evictions += 1
+        return victims
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            collections = [
+                {
+                    "name": name,
+                    "path": index.path,
+                    "loaded": index.loaded,
+                    "storage": index.storage,
+                    "num_chunks": len(index.chunks) if index.chunks is not None else 0,
+                    "bytes": index.nbytes(),
+                }
+                for name, index in sorted(self._indexes.items())
+            ]
+            return {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "resident_bytes": sum(c["bytes"] for c in collections),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "collections": collections,
+            }
+
+
+kb_collections = CollectionRegistry()
+kb_collections.register(DEFAULT_COLLECTION, KB_PATH)
+if os.environ.get("RAG_COLLECTIONS_DIR"):
+    kb_collections.register_directory(os.environ["RAG_COLLECTIONS_DIR"])
+
+
+def ensure_kb_index(collection: str = DEFAULT_COLLECTION) -> KBIndex:
+    """
+    Lazily load + embed a collection on first RAG request.
+    """
+    return kb_collections.get(collection)
 
 
 # ---------- 4. RETRIEVAL ----------
 
-def retrieve_top_k(query: str, k: int = 2) -> List[Dict[str, Any]]:
-    ensure_kb_index()
+def embed_query(query: str) -> np.ndarray:
+    if EMBED_WORKER_BACKEND == "off":
+        model = get_embed_model()
+        return model.encode([query], convert_to_numpy=True, normalize_embeddings=True)[0]
+    # Batched with concurrent requests, off the request thread.
+    return get_embed_worker().encode(query)
+
+
+def embed_sentences(sentences: List[str]) -> np.ndarray:
+    """Embed sentences for trimming / extraction through the same worker as queries."""
+    if EMBED_WORKER_BACKEND == "off":
+        model = get_embed_model()
+        return model.encode(sentences, convert_to_numpy=True, normalize_embeddings=True)
+    return get_embed_worker().encode_many(sentences)
+
+
+def search_kb(
+    q_emb: np.ndarray,
+    k: int = 2,
+    collection: str = DEFAULT_COLLECTION,
+) -> List[Dict[str, Any]]:
+    """
+    Score an already-embedded query against a collection's index.
+    """
+    return ensure_kb_index(collection).search(q_emb, k=k)
+
+
+def retrieve_top_k(query: str, k: int = 2, collection: str = DEFAULT_COLLECTION) -> List[Dict[str, Any]]:
+    return search_kb(embed_query(query), k=k, collection=collection)
+
+
+# ---------- 4b. SEMANTIC ANSWER CACHE ----------
+
+class SemanticAnswerCache:
+    """
+    Remembers (question embedding, retrieved chunk ids, answer) triples so that
+    rephrasings of an already-answered question skip TinyLlama generation.
+
+    A hit requires a near-identical question embedding (cosine >= threshold),
+    the exact same set of retrieved chunk ids and the same prompt variant
+    (context packing settings), so the answer was generated from the same
+    prompt context. Entries are tied to the KB version they were produced
+    against and are dropped as soon as the index is rebuilt.
+    """
+
+    def __init__(self, max_entries: int = 512, threshold: float = 0.92) -> None:
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._embeddings: np.ndarray | None = None  # (max_entries, dim) ring buffer
+        self._entries: List[Dict[str, Any] | None] = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self._version: Any = None
+        self.hits = 0
+        self.misses = 0
+
+    def _reset(self) -> None:
+        # Caller holds the lock.
+        self._embeddings = None
+        self._entries = [None] * self.max_entries
+        self._size = 0
+        self._next = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
 
-    assert _kb_chunks is not None
-    assert _kb_embeddings is not None
+    def _check_version(self, version: Any) -> None:
+        # Caller holds the lock.
+        if version != self._version:
+            self._reset()
+            self._version = version
 
-    model = get_embed_model()
-    q_emb = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)[0]
+    def lookup(
+        self,
+        q_emb: np.ndarray,
+        chunk_ids: List[int],
+        version: Any,
+        variant: Any = None,
+    ) -> Optional[str]:
+        key = frozenset(chunk_ids)
+        with self._lock:
+            self._check_version(version)
+            if self._size == 0 or self._embeddings is None:
+                self.misses += 1
+                return None
 
-    # Cosine similarity for normalized vectors = dot product
-    sims = _kb_embeddings @ q_emb  # shape: (num_chunks,)
+            sims = self._embeddings[: self._size] @ q_emb
+            for idx in np.argsort(-sims):
+                if sims[idx] < self.threshold:
+                    break
+                entry = self._entries[idx]
+                if entry is not None and entry["chunk_ids"] == key and entry["variant"] == variant:
+                    self.hits += 1
+                    return entry["answer"]
 
-    top_idx = np.argsort(-sims)[:k]
+            self.misses += 1
+            return None
 
-    results: List[Dict[str, Any]] = []
-    for idx in top_idx:
-        chunk = _kb_chunks[idx]
-        results.append({
-            "id": int(chunk["id"]),
-            "text": chunk["text"],
-            "score": float(sims[idx]),
-        })
-    return results
+    def store(
+        self,
+        q_emb: np.ndarray,
+        chunk_ids: List[int],
+        answer: str,
+        version: Any,
+        variant: Any = None,
+    ) -> None:
+        with self._lock:
+            self._check_version(version)
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.max_entries, q_emb.shape[0]), dtype=np.float32)
+
+            slot = self._next
+            self._embeddings[slot] = q_emb
+            self._entries[slot] = {"chunk_ids": frozenset(chunk_ids), "variant": variant, "answer": answer}
+            self._next = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "threshold": self.threshold,
+            }
+
+
+# One cache per collection, so rebuilding one index only drops that collection's answers.
+_answer_caches: Dict[str, SemanticAnswerCache] = {}
+_answer_caches_lock = threading.Lock()
+
+
+def get_answer_cache(collection: str) -> SemanticAnswerCache:
+    with _answer_caches_lock:
+        cache = _answer_caches.get(collection)
+        if cache is None:
+            cache = _answer_caches[collection] = SemanticAnswerCache()
+        return cache
 
 
 # ---------- 5. PROMPT CONSTRUCTION ----------
 
+REFUSAL_TEXT = "I don't have that information in the provided 2024 rules summary."
+
+# Confidence gates on the top retrieval score (cosine similarity).
+# Below DEFAULT_MIN_SCORE a chunk is not considered relevant; if none are,
+# the canonical refusal is returned without calling the LLM. At or above
+# DEFAULT_EXTRACTIVE_SCORE the optional extractive path answers directly.
+DEFAULT_MIN_SCORE = 0.4
+DEFAULT_EXTRACTIVE_SCORE = 0.75
+
+_FIELD_LABEL_RE = re.compile(r"^([A-Z][A-Z0-9_]*):\s*")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+# Record fields never returned by the extractive path (metadata or pre-2024 rules).
+_EXTRACTIVE_SKIP_FIELDS = {"ID", "TITLE", "TYPE", "SUMMARY_OLD"}
+
+
 def build_dnd_rag_prompt(
     query: str,
     retrieved_chunks: List[Dict[str, Any]],
@@ -148,7 +776,7 @@ Context status: { "relevant context found" if has_relevant else "NO relevant con
 Answer the user's question using ONLY this reference text.
 
 If the answer is not clearly present in the reference, say exactly:
-"I don't have that information in the provided 2024 rules summary."
+"{REFUSAL_TEXT}"
 
 Do NOT invent rules, and do NOT rely on outside knowledge. The reference
 does not contain spaceship combat or other systems beyond D&D 2024 rules
@@ -165,38 +793,369 @@ Answer in a clear, concise way. If needed, quote or paraphrase the rules from th
     return prompt.strip()
 
 
+# ---------- 5b. CONTEXT PACKING ----------
+
+# Suggested prompt budget for reference text, in whitespace tokens, when packing
+# is requested. The unpacked path (the default) is capped at 2500 chars (~400
+# tokens); packing keeps the relevant part in less.
+DEFAULT_CONTEXT_TOKEN_BUDGET = 250
+DEFAULT_MMR_LAMBDA = 0.7
+# Chunks at least this similar to an already-packed chunk are dropped as duplicates.
+DEFAULT_DEDUP_THRESHOLD = 0.92
+# Record fields always kept when a chunk is trimmed to its relevant sentences.
+_PACK_KEEP_FIELDS = {"ID", "TITLE"}
+
+
+def _trim_to_relevant_sentences(
+    q_emb: np.ndarray,
+    text: str,
+    token_budget: int,
+) -> str:
+    """
+    Cut a chunk down to its most query-relevant sentences within `token_budget`,
+    keeping the ID/TITLE lines and the original sentence order.
+    """
+    units: List[Tuple[str, bool]] = []  # (sentence, always_keep)
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        match = _FIELD_LABEL_RE.match(line)
+        if match and match.group(1) in _PACK_KEEP_FIELDS:
+            units.append((line, True))
+            continue
+        for sentence in _SENTENCE_SPLIT_RE.split(line):
+            if sentence.strip():
+                units.append((sentence.strip(), False))
+
+    kept = [i for i, (_, keep) in enumerate(units) if keep]
+    remaining = token_budget - sum(_count_tokens(units[i][0]) for i in kept)
+    candidates = [i for i, (_, keep) in enumerate(units) if not keep]
+    if candidates and remaining > 0:
+        sent_embs = embed_sentences([units[i][0] for i in candidates])
+        for pos in np.argsort(-(sent_embs @ q_emb)):
+            idx = candidates[int(pos)]
+            n = _count_tokens(units[idx][0])
+            if n <= remaining:
+                kept.append(idx)
+                remaining -= n
+
+    return "\n".join(units[i][0] for i in sorted(kept))
+
+
+def _truncate_tokens(text: str, token_budget: int) -> str:
+    """First `token_budget` whitespace tokens of `text`, keeping its line breaks."""
+    lines: List[str] = []
+    remaining = token_budget
+    for line in text.splitlines():
+        words = line.split()
+        if not words:
+            continue
+        if remaining <= 0:
+            break
+        lines.append(" ".join(words[:remaining]))
+        remaining -= min(len(words), remaining)
+    return "\n".join(lines)
+
+
+def pack_context(
+    q_emb: np.ndarray,
+    chunks: List[Dict[str, Any]],
+    chunk_embs: np.ndarray,
+    token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+    mmr_lambda: float = DEFAULT_MMR_LAMBDA,
+    dedup_threshold: float = DEFAULT_DEDUP_THRESHOLD,
+) -> List[Dict[str, Any]]:
+    """
+    Redundancy-aware context packing over already-retrieved chunks:
+    - order by maximal marginal relevance (relevance vs. similarity to what's packed)
+    - drop near-duplicates of chunks already packed
+    - fit the token budget, trimming the chunk that overflows it to its most
+      relevant sentences (marked with `trimmed: True`)
+    """
+    relevance = chunk_embs @ q_emb
+    pair_sims = chunk_embs @ chunk_embs.T
+    remaining_idx = list(range(len(chunks)))
+    selected: List[int] = []
+    packed: List[Dict[str, Any]] = []
+    budget = token_budget
+
+    while remaining_idx and budget > 0:
+        if selected:
+            redundancy = pair_sims[np.ix_(remaining_idx, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining_idx))
+        mmr = mmr_lambda * relevance[remaining_idx] - (1 - mmr_lambda) * redundancy
+        pos = int(np.argmax(mmr))
+        idx = remaining_idx.pop(pos)
+        if redundancy[pos] >= dedup_threshold:
+            count("dedup_dropped", 1)
+            continue
+        selected.append(idx)
+
+        chunk = chunks[idx]
+        n_tokens = _count_tokens(chunk["text"])
+        if n_tokens <= budget:
+            packed.append(chunk)
+            budget -= n_tokens
+        else:
+            trimmed = _trim_to_relevant_sentences(q_emb, chunk["text"], budget)
+            if not trimmed and not packed:
+                # Never send an empty context: fall back to the chunk's head.
+                trimmed = chunk["text"]
+            if trimmed:
+                # ID/TITLE lines or a single long sentence can still overflow a small budget.
+                trimmed = _truncate_tokens(trimmed, budget)
+                packed.append({**chunk, "text": trimmed, "trimmed": True})
+                budget -= _count_tokens(trimmed)
+            budget = 0  # anything after the overflowing chunk is lower value
+
+    return packed
+
+
 # ---------- 6. RAG ORCHESTRATOR ----------
 
-def rag_dnd_answer(query: str, k: int = 2) -> Dict[str, Any]:
+def _generate_text(**kwargs: Any) -> str:
+    from llm_model import generate_text  # re-use your TinyLlama wrapper
+
+    return generate_text(**kwargs)
+
+
+def extract_best_sentence(q_emb: np.ndarray, chunk_text: str) -> Tuple[str, float]:
     """
-    High-level RAG call:
-    - retrieve top-k chunks
-    - build prompt
-    - call TinyLlama via generate_text()
-    - return both answer and retrieval metadata (for debugging / UI)
+    Pick the sentence of a chunk closest to the query embedding.
+    Field labels such as `SUMMARY_NEW:` are stripped; metadata fields and the
+    2014 `SUMMARY_OLD` text are never returned.
     """
-    retrieved = retrieve_top_k(query, k=k)
+    sentences: List[str] = []
+    field: Optional[str] = None
+    for raw in chunk_text.splitlines():
+        line = raw.strip()
+        match = _FIELD_LABEL_RE.match(line)
+        if match:
+            # Unlabeled continuation lines (bullets) inherit the previous field.
+            field = match.group(1)
+            line = line[match.end():]
+        if field in _EXTRACTIVE_SKIP_FIELDS:
+            continue
+        for sentence in _SENTENCE_SPLIT_RE.split(line.lstrip("-").strip()):
+            sentence = sentence.strip()
+            if len(sentence.split()) >= 4:
+                sentences.append(sentence)
+    if not sentences:
+        return chunk_text.strip(), 0.0
+
+    sent_embs = embed_sentences(sentences)
+    sims = sent_embs @ q_emb
+    best = int(np.argmax(sims))
+    return sentences[best], float(sims[best])
+
+
+def _route_question(
+    query: str,
+    k: int,
+    use_cache: bool,
+    collection: str,
+    min_score: float,
+    extractive: bool,
+    extractive_score: float,
+    context_token_budget: Optional[int],
+) -> Tuple[Dict[str, Any], Optional[str], Optional[Callable[[str], None]]]:
+    """
+    Retrieval + gating shared by the blocking and streaming orchestrators.
+
+    Returns (result, prompt, store). When the answer is already known
+    (refused / extractive / cached) `prompt` is None and `result` is final.
+    Otherwise `result` lacks the answer, `prompt` must be sent to the LLM, and
+    `store(answer)` records the generated answer in the semantic cache.
+    """
+    with stage("index_load"):
+        index = ensure_kb_index(collection)
+    with stage("embed"):
+        q_emb = embed_query(query)
+    with stage("search"):
+        retrieved = index.search(q_emb, k=k)
+    kb_version = index.version
+    answer_cache = get_answer_cache(collection)
 
     # Filter out weak matches to reduce hallucination pressure on out-of-scope questions.
-    min_score = 0.4
     relevant_chunks = [c for c in retrieved if c["score"] >= min_score]
-    has_relevant = len(relevant_chunks) > 0
+    count("relevant_chunks", len(relevant_chunks))
+
+    result: Dict[str, Any] = {
+        "question": query,
+        "collection": collection,
+        # Return the chunks actually used for the answer for transparency.
+        "retrieved_chunks": relevant_chunks,
+        "cached": False,
+        "path": "generated",
+    }
+
+    if not relevant_chunks:
+        # Nothing to ground an answer in: skip the prompt and the 256-token generation.
+        result.update({"answer": REFUSAL_TEXT, "path": "refused"})
+        return result, None, None
+
+    best = relevant_chunks[0]
+    if extractive and best["score"] >= extractive_score:
+        with stage("extract"):
+            sentence, _ = extract_best_sentence(q_emb, best["text"])
+        result.update({"answer": sentence, "path": "extractive", "retrieved_chunks": [best]})
+        return result, None, None
+
+    chunk_ids = [c["id"] for c in relevant_chunks]
+    # Packing changes the prompt built from the same chunks, so it is part of the key.
+    prompt_variant = context_token_budget
+    with stage("cache_lookup"):
+        answer = answer_cache.lookup(q_emb, chunk_ids, kb_version, prompt_variant) if use_cache else None
+    if answer is not None:
+        result.update({"answer": answer, "path": "cached", "cached": True})
+        return result, None, None
+
+    def store(generated: str) -> None:
+        if use_cache:
+            answer_cache.store(q_emb, chunk_ids, generated, kb_version, prompt_variant)
+
+    if context_token_budget is not None:
+        with stage("pack"):
+            chunk_embs = index.get_embeddings(chunk_ids)
+            context_chunks = pack_context(q_emb, relevant_chunks, chunk_embs, token_budget=context_token_budget)
+        result["retrieved_chunks"] = context_chunks
+    else:
+        context_chunks = relevant_chunks
+
+    with stage("prompt_build"):
+        prompt = build_dnd_rag_prompt(query, context_chunks, has_relevant=True)
+    count("prompt_chars", len(prompt))
+    return result, prompt, store
+
+
+# Sampling settings for RAG answers (lower temp = more stable).
+_RAG_GENERATION_KWARGS: Dict[str, Any] = {
+    "max_new_tokens": 256,
+    "temperature": 0.4,
+    "top_p": 0.9,
+    "do_sample": True,
+}
+
 
-    prompt = build_dnd_rag_prompt(query, relevant_chunks, has_relevant)
+def rag_dnd_answer(
+    query: str,
+    k: int = 2,
+    use_cache: bool = True,
+    collection: str = DEFAULT_COLLECTION,
+    generate_fn: Optional[Callable[..., str]] = None,
+    min_score: float = DEFAULT_MIN_SCORE,
+    extractive: bool = False,
+    extractive_score: float = DEFAULT_EXTRACTIVE_SCORE,
+    context_token_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    High-level RAG call:
+    - embed the question and retrieve top-k chunks
+    - gate on retrieval confidence: refuse instantly if nothing clears
+      `min_score`; with `extractive=True`, return the best-matching rule
+      sentence directly once the top chunk reaches `extractive_score`
+    - reuse a cached answer for a near-duplicate question over the same chunks
+    - otherwise pack the context (MMR + dedup + sentence trimming within
+      `context_token_budget`; opt-in, None sends the chunks as retrieved), build the
+      prompt and call TinyLlama via generate_text()
+    - return both answer and retrieval metadata (for debugging / UI)
+
+    `path` in the result says which of "refused", "extractive", "cached" or
+    "generated" produced the answer.
 
-    answer = generate_text(
-        prompt=prompt,
-        max_new_tokens=256,
-        temperature=0.4,   # lower temp = more stable
-        top_p=0.9,
-        do_sample=True,
+    `generate_fn` replaces TinyLlama (same keyword arguments as generate_text),
+    e.g. with a stub for offline benchmarks.
+    """
+    result, prompt, store = _route_question(
+        query, k, use_cache, collection, min_score, extractive, extractive_score, context_token_budget
     )
+    if prompt is None:
+        return result
 
-    return {
-        "question": query,
-        "answer": answer,
-        # Return the chunks actually used in the prompt for transparency.
-        "retrieved_chunks": relevant_chunks if has_relevant else [],
+    answer = (generate_fn or _generate_text)(prompt=prompt, **_RAG_GENERATION_KWARGS)
+    assert store is not None
+    store(answer)
+
+    result["answer"] = answer
+    return result
+
+
+def _generate_text_stream(**kwargs: Any) -> Iterator[str]:
+    from llm_model import generate_text_stream
+
+    return generate_text_stream(**kwargs)
+
+
+def rag_dnd_answer_stream(
+    query: str,
+    k: int = 2,
+    use_cache: bool = True,
+    collection: str = DEFAULT_COLLECTION,
+    stream_fn: Optional[Callable[..., Iterable[str]]] = None,
+    min_score: float = DEFAULT_MIN_SCORE,
+    extractive: bool = False,
+    extractive_score: float = DEFAULT_EXTRACTIVE_SCORE,
+    context_token_budget: Optional[int] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of rag_dnd_answer(). Setting `stop_event` (client
+    disconnected) stops LLM generation early. Yields events as dicts:
+    - {"event": "retrieval", "data": {question, collection, path, retrieved_chunks}}
+      as soon as retrieval + gating finish
+    - {"event": "token", "data": {"text": ...}} for each decoded piece
+      (a single event carrying the whole answer on non-generated paths)
+    - {"event": "done", "data": {answer, path, cached, timing}} with timings in ms
+    """
+    start = time.perf_counter()
+    result, prompt, store = _route_question(
+        query, k, use_cache, collection, min_score, extractive, extractive_score, context_token_budget
+    )
+    retrieval_ms = (time.perf_counter() - start) * 1000
+
+    yield {
+        "event": "retrieval",
+        "data": {
+            "question": result["question"],
+            "collection": result["collection"],
+            "path": result["path"],
+            "retrieved_chunks": result["retrieved_chunks"],
+        },
+    }
+
+    first_token_ms: Optional[float] = None
+    if prompt is None:
+        answer = result["answer"]
+        first_token_ms = (time.perf_counter() - start) * 1000
+        yield {"event": "token", "data": {"text": answer}}
+    else:
+        pieces: List[str] = []
+        stream_kwargs: Dict[str, Any] = dict(_RAG_GENERATION_KWARGS)
+        if stop_event is not None:
+            stream_kwargs["stop_event"] = stop_event
+        for piece in (stream_fn or _generate_text_stream)(prompt=prompt, **stream_kwargs):
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - start) * 1000
+            pieces.append(piece)
+            yield {"event": "token", "data": {"text": piece}}
+        answer = "".join(pieces).strip()
+        assert store is not None
+        store(answer)
+
+    yield {
+        "event": "done",
+        "data": {
+            "answer": answer,
+            "path": result["path"],
+            "cached": result["cached"],
+            "timing": {
+                "retrieval_ms": round(retrieval_ms, 2),
+                "first_token_ms": round(first_token_ms, 2) if first_token_ms is not None else None,
+                "total_ms": round((time.perf_counter() - start) * 1000, 2),
+            },
+        },
     }
 
 
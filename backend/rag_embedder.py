@@ -0,0 +1,266 @@
+# backend/rag_embedder.py
+
+from __future__ import annotations
+
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Micro-batching defaults: wait at most this long after the first queued query
+# for others to arrive, and never encode more than this many at once.
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 2.0
+# Intra-op thread budget for the worker process's torch pool.
+DEFAULT_NUM_THREADS = int(os.environ.get("RAG_EMBED_THREADS", "2"))
+
+_STOP = None  # queue sentinel
+
+
+def _collect_batch(
+    requests: "queue.Queue[Any]",
+    max_batch_size: int,
+    max_wait_s: float,
+) -> Tuple[List[Any], bool]:
+    """
+    Block for one request, then gather more until the batch is full or the
+    wait window closes. Returns (batch, stop_requested).
+    """
+    first = requests.get()
+    if first is _STOP:
+        return [], True
+    batch = [first]
+    deadline = time.perf_counter() + max_wait_s
+    while len(batch) < max_batch_size:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        try:
+            item = requests.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is _STOP:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+def _process_main(
+    model_name: str,
+    num_threads: int,
+    requests: "mp.Queue[Any]",
+    responses: "mp.Queue[Any]",
+    max_batch_size: int,
+    max_wait_s: float,
+) -> None:
+    """Embedding process: own torch thread pool, own copy of the model."""
+    os.environ.setdefault("TRANSFORMERS_NO_TF", "1")
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(num_threads)
+    model = SentenceTransformer(model_name)
+    responses.put(("ready", None))
+
+    while True:
+        batch, stop = _collect_batch(requests, max_batch_size, max_wait_s)
+        if batch:
+            ids = [req_id for req_id, _ in batch]
+            try:
+                vectors = model.encode(
+                    [text for _, text in batch],
+                    batch_size=len(batch),
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                )
+                responses.put(("ok", list(zip(ids, vectors))))
+            except Exception as exc:  # noqa: BLE001
+                responses.put(("error", (ids, repr(exc))))
+        if stop:
+            break
+
+
+class EmbeddingWorker:
+    """
+    Serves query embeddings off the request threads.
+
+    Concurrent `encode()` calls are queued and encoded together: the worker
+    takes the first query, waits up to `max_wait_ms` for more, and runs one
+    batched forward pass.
+
+    - backend="process" (default): a separate process with its own model copy
+      and a torch pool of `num_threads`, so generation cannot starve it.
+    - backend="thread": a worker thread sharing the in-process model. Cheap,
+      but torch's intra-op pool is process-wide, so it gets no thread budget
+      of its own and competes with generation for cores.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "process",
+        model: Any = None,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        num_threads: int = DEFAULT_NUM_THREADS,
+    ) -> None:
+        if backend not in {"thread", "process"}:
+            raise ValueError(f"Unknown embedding worker backend: {backend}")
+        if backend == "thread" and model is None:
+            raise ValueError("The thread backend needs a loaded model.")
+        self.model_name = model_name
+        self.backend = backend
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000
+        self.num_threads = num_threads
+
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    # ----- lifecycle -----
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._started:
+                return
+            if self.backend == "thread":
+                self._requests: Any = queue.Queue()
+                self._thread = threading.Thread(target=self._thread_loop, name="embed-worker", daemon=True)
+                self._thread.start()
+            else:
+                ctx = mp.get_context("spawn")
+                self._requests = ctx.Queue()
+                self._responses = ctx.Queue()
+                self._process = ctx.Process(
+                    target=_process_main,
+                    args=(
+                        self.model_name,
+                        self.num_threads,
+                        self._requests,
+                        self._responses,
+                        self.max_batch_size,
+                        self.max_wait_s,
+                    ),
+                    name="embed-worker",
+                    daemon=True,
+                )
+                self._process.start()
+                try:
+                    # Wait until the child has loaded the model.
+                    status, _ = self._responses.get(timeout=600)
+                except queue.Empty:
+                    status = None
+                if status != "ready":
+                    self._process.terminate()
+                    raise RuntimeError("Embedding worker process failed to start.")
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_loop, name="embed-dispatch", daemon=True
+                )
+                self._dispatcher.start()
+            self._started = True
+            atexit.register(self.stop)
+
+    def stop(self) -> None:
+        with self._start_lock:
+            if not self._started:
+                return
+            self._started = False
+            self._requests.put(_STOP)
+            if self.backend == "process":
+                self._process.join(timeout=5)
+                self._responses.put(("stop", None))
+
+    # ----- request side -----
+
+    def _submit(self, text: str) -> Future:
+        req_id = next(self._ids)
+        future: Future = Future()
+        with self._pending_lock:
+            self._pending[req_id] = future
+        self._requests.put((req_id, text))
+        return future
+
+    def encode(self, text: str, timeout: Optional[float] = 30.0) -> np.ndarray:
+        """Embed one query (normalized float32), batched with concurrent callers."""
+        if not self._started:
+            self.start()
+        return self._submit(text).result(timeout=timeout)
+
+    def encode_many(self, texts: List[str], timeout: Optional[float] = 30.0) -> np.ndarray:
+        """Embed several texts (e.g. a chunk's sentences) through the same batched queue."""
+        if not self._started:
+            self.start()
+        futures = [self._submit(text) for text in texts]
+        return np.stack([future.result(timeout=timeout) for future in futures])
+
+    def _resolve(self, results: List[Tuple[int, np.ndarray]]) -> None:
+        with self._pending_lock:
+            futures = [(self._pending.pop(req_id, None), vec) for req_id, vec in results]
+        self.batches += 1
+        self.items += len(results)
+        for future, vec in futures:
+            if future is not None:
+                future.set_result(np.asarray(vec, dtype=np.float32))
+
+    def _fail(self, ids: List[int], exc: BaseException) -> None:
+        with self._pending_lock:
+            futures = [self._pending.pop(req_id, None) for req_id in ids]
+        for future in futures:
+            if future is not None:
+                future.set_exception(exc)
+
+    # ----- worker side -----
+
+    def _thread_loop(self) -> None:
+        while True:
+            batch, stop = _collect_batch(self._requests, self.max_batch_size, self.max_wait_s)
+            if batch:
+                ids = [req_id for req_id, _ in batch]
+                try:
+                    vectors = self.model.encode(
+                        [text for _, text in batch],
+                        batch_size=len(batch),
+                        convert_to_numpy=True,
+                        normalize_embeddings=True,
+                    )
+                    self._resolve(list(zip(ids, vectors)))
+                except Exception as exc:  # noqa: BLE001
+                    self._fail(ids, exc)
+            if stop:
+                break
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            status, payload = self._responses.get()
+            if status == "ok":
+                self._resolve(payload)
+            elif status == "error":
+                ids, message = payload
+                self._fail(ids, RuntimeError(f"Embedding worker error: {message}"))
+            elif status == "stop":
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "batches": self.batches,
+            "queries": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_s * 1000,
+            "num_threads": self.num_threads if self.backend == "process" else None,
+        }
@@ -0,0 +1,237 @@
+# backend/rag_load_test.py
+"""
+End-to-end load test for the full rag_dnd_answer pipeline.
+
+Replays a question set at a fixed concurrency and reports throughput,
+refusal rate, latency percentiles and peak memory.
+
+Run (from backend/):
+    python rag_load_test.py --concurrency 8 --requests 400            # fast stub LLM
+    python rag_load_test.py --llm tinyllama --concurrency 2 --requests 20
+    python rag_load_test.py --questions my_questions.txt --duration 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from rag_benchmark import LABELED_QUESTIONS, stub_generate
+from rag_dnd import BACKEND_DIR, DEFAULT_COLLECTION, REFUSAL_TEXT, rag_dnd_answer
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "outputs", "rag_load_test")
+
+
+def load_questions(path: Optional[str]) -> List[str]:
+    """
+    Questions from a .txt (one per line), .jsonl (`question` field) or .json
+    list; defaults to the labeled benchmark questions.
+    """
+    if not path:
+        return [item["question"] for item in LABELED_QUESTIONS]
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["question"] for line in f if line.strip()]
+        if path.endswith(".json"):
+            data = json.load(f)
+            return [item["question"] if isinstance(item, dict) else str(item) for item in data]
+        return [line.strip() for line in f if line.strip()]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _make_stub(latency_ms: float) -> Callable[..., str]:
+    if latency_ms <= 0:
+        return stub_generate
+
+    def _slow_stub(prompt: str, **kwargs: Any) -> str:
+        time.sleep(latency_ms / 1000)
+        return stub_generate(prompt, **kwargs)
+
+    return _slow_stub
+
+
+def run_load_test(
+    questions: Sequence[str],
+    concurrency: int = 4,
+    total_requests: Optional[int] = None,
+    duration_s: Optional[float] = None,
+    generate_fn: Optional[Callable[..., str]] = stub_generate,
+    collection: str = DEFAULT_COLLECTION,
+    k: int = 3,
+    use_cache: bool = False,
+    warmup: int = 2,
+) -> Dict[str, Any]:
+    """
+    Replay `questions` round-robin from `concurrency` client threads until
+    `total_requests` are done or `duration_s` elapses (whichever is set).
+    """
+    if not questions:
+        raise ValueError("The question set is empty; nothing to replay.")
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}.")
+    if total_requests is None and duration_s is None:
+        total_requests = len(questions)
+
+    def _ask(question: str) -> Dict[str, Any]:
+        return rag_dnd_answer(
+            question,
+            k=k,
+            use_cache=use_cache,
+            collection=collection,
+            generate_fn=generate_fn,
+        )
+
+    # Load the embedder, index (and TinyLlama) before the clock starts.
+    for question in list(questions)[:warmup]:
+        _ask(question)
+
+    baseline_rss_mb = _peak_rss_mb()
+    next_index = 0
+    index_lock = threading.Lock()
+    latencies: List[float] = []
+    paths: Counter = Counter()
+    errors: List[str] = []
+    refusals = 0
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + duration_s if duration_s else None
+
+    def _claim() -> Optional[str]:
+        nonlocal next_index
+        with index_lock:
+            if total_requests is not None and next_index >= total_requests:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            question = questions[next_index % len(questions)]
+            next_index += 1
+            return question
+
+    def _client() -> None:
+        nonlocal refusals
+        while True:
+            question = _claim()
+            if question is None:
+                return
+            start = time.perf_counter()
+            try:
+                result = _ask(question)
+            except Exception as exc:  # noqa: BLE001
+                with results_lock:
+                    errors.append(repr(exc))
+                continue
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                latencies.append(elapsed)
+                paths[result.get("path", "generated")] += 1
+                if result["answer"].strip() == REFUSAL_TEXT:
+                    refusals += 1
+
+    started = time.perf_counter()
+    client_failures: List[str] = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(_client) for _ in range(concurrency)]
+    for future in futures:
+        # A client thread that died stops sending load; surface it in the report.
+        try:
+            future.result()
+        except Exception as exc:  # noqa: BLE001
+            client_failures.append(repr(exc))
+    wall_s = time.perf_counter() - started
+
+    ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    answered = len(latencies)
+    return {
+        "llm": "stub" if generate_fn is not None else "tinyllama",
+        "collection": collection,
+        "k": k,
+        "concurrency": concurrency,
+        "use_cache": use_cache,
+        "requests": answered + len(errors),
+        "answered": answered,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "client_failures": len(client_failures),
+        "client_failure_samples": client_failures[:5],
+        "wall_seconds": wall_s,
+        "answers_per_sec": answered / wall_s if wall_s > 0 else 0.0,
+        "refusal_rate": refusals / answered if answered else 0.0,
+        "paths": dict(paths),
+        "latency_ms": {
+            "p50": float(np.percentile(ms, 50)),
+            "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99)),
+            "mean": float(ms.mean()),
+            "max": float(ms.max()),
+        },
+        "peak_rss_mb": _peak_rss_mb(),
+        "peak_rss_mb_before_load": baseline_rss_mb,
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline load test for the D&D rules RAG pipeline.")
+    parser.add_argument("--questions", default=None, help=".txt / .jsonl / .json question set (default: benchmark set).")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=None, help="Total requests to send.")
+    parser.add_argument("--duration", type=float, default=None, help="Run for this many seconds instead.")
+    parser.add_argument("--llm", choices=["stub", "tinyllama"], default="stub")
+    parser.add_argument(
+        "--stub-latency-ms",
+        type=float,
+        default=0.0,
+        help="Simulated generation time for the stub LLM (to model serving overhead under load).",
+    )
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--cache", action="store_true", help="Enable the semantic answer cache.")
+    parser.add_argument("--output", default=None, help="Path for the JSON report (default: outputs/rag_load_test/).")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(
+        load_questions(args.questions),
+        concurrency=args.concurrency,
+        total_requests=args.requests,
+        duration_s=args.duration,
+        generate_fn=_make_stub(args.stub_latency_ms) if args.llm == "stub" else None,
+        collection=args.collection,
+        k=args.k,
+        use_cache=args.cache,
+    )
+    report["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"run-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    lat = report["latency_ms"]
+    print(
+        f"{report['answered']} answers in {report['wall_seconds']:.1f}s "
+        f"({report['answers_per_sec']:.2f}/s, concurrency {report['concurrency']}, llm {report['llm']})"
+    )
+    print(
+        f"refusal rate {report['refusal_rate']:.1%}  errors {report['errors']}  "
+        f"client failures {report['client_failures']}  paths {report['paths']}"
+    )
+    print(f"latency p50 {lat['p50']:.1f} ms  p95 {lat['p95']:.1f} ms  p99 {lat['p99']:.1f} ms")
+    print(f"peak RSS {report['peak_rss_mb']:.0f} MB")
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
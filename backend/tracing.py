@@ -0,0 +1,156 @@
+# backend/tracing.py
+
+from __future__ import annotations
+
+import bisect
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Fraction of requests traced (and fed into the stage histograms) even
+# without the debug header. 0 = only trace on request.
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+
+# Histogram bucket upper bounds in milliseconds (last bucket is +inf).
+LATENCY_BUCKETS_MS: List[float] = [
+    1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000,
+]
+
+
+class Trace:
+    """
+    Per-request record of stage timings (ms) and counters such as token counts.
+    A stage that runs more than once accumulates.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+
+    def add_count(self, name: str, value: int) -> None:
+        self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stages_ms": {name: round(ms, 3) for name, ms in self.stages.items()},
+            "counts": dict(self.counts),
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+class _NullStage:
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: Trace, name: str) -> None:
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.trace.add_time(self.name, time.perf_counter() - self.start)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def stage(name: str):
+    """
+    Time a block as `name` on the active trace. With no active trace this
+    returns a shared no-op context manager (one ContextVar read).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_STAGE
+    return _Stage(trace, name)
+
+
+def count(name: str, value: int) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_count(name, value)
+
+
+def should_trace(requested: bool) -> bool:
+    return requested or (TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE)
+
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace() -> None:
+    _current_trace.set(None)
+
+
+class LatencyHistograms:
+    """
+    Fixed-bucket latency histograms keyed by (endpoint, stage).
+    Stage "total" holds whole-request latency for every request; other stages
+    come from traced requests.
+    """
+
+    def __init__(self, buckets_ms: List[float] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets_ms = list(buckets_ms)
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def observe(self, endpoint: str, stage_name: str, ms: float) -> None:
+        idx = bisect.bisect_left(self.buckets_ms, ms)
+        with self._lock:
+            hist = self._data.setdefault(endpoint, {}).get(stage_name)
+            if hist is None:
+                hist = {"counts": [0] * (len(self.buckets_ms) + 1), "count": 0, "sum_ms": 0.0}
+                self._data[endpoint][stage_name] = hist
+            hist["counts"][idx] += 1
+            hist["count"] += 1
+            hist["sum_ms"] += ms
+
+    def observe_trace(self, endpoint: str, trace: Trace) -> None:
+        for stage_name, ms in trace.stages.items():
+            self.observe(endpoint, stage_name, ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "buckets_ms": self.buckets_ms + ["+Inf"],
+                "endpoints": {
+                    endpoint: {
+                        stage_name: {
+                            "count": hist["count"],
+                            "mean_ms": hist["sum_ms"] / hist["count"] if hist["count"] else 0.0,
+                            "counts": list(hist["counts"]),
+                        }
+                        for stage_name, hist in stages.items()
+                    }
+                    for endpoint, stages in self._data.items()
+                },
+            }
+
+
+latency_histograms = LatencyHistograms()
@@ -0,0 +1,301 @@
+# backend/training_jobs.py
+
+from __future__ import annotations
+
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Training runs in its own process, so more than one job at a time multiplies
+# RAM (a roberta-base copy each) and fights the API for cores.
+MAX_CONCURRENT_JOBS = int(os.environ.get("ASSIGNMENT7_MAX_TRAIN_JOBS", "1"))
+# Finished jobs kept in memory for status/events lookups.
+MAX_FINISHED_JOBS = 20
+JOBS_DIR = Path(__file__).resolve().parent / "outputs" / "assignment7_roberta" / "jobs"
+# Cancel is cooperative (checked every optimizer step); the worker is only
+# terminated if it has not stopped after this many seconds.
+CANCEL_GRACE_S = float(os.environ.get("ASSIGNMENT7_CANCEL_GRACE_S", "30"))
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class TrainingJobLimitError(RuntimeError):
+    """Raised when the concurrent training job cap is reached."""
+
+
+@dataclass
+class TrainingJob:
+    id: str
+    params: Dict[str, Any]
+    output_dir: Path
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Dict[str, Any] = field(default_factory=dict)
+    eval_history: List[Dict[str, Any]] = field(default_factory=list)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    process: Any = None
+    # Per-job channel and cancel flag: a terminated worker can only break its own queue.
+    events_queue: Any = None
+    cancel_event: Any = None
+    exit_seen: bool = False
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": dict(self.progress),
+            "eval_history": list(self.eval_history),
+            "error": self.error,
+            "result": self.result,
+        }
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _job_main(
+    job_id: str, params: Dict[str, Any], output_dir: str, events: "mp.Queue[Any]", cancel_event: Any
+) -> None:
+    """Training process: builds its own pipeline and reports Trainer callbacks to the parent."""
+    os.environ.setdefault("TRANSFORMERS_NO_TF", "1")
+    from transformers import TrainerCallback
+
+    from assignment7_roberta import RobertaLoraPipeline
+
+    class _ProgressCallback(TrainerCallback):
+        def on_step_end(self, args, state, control, **kwargs):
+            if cancel_event.is_set():
+                raise _Cancelled()
+
+        def on_train_begin(self, args, state, control, **kwargs):
+            events.put((job_id, "progress", {"step": 0, "max_steps": state.max_steps, "epoch": 0.0}))
+
+        def on_log(self, args, state, control, logs=None, **kwargs):
+            logs = logs or {}
+            position = {"step": state.global_step, "max_steps": state.max_steps, "epoch": state.epoch}
+            metrics = {key: value for key, value in logs.items() if key.startswith("eval_")}
+            if metrics:
+                events.put((job_id, "eval", {**position, "metrics": metrics}))
+            elif "loss" in logs:
+                events.put(
+                    (job_id, "progress", {**position, "loss": logs["loss"], "learning_rate": logs.get("learning_rate")})
+                )
+
+    try:
+        pipeline = RobertaLoraPipeline(merge_for_inference=False)
+        result = pipeline.train(**params, output_dir=Path(output_dir), callbacks=[_ProgressCallback()])
+        adapter_dir = Path(output_dir) / "adapter"
+        pipeline.save_adapter(adapter_dir)
+        result["adapter_dir"] = str(adapter_dir)
+        events.put((job_id, "done", result))
+    except _Cancelled:
+        events.put((job_id, "cancelled", {}))
+    except Exception as exc:  # noqa: BLE001
+        events.put((job_id, "error", {"detail": repr(exc)}))
+
+
+class TrainingJobManager:
+    """
+    Runs Assignment 7 training jobs in worker processes.
+
+    `submit` returns immediately; a reader thread per job folds the worker's
+    progress, eval and completion messages (sent on that job's own queue) into
+    the job's event log, which `wait_events` lets callers (status polling, SSE)
+    follow. `on_success(job, result)` runs in the API process once the worker
+    has saved its adapter.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_JOBS,
+        jobs_dir: Path = JOBS_DIR,
+        on_success: Optional[Callable[[TrainingJob, Dict[str, Any]], None]] = None,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.jobs_dir = jobs_dir
+        self.on_success = on_success
+        self._jobs: Dict[str, TrainingJob] = {}
+        self._cond = threading.Condition()
+        self._ctx = mp.get_context("spawn")
+
+    # ----- submission / control -----
+
+    def submit(self, params: Dict[str, Any]) -> TrainingJob:
+        with self._cond:
+            running = sum(1 for job in self._jobs.values() if not job.done)
+            if running >= self.max_concurrent:
+                raise TrainingJobLimitError(
+                    f"{running} training job(s) already running (limit {self.max_concurrent})."
+                )
+            job_id = uuid.uuid4().hex[:12]
+            job = TrainingJob(id=job_id, params=dict(params), output_dir=self.jobs_dir / job_id)
+            job.output_dir.mkdir(parents=True, exist_ok=True)
+            job.events_queue = self._ctx.Queue()
+            job.cancel_event = self._ctx.Event()
+            job.process = self._ctx.Process(
+                target=_job_main,
+                args=(job_id, job.params, str(job.output_dir), job.events_queue, job.cancel_event),
+                name=f"train-{job_id}",
+                daemon=True,
+            )
+            self._jobs[job_id] = job
+            self._prune()
+            job.process.start()
+            job.started_at = time.time()
+            job.status = "running"
+            self._emit(job, "status", {"status": "running"})
+            threading.Thread(target=self._read_loop, args=(job,), name=f"train-{job_id}-reader", daemon=True).start()
+            return job
+
+    def cancel(self, job_id: str) -> TrainingJob:
+        """
+        Ask the worker to stop at its next step; it is terminated only if it
+        is still alive after CANCEL_GRACE_S. Returns without waiting.
+        """
+        job = self.get(job_id)
+        with self._cond:
+            if job.done or job.status == "cancelling":
+                return job
+            job.status = "cancelling"
+            self._emit(job, "status", {"status": "cancelling"})
+        job.cancel_event.set()
+        threading.Thread(target=self._enforce_cancel, args=(job,), name=f"train-{job.id}-cancel", daemon=True).start()
+        return job
+
+    def _enforce_cancel(self, job: TrainingJob) -> None:
+        job.process.join(timeout=CANCEL_GRACE_S)
+        if job.process.is_alive():
+            logger.warning("Training job %s ignored cancel for %.0fs; terminating it.", job.id, CANCEL_GRACE_S)
+            job.process.terminate()
+            job.process.join(timeout=10)
+        with self._cond:
+            if not job.done:
+                self._finish(job, "cancelled")
+
+    def get(self, job_id: str) -> TrainingJob:
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            jobs = sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+            return [{key: value for key, value in job.summary().items() if key != "result"} for job in jobs]
+
+    def wait_events(self, job_id: str, since: int, timeout: float = 15.0) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Events after index `since`, blocking up to `timeout` for new ones.
+        Returns (events, job_done).
+        """
+        job = self.get(job_id)
+        with self._cond:
+            self._cond.wait_for(lambda: len(job.events) > since or job.done, timeout=timeout)
+            return job.events[since:], job.done
+
+    # ----- worker side -----
+
+    def _read_loop(self, job: TrainingJob) -> None:
+        while not job.done:
+            try:
+                self._read_once(job)
+            except Exception:  # noqa: BLE001
+                # A bad message must not stop the reader; _reap still ends the job
+                # if the worker is gone.
+                logger.exception("Error reading events of training job %s", job.id)
+                self._reap(job)
+                time.sleep(0.5)
+        job.events_queue.close()
+
+    def _read_once(self, job: TrainingJob) -> None:
+        try:
+            _, kind, payload = job.events_queue.get(timeout=1.0)
+        except queue.Empty:
+            self._reap(job)
+            return
+        with self._cond:
+            if job.done:
+                return
+            if kind == "progress":
+                job.progress.update(payload)
+                self._emit(job, kind, payload)
+            elif kind == "eval":
+                job.eval_history.append(payload)
+                self._emit(job, kind, payload)
+            elif kind == "error":
+                job.error = payload["detail"]
+                self._finish(job, "failed")
+            elif kind == "cancelled":
+                self._finish(job, "cancelled")
+        if kind == "done":
+            self._complete(job, payload)
+
+    def _complete(self, job: TrainingJob, result: Dict[str, Any]) -> None:
+        if job.done:
+            return
+        error = None
+        if self.on_success is not None:
+            try:
+                self.on_success(job, result)
+            except Exception as exc:  # noqa: BLE001
+                error = f"Training finished but loading the adapter failed: {exc!r}"
+        with self._cond:
+            job.result = result
+            job.error = error
+            self._finish(job, "failed" if error else "succeeded")
+
+    def _reap(self, job: TrainingJob) -> None:
+        """Fail a job whose worker exited without reporting (e.g. killed for OOM)."""
+        with self._cond:
+            if not job.done and job.process is not None and job.process.exitcode is not None:
+                # Give a final message already in flight one more poll to arrive.
+                if not job.exit_seen:
+                    job.exit_seen = True
+                elif job.status == "cancelling":
+                    self._finish(job, "cancelled")
+                else:
+                    job.error = f"Training process exited with code {job.process.exitcode}."
+                    self._finish(job, "failed")
+
+    def _emit(self, job: TrainingJob, kind: str, data: Dict[str, Any]) -> None:
+        # Caller holds self._cond.
+        job.events.append({"event": kind, "data": data})
+        self._cond.notify_all()
+
+    def _finish(self, job: TrainingJob, status: str) -> None:
+        # Caller holds self._cond.
+        job.status = status
+        job.finished_at = time.time()
+        data: Dict[str, Any] = {"status": status, "error": job.error}
+        if status == "succeeded":
+            data["result"] = job.result
+        self._emit(job, "done", data)
+
+    def _prune(self) -> None:
+        finished = sorted(
+            (job for job in self._jobs.values() if job.done), key=lambda job: job.finished_at or 0.0
+        )
+        for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
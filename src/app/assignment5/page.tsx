@@ -15,6 +15,24 @@ interface RagResponse {
   retrieved_chunks: RetrievedChunk[];
 }
 
+type RagStreamEvent =
+  | { event: "retrieval"; data: { question: string; retrieved_chunks: RetrievedChunk[] } }
+  | { event: "token"; data: { text: string } }
+  | { event: "done"; data: { answer: string } }
+  | { event: "error"; data: { detail: string } };
+
+// Parse one Server-Sent Events block ("event: x\ndata: {...}").
+const parseSseBlock = (block: string): RagStreamEvent | null => {
+  let event = "";
+  let data = "";
+  for (const line of block.split("\n")) {
+    if (line.startsWith("event:")) event = line.slice(6).trim();
+    else if (line.startsWith("data:")) data += line.slice(5).trim();
+  }
+  if (!event || !data) return null;
+  return { event, data: JSON.parse(data) } as RagStreamEvent;
+};
+
 interface TestCase {
   id: string;
   title: string;
@@ -73,6 +91,61 @@ export default function Assignment5() {
     return response.json();
   };
 
+  // Streams sources first, then answer tokens, updating the result as they arrive.
+  const streamRag = async (
+    q: string,
+    onUpdate: (partial: RagResponse) => void
+  ): Promise<void> => {
+    const response = await fetch(
+      "http://localhost:8000/api/assignment5/rag-dnd/stream",
+      {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ question: q }),
+      }
+    );
+
+    if (!response.ok || !response.body) {
+      throw new Error(`Request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let partial: RagResponse = { question: q, answer: "", retrieved_chunks: [] };
+    let finished = false;
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let sep = buffer.indexOf("\n\n");
+      while (sep !== -1) {
+        const evt = parseSseBlock(buffer.slice(0, sep));
+        buffer = buffer.slice(sep + 2);
+        sep = buffer.indexOf("\n\n");
+        if (!evt) continue;
+
+        if (evt.event === "retrieval") {
+          partial = { ...partial, retrieved_chunks: evt.data.retrieved_chunks };
+        } else if (evt.event === "token") {
+          partial = { ...partial, answer: partial.answer + evt.data.text };
+        } else if (evt.event === "done") {
+          partial = { ...partial, answer: evt.data.answer };
+          finished = true;
+        } else if (evt.event === "error") {
+          throw new Error(evt.data.detail || "Generation failed.");
+        }
+        onUpdate(partial);
+      }
+    }
+
+    if (!finished) {
+      throw new Error("The answer stream ended before the answer was complete.");
+    }
+  };
+
   const handleAsk = async (e: FormEvent) => {
     e.preventDefault();
     if (!question.trim()) {
@@ -83,9 +156,10 @@ export default function Assignment5() {
     setLoading(true);
     setResult(null);
     try {
-      const data = await queryRag(question);
-      setResult(data);
+      await streamRag(question, setResult);
     } catch (err) {
+      // Don't leave a partial answer on screen looking complete.
+      setResult(null);
       setError(
         err instanceof Error ? err.message : "Failed to contact the backend."
       );
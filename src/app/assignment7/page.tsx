@@ -54,6 +54,32 @@ interface TestCaseResult extends Prediction {
   case_text: string;
 }
 
+interface TrainProgress {
+  step: number;
+  max_steps: number;
+  epoch: number;
+  loss?: number;
+  metrics?: Record<string, number>;
+}
+
+const API_BASE = "http://localhost:8000";
+
+type TrainStreamEvent =
+  | { event: "status"; data: { status: string } }
+  | { event: "progress" | "eval"; data: TrainProgress }
+  | { event: "done"; data: { status: string; error?: string | null; result?: TrainResponse } };
+
+const parseSseBlock = (block: string): TrainStreamEvent | null => {
+  let event = "message";
+  const dataLines: string[] = [];
+  for (const line of block.split("\n")) {
+    if (line.startsWith("event:")) event = line.slice(6).trim();
+    else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
+  }
+  if (dataLines.length === 0) return null;
+  return { event, data: JSON.parse(dataLines.join("\n")) } as TrainStreamEvent;
+};
+
 const checklist = [
   "Load news statements and tokenize with the RoBERTa tokenizer.",
   "Stratified train/validation/test split with balanced factual vs opinion labels.",
@@ -84,6 +110,8 @@ export default function Assignment7() {
   const [trainResult, setTrainResult] = useState<TrainResponse | null>(null);
   const [trainError, setTrainError] = useState<string | null>(null);
   const [training, setTraining] = useState(false);
+  const [trainJobId, setTrainJobId] = useState<string | null>(null);
+  const [trainProgress, setTrainProgress] = useState<TrainProgress | null>(null);
 
   const [textToClassify, setTextToClassify] = useState(
     "Analysts expect the rate hike to slow hiring through early 2025."
@@ -112,8 +140,9 @@ export default function Assignment7() {
     setTraining(true);
     setTrainError(null);
     setTrainResult(null);
+    setTrainProgress(null);
     try {
-      const response = await fetch("http://localhost:8000/api/assignment7/train", {
+      const response = await fetch(`${API_BASE}/api/assignment7/train`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -138,15 +167,56 @@ export default function Assignment7() {
         throw new Error(detail || `Training failed with status ${response.status}`);
       }
 
-      const data = (await response.json()) as TrainResponse;
-      setTrainResult(data);
+      // Training runs as a background job; follow its progress stream until done.
+      const job = (await response.json()) as { job_id: string; events_url: string };
+      setTrainJobId(job.job_id);
+      const stream = await fetch(`${API_BASE}${job.events_url}`);
+      if (!stream.ok || !stream.body) {
+        throw new Error(`Progress stream failed with status ${stream.status}`);
+      }
+
+      const reader = stream.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let sep = buffer.indexOf("\n\n");
+        while (sep !== -1) {
+          const evt = parseSseBlock(buffer.slice(0, sep));
+          buffer = buffer.slice(sep + 2);
+          sep = buffer.indexOf("\n\n");
+          if (!evt) continue;
+
+          if (evt.event === "progress" || evt.event === "eval") {
+            const update = evt.data;
+            setTrainProgress((prev) => ({ ...prev, ...update }));
+          } else if (evt.event === "done") {
+            if (evt.data.status === "succeeded") {
+              setTrainResult(evt.data.result as TrainResponse);
+            } else if (evt.data.status === "cancelled") {
+              setTrainError("Training cancelled.");
+            } else {
+              setTrainError(evt.data.error || "Training failed.");
+            }
+          }
+        }
+      }
     } catch (err) {
       setTrainError(err instanceof Error ? err.message : "Unexpected error during training.");
     } finally {
       setTraining(false);
+      setTrainJobId(null);
     }
   };
 
+  const handleCancelTrain = async () => {
+    if (!trainJobId) return;
+    await fetch(`${API_BASE}/api/assignment7/train/${trainJobId}/cancel`, { method: "POST" });
+  };
+
   const handlePredict = async () => {
     setPredicting(true);
     setPredictError(null);
@@ -292,15 +362,35 @@ export default function Assignment7() {
                     Configure a dataset and LoRA hyperparameters, then run a short training loop.
                   </p>
                 </div>
-                <button
-                  onClick={handleTrain}
-                  disabled={training}
-                  className="inline-flex items-center bg-indigo-600 hover:bg-indigo-700 text-white px-4 py-2 rounded-lg font-semibold disabled:opacity-60"
-                >
-                  {training ? "Training..." : "Run Training"}
-                </button>
+                <div className="flex items-center gap-2">
+                  {training && trainJobId && (
+                    <button
+                      onClick={handleCancelTrain}
+                      className="inline-flex items-center border border-gray-300 dark:border-gray-700 text-gray-700 dark:text-gray-200 px-4 py-2 rounded-lg font-semibold"
+                    >
+                      Cancel
+                    </button>
+                  )}
+                  <button
+                    onClick={handleTrain}
+                    disabled={training}
+                    className="inline-flex items-center bg-indigo-600 hover:bg-indigo-700 text-white px-4 py-2 rounded-lg font-semibold disabled:opacity-60"
+                  >
+                    {training ? "Training..." : "Run Training"}
+                  </button>
+                </div>
               </div>
 
+              {training && trainProgress && (
+                <div className="bg-indigo-50 dark:bg-indigo-900/30 text-indigo-900 dark:text-indigo-100 rounded-lg px-4 py-3 text-sm">
+                  Step {trainProgress.step} / {trainProgress.max_steps}
+                  {trainProgress.epoch != null && ` · epoch ${trainProgress.epoch.toFixed(2)}`}
+                  {trainProgress.loss != null && ` · loss ${trainProgress.loss.toFixed(4)}`}
+                  {trainProgress.metrics?.eval_f1 != null &&
+                    ` · eval F1 ${trainProgress.metrics.eval_f1.toFixed(3)}`}
+                </div>
+              )}
+
               <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
                 <div>
                   <label className="text-sm font-medium text-gray-700 dark:text-gray-300">HF Dataset (optional)</label>
@@ -311,7 +401,7 @@ export default function Assignment7() {
                     placeholder="e.g. SetFit/subj"
                     className="mt-1 w-full rounded-lg border border-gray-300 dark:border-gray-700 bg-white dark:bg-gray-800 px-3 py-2 text-sm text-gray-900 dark:text-white"
                   />
-                  <p className="text-xs text-gray-500 mt-1">Defaults to the HF hub dataset SetFit/subj.</p>
+                  <p className="text-xs text-gray-500 mt-1">Defaults to SetFit/subj (local copy; hub only if enabled on the server).</p>
                 </div>
                 <div>
                   <label className="text-sm font-medium text-gray-700 dark:text-gray-300">Max Samples</label>